@@ -38,6 +38,8 @@ class Settings(BaseSettings):
     
     # 阿里云DashScope配置
     DASHSCOPE_API_KEY: Optional[str] = None
+    # 图像上传方式: "base64" 内联为data URI; "binary" 以file://本地路径交给SDK直接上传原始字节
+    DASHSCOPE_IMAGE_UPLOAD_MODE: str = "base64"
     
     # 安全配置
     SECRET_KEY: str = "your-secret-key-for-jwt-token"  # 生产环境必须修改
@@ -70,6 +72,10 @@ class Settings(BaseSettings):
     # Qdrant配置 (可选)
     QDRANT_URL: Optional[str] = None
     QDRANT_API_KEY: Optional[str] = None
+    QDRANT_GRPC_PORT: int = 6334  # 异步客户端使用的gRPC端口
+    QDRANT_PREFER_GRPC: bool = False  # 异步客户端改用gRPC传输向量（需开放gRPC端口，默认关闭，使用HTTP）
+    QDRANT_SCALAR_QUANTIZATION: bool = True  # 集合启用int8标量量化（搜索时用原始向量重打分）
+    QDRANT_UPSERT_BATCH_SIZE: int = 32  # 批量入库时单次upsert写入的最大点数
     
     # 搜索配置
     # 文本搜索时的两路召回阈值
@@ -4,9 +4,12 @@ Qdrant向量数据库管理器
 """
 
 import asyncio
+import hashlib
+import heapq
 import logging
-from typing import Dict, List, Optional, Any
-from qdrant_client import QdrantClient
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Tuple
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
 from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchText
 import httpx
@@ -15,6 +18,38 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Qdrant默认的indexing_threshold（KB），暂停索引前集合未显式设置阈值时按此恢复
+DEFAULT_INDEXING_THRESHOLD = 20000
+
+
+@lru_cache(maxsize=8192)
+def media_id_to_point_id(media_id: str):
+    """
+    将媒体ID转换为Qdrant点ID（结果缓存，重复编辑同一媒体时无需重新计算）
+    
+    Args:
+        media_id: 媒体文件ID
+        
+    Returns:
+        非数字字符串ID转换为整数，其余原样返回
+    """
+    if isinstance(media_id, str) and not media_id.isdigit():
+        # 使用MD5哈希的前7位（28位整数），确保在安全范围内
+        # 注意：点ID已持久化在集合中，不能更换哈希算法
+        return int(hashlib.md5(media_id.encode()).hexdigest()[:7], 16)
+    return media_id
+
+
+def _as_float_list(vector) -> List[float]:
+    """将numpy数组转换为列表（当前qdrant-client的PointStruct只接受列表），列表原样返回"""
+    return vector.tolist() if hasattr(vector, 'tolist') else vector
+
+
+async def _no_results() -> List[Dict[str, Any]]:
+    """占位协程，用于asyncio.gather中未提供向量的检索分支"""
+    return []
+
+
 class QdrantManager:
     """Qdrant向量数据库管理器"""
     
@@ -28,6 +63,14 @@ class QdrantManager:
             api_key: API密钥（可选）
         """
         self.client = QdrantClient(host=host, port=port, api_key=api_key)
+        # 异步客户端（配置开启时使用gRPC，默认HTTP），供任务处理器等异步路径使用，避免阻塞事件循环
+        self.async_client = AsyncQdrantClient(
+            host=host,
+            port=port,
+            grpc_port=settings.QDRANT_GRPC_PORT,
+            prefer_grpc=settings.QDRANT_PREFER_GRPC,
+            api_key=api_key
+        )
         self.collection_name = "media_embeddings"
         self.text_vector_name = "text_embedding"
         self.image_vector_name = "image_embedding"
@@ -35,6 +78,28 @@ class QdrantManager:
         # 向量维度（基于阿里云模型）
         self.vector_dimension = 1024
         
+        # 按字符串查找媒体时精确匹配的payload字段（均建立keyword索引）
+        self.lookup_payload_fields = ("global_media_id", "file_id", "file_name")
+        
+        # 集合是否使用命名向量（首次使用时查询集合配置并缓存）
+        self._named_vectors: Optional[bool] = None
+        
+        # int8标量量化：量化向量常驻内存用于候选检索，原始向量存放磁盘仅用于重打分
+        if settings.QDRANT_SCALAR_QUANTIZATION:
+            self.quantization_config = models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=True
+                )
+            )
+            self.search_params = models.SearchParams(
+                quantization=models.QuantizationSearchParams(rescore=True)
+            )
+        else:
+            self.quantization_config = None
+            self.search_params = None
+        
         logger.info(f"Qdrant管理器初始化成功: {host}:{port}")
     
     async def ensure_collection_exists(self) -> bool:
@@ -51,30 +116,154 @@ class QdrantManager:
             
             if self.collection_name in collection_names:
                 logger.info(f"集合 {self.collection_name} 已存在")
+                self._ensure_quantization()
+                self._ensure_payload_indexes()
                 return True
             
             # 创建新集合
+            # COSINE距离下Qdrant在写入时即对向量做L2归一化，检索时直接按点积计算，
+            # 因此无需在客户端归一化或改用DOT距离
             self.client.create_collection(
                 collection_name=self.collection_name,
                 vectors_config={
                     self.text_vector_name: VectorParams(
                         size=self.vector_dimension,
-                        distance=Distance.COSINE
+                        distance=Distance.COSINE,
+                        on_disk=self.quantization_config is not None
                     ),
                     self.image_vector_name: VectorParams(
                         size=self.vector_dimension,
-                        distance=Distance.COSINE
+                        distance=Distance.COSINE,
+                        on_disk=self.quantization_config is not None
                     )
-                }
+                },
+                quantization_config=self.quantization_config
             )
             
             logger.info(f"成功创建集合: {self.collection_name}")
+            self._ensure_payload_indexes()
             return True
             
         except Exception as e:
             logger.error(f"创建集合失败: {str(e)}")
             return False
     
+    def _ensure_quantization(self):
+        """
+        为已存在的集合补充标量量化配置，并将原始向量移到磁盘（与新建集合一致，已有集合同样节省内存）
+        """
+        if self.quantization_config is None:
+            return
+        
+        try:
+            collection = self.client.get_collection(self.collection_name)
+            update_kwargs = {}
+            if collection.config.quantization_config is None:
+                update_kwargs["quantization_config"] = self.quantization_config
+            
+            # 原始向量仍常驻内存的命名向量，改为on_disk存储（Qdrant在后台优化时迁移已有数据）
+            vectors = collection.config.params.vectors
+            if isinstance(vectors, dict):
+                in_ram_vectors = {
+                    name: models.VectorParamsDiff(on_disk=True)
+                    for name, params in vectors.items()
+                    if not params.on_disk
+                }
+                if in_ram_vectors:
+                    update_kwargs["vectors_config"] = in_ram_vectors
+            
+            if update_kwargs:
+                self.client.update_collection(
+                    collection_name=self.collection_name,
+                    **update_kwargs
+                )
+                logger.info(
+                    f"已为集合 {self.collection_name} 更新存储配置: "
+                    f"int8标量量化={'quantization_config' in update_kwargs}, "
+                    f"原始向量移至磁盘={sorted(update_kwargs.get('vectors_config', {}))}"
+                )
+        except Exception as e:
+            logger.warning(f"启用标量量化失败，继续使用原始向量: {str(e)}")
+    
+    def _ensure_payload_indexes(self):
+        """为查找用的payload字段建立keyword索引（已存在时Qdrant直接返回成功）"""
+        for field_name in self.lookup_payload_fields:
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=models.PayloadSchemaType.KEYWORD
+                )
+            except Exception as e:
+                logger.warning(f"创建payload索引失败 {field_name}: {str(e)}")
+    
+    async def find_by_payload_value(self, value: str, with_vectors: bool = False) -> List[Record]:
+        """
+        按payload字段精确查找记录（任一查找字段等于value即匹配，走keyword索引）
+        
+        Args:
+            value: 全局媒体ID、文件ID或文件名
+            with_vectors: 是否同时返回向量
+            
+        Returns:
+            List[Record]: 匹配的记录（最多一条）
+        """
+        records, _ = await self.async_client.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=Filter(should=[
+                FieldCondition(key=field_name, match=models.MatchValue(value=value))
+                for field_name in self.lookup_payload_fields
+            ]),
+            limit=1,
+            with_payload=True,
+            with_vectors=with_vectors
+        )
+        return records
+    
+    async def suspend_indexing(self) -> Tuple[bool, Optional[int]]:
+        """
+        暂停HNSW索引构建（indexing_threshold设为0），用于大批量导入
+        
+        Returns:
+            Tuple[bool, Optional[int]]: (是否已暂停, 原indexing_threshold)，已暂停时需调用resume_indexing恢复；
+                原阈值未显式设置时为None
+        """
+        try:
+            collection = await self.async_client.get_collection(self.collection_name)
+            previous_threshold = collection.config.optimizer_config.indexing_threshold
+            await self.async_client.update_collection(
+                collection_name=self.collection_name,
+                optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0)
+            )
+            logger.info(f"已暂停集合 {self.collection_name} 的索引构建 (原indexing_threshold={previous_threshold})")
+            return True, previous_threshold
+        except Exception as e:
+            logger.warning(f"暂停索引构建失败，继续在索引开启状态下写入: {str(e)}")
+            return False, None
+    
+    async def resume_indexing(self, indexing_threshold: Optional[int]) -> bool:
+        """
+        恢复HNSW索引构建，Qdrant随后在后台为已写入的数据一次性建立索引
+        
+        Args:
+            indexing_threshold: suspend_indexing返回的原阈值，为None时恢复为Qdrant默认值
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        if indexing_threshold is None:
+            indexing_threshold = DEFAULT_INDEXING_THRESHOLD
+        try:
+            await self.async_client.update_collection(
+                collection_name=self.collection_name,
+                optimizer_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+            )
+            logger.info(f"已恢复集合 {self.collection_name} 的索引构建 (indexing_threshold={indexing_threshold})")
+            return True
+        except Exception as e:
+            logger.error(f"恢复索引构建失败: {str(e)}")
+            return False
+    
     async def insert_embedding(
         self, 
         media_id: str, 
@@ -95,27 +284,10 @@ class QdrantManager:
             bool: 操作是否成功
         """
         try:
-            # 确保ID是字符串格式的UUID或整数
-            point_id = media_id
-            if isinstance(media_id, str) and not media_id.isdigit():
-                # 如果是字符串但不是数字，尝试转换为安全的hash值
-                import hashlib
-                # 使用MD5哈希的前7位（28位整数），确保在安全范围内
-                point_id = int(hashlib.md5(media_id.encode()).hexdigest()[:7], 16)
-            
-            # 在元数据中保存原始ID
-            metadata['original_media_id'] = media_id
-            
-            point = PointStruct(
-                id=point_id,
-                vector={
-                    self.text_vector_name: text_vector,
-                    self.image_vector_name: image_vector
-                },
-                payload=metadata
-            )
+            point = self._build_point(media_id, text_vector, image_vector, metadata)
             
-            self.client.upsert(
+            # 通过gRPC异步客户端写入，向量以protobuf packed float编码传输，不经过JSON序列化
+            await self.async_client.upsert(
                 collection_name=self.collection_name,
                 points=[point]
             )
@@ -127,6 +299,106 @@ class QdrantManager:
             logger.error(f"插入embedding失败 {media_id}: {str(e)}")
             return False
     
+    async def insert_embeddings_batch(self, records: List[Dict[str, Any]], wait: bool = True) -> bool:
+        """
+        批量插入或更新媒体文件的embedding（单次upsert请求）
+        
+        Args:
+            records: 记录列表，每条包含 media_id、text_vector、image_vector、metadata
+            wait: 是否等待写入生效后再返回，批量导入时可设为False仅等待服务端确认接收
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        if not records:
+            return True
+        
+        try:
+            points = [
+                self._build_point(
+                    record['media_id'],
+                    record['text_vector'],
+                    record['image_vector'],
+                    record['metadata']
+                )
+                for record in records
+            ]
+            
+            await self.async_client.upsert(
+                collection_name=self.collection_name,
+                points=points,
+                wait=wait
+            )
+            
+            logger.info(f"成功批量插入embedding: {len(points)} 条")
+            return True
+            
+        except Exception as e:
+            logger.error(f"批量插入embedding失败 ({len(records)} 条): {str(e)}")
+            return False
+    
+    def _build_point(
+        self,
+        media_id: str,
+        text_vector: List[float],
+        image_vector: List[float],
+        metadata: Dict[str, Any]
+    ) -> PointStruct:
+        """构建包含文本和图像命名向量的点（向量可以是列表或numpy数组）"""
+        # 在元数据中保存原始ID
+        metadata['original_media_id'] = media_id
+        
+        return PointStruct(
+            id=media_id_to_point_id(media_id),
+            vector={
+                self.text_vector_name: _as_float_list(text_vector),
+                self.image_vector_name: _as_float_list(image_vector)
+            },
+            payload=metadata
+        )
+    
+    async def uses_named_vectors(self) -> bool:
+        """
+        判断集合是否使用命名向量（text_embedding/image_embedding分开存储）
+        
+        Returns:
+            bool: 命名向量返回True，拼接的密集向量返回False
+        """
+        if self._named_vectors is None:
+            collection = await self.async_client.get_collection(self.collection_name)
+            self._named_vectors = isinstance(collection.config.params.vectors, dict)
+        return self._named_vectors
+    
+    async def update_text_embeddings(self, updates: List[Tuple[Any, str, List[float]]]) -> None:
+        """
+        局部更新文本向量和描述，图像向量及其他payload字段保持不变
+        所有更新在一次batch请求中完成，仅适用于命名向量集合
+        
+        Args:
+            updates: (点ID, 新描述, 文本embedding) 列表
+        """
+        operations = [
+            models.UpdateVectorsOperation(
+                update_vectors=models.UpdateVectors(
+                    points=[
+                        models.PointVectors(id=point_id, vector={self.text_vector_name: text_vector})
+                        for point_id, _, text_vector in updates
+                    ]
+                )
+            )
+        ]
+        operations.extend(
+            models.SetPayloadOperation(
+                set_payload=models.SetPayload(payload={'description': description}, points=[point_id])
+            )
+            for point_id, description, _ in updates
+        )
+        
+        await self.async_client.batch_update_points(
+            collection_name=self.collection_name,
+            update_operations=operations
+        )
+    
     async def search_by_text(
         self,
         query_vector: List[float],
@@ -155,6 +427,7 @@ class QdrantManager:
                 limit=limit,
                 score_threshold=threshold,
                 query_filter=filters,
+                search_params=self.search_params,
                 with_payload=True
             )
             
@@ -207,6 +480,7 @@ class QdrantManager:
                 limit=limit,
                 score_threshold=threshold,
                 query_filter=filters,
+                search_params=self.search_params,
                 with_payload=True
             )
             
@@ -226,6 +500,76 @@ class QdrantManager:
             logger.error(f"图像搜索失败: {str(e)}")
             return []
     
+    async def search_text_and_image(
+        self,
+        query_vector: List[float],
+        limit: int = 10,
+        filters: Optional[Filter] = None,
+        search_type: str = "text_to_image"
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        用同一个查询向量同时检索文本和图像embedding（一次batch search请求，阈值同search_by_text/search_by_image）
+        批量请求失败时回退为两次独立检索
+        
+        Args:
+            query_vector: 查询向量
+            limit: 每路返回结果数量限制
+            filters: 搜索过滤条件
+            search_type: 图像检索类型 ("text_to_image" 或 "image_to_image")
+            
+        Returns:
+            Tuple: (文本搜索结果列表, 图像搜索结果列表)
+        """
+        try:
+            if search_type == "text_to_image":
+                image_threshold = settings.TEXT_TO_IMAGE_THRESHOLD
+            else:  # image_to_image
+                image_threshold = settings.IMAGE_SEARCH_THRESHOLD
+            
+            requests = [
+                models.SearchRequest(
+                    vector=models.NamedVector(name=self.text_vector_name, vector=query_vector),
+                    limit=limit,
+                    score_threshold=settings.TEXT_TO_TEXT_THRESHOLD,
+                    filter=filters,
+                    params=self.search_params,
+                    with_payload=True
+                ),
+                models.SearchRequest(
+                    vector=models.NamedVector(name=self.image_vector_name, vector=query_vector),
+                    limit=limit,
+                    score_threshold=image_threshold,
+                    filter=filters,
+                    params=self.search_params,
+                    with_payload=True
+                )
+            ]
+            text_hits, image_hits = await self.async_client.search_batch(
+                collection_name=self.collection_name,
+                requests=requests
+            )
+            
+            text_results = [
+                {"media_id": hit.id, "score": hit.score, "metadata": hit.payload}
+                for hit in text_hits
+            ]
+            image_results = [
+                {"media_id": hit.id, "score": hit.score, "metadata": hit.payload}
+                for hit in image_hits
+            ]
+            
+            logger.info(f"文本+图像批量搜索完成，文本 {len(text_results)} 个，图像 {len(image_results)} 个")
+            return text_results, image_results
+            
+        except Exception as e:
+            # 批量请求整体失败时改为分别检索，一路失败不影响另一路的结果
+            logger.warning(f"文本+图像批量搜索失败，改为分别搜索: {str(e)}")
+            text_results, image_results = await asyncio.gather(
+                self.search_by_text(query_vector, limit, filters),
+                self.search_by_image(query_vector, limit, filters, search_type)
+            )
+            return text_results, image_results
+    
     async def search_multimodal(
         self,
         text_vector: Optional[List[float]] = None,
@@ -249,19 +593,11 @@ class QdrantManager:
             # 使用配置的图像搜索阈值作为基准
             threshold = settings.IMAGE_SEARCH_THRESHOLD
             
-            results = []
-            text_results = []
-            image_results = []
-            
-            # 搜索文本模态
-            if text_vector:
-                text_results = await self.search_by_text(text_vector, limit, filters)
-                results.extend(text_results)
-            
-            # 搜索图像模态
-            if image_vector:
-                image_results = await self.search_by_image(image_vector, limit, filters, "image_to_image")
-                results.extend(image_results)
+            # 并发搜索文本模态和图像模态
+            text_results, image_results = await asyncio.gather(
+                self.search_by_text(text_vector, limit, filters) if text_vector else _no_results(),
+                self.search_by_image(image_vector, limit, filters, "image_to_image") if image_vector else _no_results()
+            )
             
             # 提高初始搜索的阈值，减少低质量结果
             initial_threshold = max(threshold * 0.7, 0.3)  # 至少0.3的基础阈值
@@ -297,24 +633,22 @@ class QdrantManager:
                         "match_type": "image"
                     }
             
-            # 按合并分数排序
-            final_results = list(combined_results.values())
-            final_results.sort(key=lambda x: x["combined_score"], reverse=True)
-            
             # 应用更严格的最终阈值过滤
             # 对于多模态搜索，要求更高的相似度
             final_threshold = max(threshold, 0.5)  # 最低0.5的阈值
             
-            filtered_results = [
-                result for result in final_results 
-                if result["combined_score"] >= final_threshold
-            ][:limit]
+            # 按合并分数取前limit个
+            filtered_results = heapq.nlargest(
+                limit,
+                (result for result in combined_results.values() if result["combined_score"] >= final_threshold),
+                key=lambda x: x["combined_score"]
+            )
             
             # 记录详细的搜索统计
             logger.info(f"多模态搜索完成: "
                        f"文本结果={len(text_results)}, "
                        f"图像结果={len(image_results)}, "
-                       f"合并后={len(final_results)}, "
+                       f"合并后={len(combined_results)}, "
                        f"过滤后={len(filtered_results)}, "
                        f"阈值={final_threshold}")
             
@@ -336,11 +670,7 @@ class QdrantManager:
         """
         try:
             # 确保ID格式一致
-            point_id = media_id
-            if isinstance(media_id, str) and not media_id.isdigit():
-                import hashlib
-                # 使用MD5哈希的前7位（28位整数），确保在安全范围内
-                point_id = int(hashlib.md5(media_id.encode()).hexdigest()[:7], 16)
+            point_id = media_id_to_point_id(media_id)
             
             self.client.delete(
                 collection_name=self.collection_name,
@@ -389,6 +719,7 @@ class QdrantManager:
                 if response.status_code == 200:
                     data = response.json()
                     result = data.get('result', {})
+                    quantization = result.get('config', {}).get('quantization_config') or {}
                     
                     return {
                         "collection_name": self.collection_name,
@@ -396,7 +727,8 @@ class QdrantManager:
                         "vectors_count": result.get('vectors_count', 0),
                         "status": result.get('status', 'unknown'),
                         "config": {
-                            "distance": result.get('config', {}).get('params', {}).get('vectors', {}).get('distance', 'unknown')
+                            "distance": result.get('config', {}).get('params', {}).get('vectors', {}).get('distance', 'unknown'),
+                            "quantization": quantization.get('scalar', {}).get('type') if quantization else None
                         }
                     }
                 else:
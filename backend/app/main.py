@@ -61,6 +61,14 @@ async def shutdown_event():
         print("✅ 任务管理器已关闭")
     except Exception as e:
         print(f"❌ 任务管理器关闭失败: {str(e)}")
+    
+    try:
+        # 关闭媒体文件读写和缩略图执行器
+        from app.utils.file_handler import shutdown_media_executors
+        shutdown_media_executors()
+        print("✅ 媒体执行器已关闭")
+    except Exception as e:
+        print(f"❌ 媒体执行器关闭失败: {str(e)}")
 
 # 配置 CORS
 app.add_middleware(
@@ -11,13 +11,33 @@ logger = logging.getLogger(__name__)
 
 from app.core.security import get_current_user
 from app.schemas.media import MediaList, MediaType, UploadResult
-from app.utils.file_handler import get_media_type, list_media_files, save_upload_file, delete_media_file, delete_media_file_async
-from app.utils.media_processor import create_thumbnail, create_video_thumbnail
+from app.utils.file_handler import (
+    delete_media_file,
+    delete_media_file_async,
+    generate_thumbnail,
+    get_media_type,
+    list_media_files,
+    run_media_io,
+    save_upload_file
+)
 from app.utils.description_handler import set_media_description
+from app.services.task_queue import QueueFullError
 from app.services.vector_storage_service import get_vector_storage_service
 
 router = APIRouter(prefix="/media", tags=["媒体文件"])
 
+# 任务队列已满时建议客户端重试的等待时间（秒）
+QUEUE_FULL_RETRY_AFTER = 30
+
+
+def _queue_full_error(detail: Any) -> HTTPException:
+    """任务队列已满时返回的429错误（带Retry-After头）"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER)}
+    )
+
 
 @router.post("/upload", response_model=List[UploadResult])
 async def upload_media_files(
@@ -71,24 +91,13 @@ async def upload_media_files(
             global_media_id = file_info.get("global_media_id")  # 新的32位全局ID
             description = descriptions[i] if i < len(descriptions) else ""
             
-            # 创建缩略图
-            thumbnail_created = False
-            if media_type == MediaType.PHOTO:
-                try:
-                    create_thumbnail(file_info["file_path"])
-                    thumbnail_created = True
-                    logger.info(f"成功创建缩略图: {file_info['file_path']}")
-                except Exception as e:
-                    logger.warning(f"创建照片缩略图失败: {str(e)}")
-                    # 继续处理，不中断上传流程
-            elif media_type == MediaType.VIDEO:
-                try:
-                    create_video_thumbnail(file_info["file_path"])
-                    thumbnail_created = True
-                    logger.info(f"成功创建视频缩略图: {file_info['file_path']}")
-                except Exception as e:
-                    logger.warning(f"创建视频缩略图失败: {str(e)}")
-                    # 继续处理，不中断上传流程
+            # 创建缩略图（在共享的缩略图执行器中生成，失败时不中断上传流程）
+            # embedding任务需要知道缩略图是否就绪，因此这里等待生成完成，但不占用事件循环
+            thumbnail_created = await generate_thumbnail(file_info["file_path"], media_type)
+            if thumbnail_created:
+                logger.info(f"成功创建缩略图: {file_info['file_path']}")
+            else:
+                logger.warning(f"创建缩略图失败: {file_info['file_path']}")
             
             # 保存描述到JSON文件（兼容现有系统）
             if description:
@@ -142,11 +151,25 @@ async def upload_media_files(
                             "height": file_info.get("height"),
                             "global_media_id": global_media_id,  # 传递全局ID
                             "force_regenerate": False  # 不强制重新生成，创建新记录
-                        }
+                        },
+                        # 已知缩略图状态，后台任务无需再检查文件（无缩略图时使用的原文件必然存在）
+                        thumbnail_ready=thumbnail_created if file_info["thumbnail_url"] else True
                     )
                     
                     logger.info(f"已添加embedding生成任务: {task_id} (文件: {global_media_id}, 缩略图: {thumbnail_abs_path})")
                     embedding_generated = "queued"  # 标记为队列中
+                
+                except QueueFullError as e:
+                    # 队列已满时撤销本文件的上传，避免留下没有embedding的文件，客户端稍后重试即可
+                    logger.warning(f"任务队列已满，撤销上传 {file_id}: {str(e)}")
+                    try:
+                        await delete_media_file_async(file_id)
+                    except Exception as cleanup_error:
+                        logger.error(f"撤销上传失败 {file_id}: {str(cleanup_error)}")
+                    raise _queue_full_error({
+                        "message": f"{file.filename}: {str(e)}",
+                        "results": results  # 本次请求中此前已成功上传的文件
+                    })
                         
                 except Exception as e:
                     logger.error(f"添加embedding任务失败: {str(e)}")
@@ -173,6 +196,8 @@ async def upload_media_files(
             
             results.append(upload_result)
         
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"上传文件失败 {file.filename}: {str(e)}")
             results.append({
@@ -207,7 +232,9 @@ async def get_media_files(
     """
     获取媒体文件列表
     """
-    result = list_media_files(
+    # 索引刷新可能需要遍历目录，放到线程中避免阻塞事件循环
+    result = await run_media_io(
+        list_media_files,
         media_type=media_type,
         page=page,
         page_size=page_size,
@@ -337,10 +364,16 @@ async def update_media_description(
                 "vector_record_id": vector_record_id
             }
             
+        except QueueFullError as e:
+            # 本地描述已更新，但向量未能排队更新，提示客户端重试（重复设置描述是幂等的）
+            logger.warning(f"任务队列已满，描述更新任务未添加 {file_id}: {str(e)}")
+            raise _queue_full_error(str(e))
         except Exception as e:
             logger.warning(f"添加描述更新任务失败: {str(e)}")
             # 即使任务添加失败，描述本身已经更新成功
             return {"success": True, "message": "描述更新成功"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"更新失败: {str(e)}")
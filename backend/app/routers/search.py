@@ -263,7 +263,8 @@ async def get_queue_stats(
 @router.post("/migrate-descriptions")
 async def migrate_descriptions(
     current_user: str = Depends(get_current_user),
-    force: bool = Query(False, description="强制重新生成所有embeddings")
+    force: bool = Query(False, description="强制重新生成所有embeddings"),
+    verbose: bool = Query(False, description="返回每个文件的处理详情")
 ) -> Any:
     """
     迁移现有描述数据到向量数据库
@@ -274,7 +275,8 @@ async def migrate_descriptions(
         
         # 执行数据迁移
         migration_results = await vector_service.migrate_existing_descriptions(
-            force_regenerate=force
+            force_regenerate=force,
+            verbose=verbose
         )
         
         return {
@@ -457,7 +459,7 @@ async def search_similar_by_file_path(
             )
         
         # 验证是否为图片文件
-        if not file_path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.heic')):
+        if not file_path[-5:].lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.heic')):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="只支持图片文件的相似搜索"
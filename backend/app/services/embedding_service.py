@@ -4,20 +4,98 @@ Embedding服务模块
 """
 
 import asyncio
-import base64
 import os
+import random
+import re
 import time
 import logging
+from collections import OrderedDict
 from typing import Dict, List, Optional, Any
 import dashscope
 from http import HTTPStatus
 
+# 优先使用SIMD加速的pybase64，不可用时回退到标准库
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# 文本embedding缓存键使用BLAKE3摘要，不可用时回退到标准库的blake2b
+try:
+    from blake3 import blake3 as _text_hash
+except ImportError:
+    from hashlib import blake2b as _text_hash
+
 from app.core.config import settings
 from app.services.rate_limiter import get_rate_limiter
-from app.services.task_queue import get_rate_limiter as get_global_rate_limiter
+from app.services.task_queue import TaskPriority, get_rate_limiter as get_global_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+# 异常分类正则（预编译），按优先级顺序逐个检查，第一个匹配的类别生效
+_ERROR_PATTERNS = (
+    ("rate_limit", re.compile(r"rate limit|throttl", re.IGNORECASE)),
+    ("invalid_key", re.compile(r"InvalidApiKey|Invalid API-key")),
+    ("ssl", re.compile(r"SSL")),
+    ("network", re.compile(r"ConnectionError|Timeout")),
+)
+
+# 可重试异常的判断正则（限流、超时、连接异常不区分大小写，服务端内部错误区分大小写）
+_RETRYABLE_PATTERN = re.compile(r"(?i:rate limit|throttl|timeout|connection)|Internal")
+
+# 各类异常对应的用户提示（未列出的类别使用原始错误信息）
+_ERROR_MESSAGES = {
+    "rate_limit": "请求过于频繁，请稍后重试",
+    "invalid_key": "API密钥无效，请检查.local.env文件中的DASHSCOPE_API_KEY配置",
+    "ssl": "网络连接异常，请检查网络环境或稍后重试",
+    "network": "网络连接超时，请检查网络环境",
+}
+
+# 缩略图保存为JPEG格式的文件扩展名（HEIC图像和视频）
+_JPEG_THUMBNAIL_EXTENSIONS = frozenset({"heic", "heif", "mp4", "mov", "hevc", "avi"})
+
+
+def _classify_error(error_str: str) -> str:
+    """根据错误信息判断异常类别，无法识别时返回other"""
+    for error_kind, pattern in _ERROR_PATTERNS:
+        if pattern.search(error_str):
+            return error_kind
+    return "other"
+
+
+def _is_retryable_error(error_str: str) -> bool:
+    """根据错误信息判断异常是否可重试（限流、网络、服务端内部错误）"""
+    return _RETRYABLE_PATTERN.search(error_str) is not None
+
+
+def _error_message(error_kind: str, error_str: str) -> str:
+    """获取异常类别对应的用户提示"""
+    return _ERROR_MESSAGES.get(error_kind) or f"处理异常: {error_str}"
+
+
+def _is_retryable_response(resp) -> bool:
+    """判断API失败响应是否可重试（服务端内部错误或限流）"""
+    error_code = getattr(resp, 'code', None) or ''
+    error_message = getattr(resp, 'message', None) or ''
+    return (
+        'InternalError' in error_code or
+        'Failed to invoke backend' in error_message or
+        resp.status_code in (HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.SERVICE_UNAVAILABLE) or
+        'rate limit' in error_message.lower() or
+        error_code == 'Throttling'
+    )
+
+
+def _retry_delay(base_delay: float, attempt: int) -> float:
+    """指数退避延迟，叠加随机抖动避免并发请求同时重试"""
+    return base_delay * (2 ** attempt) + random.uniform(0, base_delay / 2)
+
+
+async def _none() -> None:
+    """占位协程，用于asyncio.gather中跳过的embedding请求"""
+    return None
+
+
 class EmbeddingService:
     """Embedding服务类，集成阿里云DashScope API"""
     
@@ -41,6 +119,13 @@ class EmbeddingService:
         self.model_name = "multimodal-embedding-v1"
         self.vector_dimension = 1024
         
+        # 正在进行中的搜索查询embedding请求，相同查询并发到达时共享同一次API调用
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # 文本embedding的LRU缓存（文本摘要 -> 结果），相同描述无需重复调用API
+        self._text_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._text_cache_size = 4096
+        
         logger.info("Embedding服务初始化成功")
     
     async def embed_text(self, text: str) -> Dict[str, Any]:
@@ -66,9 +151,22 @@ class EmbeddingService:
                 'is_zero_vector': True  # 标记这是零向量
             }
         
+        cache_key = _text_hash(text.encode('utf-8')).digest()
+        cached = self._text_cache.get(cache_key)
+        if cached is not None:
+            self._text_cache.move_to_end(cache_key)
+            return dict(cached)
+        
         try:
             # 直接调用异步方法
             result = await self._embed_text_sync(text)
+            
+            # 只缓存成功的结果，超出容量时淘汰最久未使用的条目
+            if result.get('success'):
+                self._text_cache[cache_key] = result
+                if len(self._text_cache) > self._text_cache_size:
+                    self._text_cache.popitem(last=False)
+                result = dict(result)
             return result
             
         except Exception as e:
@@ -79,69 +177,87 @@ class EmbeddingService:
             }
     
     async def _embed_text_sync(self, text: str) -> Dict[str, Any]:
-        """同步文本向量化（已集成速率限制）"""
+        """同步文本向量化（已集成速率限制，临时性错误指数退避重试）"""
         rate_limiter = get_rate_limiter()
+        max_retries = 3
+        base_delay = 2.0
+        input_data = [{'text': text}]
         
-        try:
-            # 等待速率限制许可
-            await rate_limiter.wait_for_permit()
-            
-            input_data = [{'text': text}]
-            
-            # 在线程池中执行同步API调用
-            loop = asyncio.get_event_loop()
-            resp = await loop.run_in_executor(None, 
-                lambda: dashscope.MultiModalEmbedding.call(
-                    model=self.model_name,
-                    input=input_data
+        for attempt in range(max_retries):
+            try:
+                # 等待速率限制许可
+                await rate_limiter.wait_for_permit()
+                
+                # 在线程池中执行同步API调用
+                loop = asyncio.get_event_loop()
+                resp = await loop.run_in_executor(None, 
+                    lambda: dashscope.MultiModalEmbedding.call(
+                        model=self.model_name,
+                        input=input_data
+                    )
                 )
-            )
-            
-            if resp.status_code == HTTPStatus.OK:
-                # 记录成功调用
-                await rate_limiter.record_success()
                 
-                embedding_data = resp.output['embeddings'][0]
-                return {
-                    'success': True,
-                    'embedding': embedding_data['embedding'],
-                    'type': embedding_data['type'],
-                    'dimension': len(embedding_data['embedding']),
-                    'usage': resp.usage if resp.usage else None,
-                    'request_id': resp.request_id
-                }
-            else:
+                if resp.status_code == HTTPStatus.OK:
+                    # 记录成功调用
+                    await rate_limiter.record_success()
+                    
+                    embedding_data = resp.output['embeddings'][0]
+                    return {
+                        'success': True,
+                        'embedding': embedding_data['embedding'],
+                        'type': embedding_data['type'],
+                        'dimension': len(embedding_data['embedding']),
+                        'usage': resp.usage if resp.usage else None,
+                        'request_id': resp.request_id,
+                        'attempts': attempt + 1
+                    }
+                
                 # 检查是否为速率限制错误
                 if 'rate limit' in str(resp.message).lower() or resp.code == 'Throttling':
                     await rate_limiter.record_error("rate_limit")
                 
+                is_retryable = _is_retryable_response(resp)
+                if is_retryable and attempt < max_retries - 1:
+                    delay = _retry_delay(base_delay, attempt)
+                    logger.warning(f"文本embedding重试 {attempt + 1}/{max_retries}: {resp.code} - {resp.message}，{delay:.1f}秒后重试")
+                    await asyncio.sleep(delay)
+                    continue
+                
                 logger.error(f"文本embedding请求失败: {resp}")
                 return {
                     'success': False,
-                    'error': f"API调用失败: {resp.code} - {resp.message}"
+                    'error': f"API调用失败: {resp.code} - {resp.message}",
+                    'attempts': attempt + 1,
+                    'retryable': is_retryable
                 }
                 
-        except Exception as e:
-            error_str = str(e)
-            logger.error(f"文本embedding异常: {error_str}")
-            
-            # 处理不同类型的错误
-            if 'rate limit' in error_str.lower() or 'throttl' in error_str.lower():
-                await rate_limiter.record_error("rate_limit")
-                error_msg = "请求过于频繁，请稍后重试"
-            elif 'InvalidApiKey' in error_str or 'Invalid API-key' in error_str:
-                error_msg = "API密钥无效，请检查.local.env文件中的DASHSCOPE_API_KEY配置"
-            elif 'SSLError' in error_str or 'SSL' in error_str:
-                error_msg = "网络连接异常，请检查网络环境或稍后重试"
-            elif 'ConnectionError' in error_str or 'Timeout' in error_str:
-                error_msg = "网络连接超时，请检查网络环境"
-            else:
-                error_msg = f"处理异常: {error_str}"
-            
-            return {
-                'success': False,
-                'error': error_msg
-            }
+            except Exception as e:
+                error_str = str(e)
+                logger.error(f"文本embedding异常 (尝试 {attempt + 1}/{max_retries}): {error_str}")
+                
+                # 处理不同类型的错误
+                error_kind = _classify_error(error_str)
+                if error_kind == "rate_limit":
+                    await rate_limiter.record_error("rate_limit")
+                
+                if _is_retryable_error(error_str) and attempt < max_retries - 1:
+                    delay = _retry_delay(base_delay, attempt)
+                    logger.warning(f"文本embedding异常重试，{delay:.1f}秒后重试")
+                    await asyncio.sleep(delay)
+                    continue
+                
+                return {
+                    'success': False,
+                    'error': _error_message(error_kind, error_str),
+                    'attempts': attempt + 1
+                }
+        
+        # 如果所有重试都失败了
+        return {
+            'success': False,
+            'error': f'文本embedding失败，已尝试 {max_retries} 次',
+            'attempts': max_retries
+        }
     
     async def embed_image_from_file(self, image_path: str) -> Dict[str, Any]:
         """
@@ -182,16 +298,7 @@ class EmbeddingService:
                 # 等待速率限制许可
                 await rate_limiter.wait_for_permit()
                 
-                # 读取并转换为Base64
-                with open(image_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                
-                # 检测图像格式
-                image_format = image_path.split('.')[-1].lower()
-                if image_format == 'jpg':
-                    image_format = 'jpeg'
-                
-                # 检查图像大小，如果太大则跳过
+                # 检查图像大小，如果太大则跳过（先检查再读取，避免无谓的内存占用）
                 file_size = os.path.getsize(image_path)
                 if file_size > 8 * 1024 * 1024:  # 8MB限制
                     return {
@@ -199,7 +306,20 @@ class EmbeddingService:
                         'error': f'图像文件过大 ({file_size/1024/1024:.2f}MB)，建议小于8MB'
                     }
                 
-                image_data = f"data:image/{image_format};base64,{base64_image}"
+                if settings.DASHSCOPE_IMAGE_UPLOAD_MODE == "binary":
+                    # 以本地文件引用传递，由SDK上传原始字节，避免Base64膨胀和整块内存拷贝
+                    image_data = f"file://{os.path.abspath(image_path)}"
+                else:
+                    # 检测图像格式
+                    image_format = image_path.split('.')[-1].lower()
+                    if image_format == 'jpg':
+                        image_format = 'jpeg'
+                    
+                    # 读取并转换为Base64
+                    with open(image_path, "rb") as image_file:
+                        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+                    image_data = f"data:image/{image_format};base64,{base64_image}"
+                
                 input_data = [{'image': image_data}]
                 
                 # 在线程池中执行同步API调用
@@ -230,17 +350,11 @@ class EmbeddingService:
                     error_message = getattr(resp, 'message', 'Unknown error')
                     
                     # 检查是否为可重试的错误
-                    is_retryable = (
-                        'InternalError' in error_code or
-                        'Failed to invoke backend' in error_message or
-                        resp.status_code == 500 or
-                        'rate limit' in error_message.lower() or 
-                        error_code == 'Throttling'
-                    )
+                    is_retryable = _is_retryable_response(resp)
                     
                     if is_retryable and attempt < max_retries - 1:
-                        delay = base_delay * (2 ** attempt)  # 指数退避
-                        logger.warning(f"图像embedding重试 {attempt + 1}/{max_retries}: {error_code} - {error_message}，{delay}秒后重试")
+                        delay = _retry_delay(base_delay, attempt)  # 指数退避
+                        logger.warning(f"图像embedding重试 {attempt + 1}/{max_retries}: {error_code} - {error_message}，{delay:.1f}秒后重试")
                         await asyncio.sleep(delay)
                         continue
                     
@@ -261,36 +375,22 @@ class EmbeddingService:
                 logger.error(f"图像embedding异常 (尝试 {attempt + 1}/{max_retries}): {error_str}")
                 
                 # 判断是否为可重试的异常
-                is_retryable = (
-                    'rate limit' in error_str.lower() or 
-                    'throttl' in error_str.lower() or
-                    'timeout' in error_str.lower() or
-                    'connection' in error_str.lower() or
-                    'Internal' in error_str
-                )
+                error_kind = _classify_error(error_str)
+                is_retryable = _is_retryable_error(error_str)
                 
                 if is_retryable and attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"图像embedding异常重试，{delay}秒后重试")
+                    delay = _retry_delay(base_delay, attempt)
+                    logger.warning(f"图像embedding异常重试，{delay:.1f}秒后重试")
                     await asyncio.sleep(delay)
                     continue
                 
                 # 处理不同类型的错误
-                if 'rate limit' in error_str.lower() or 'throttl' in error_str.lower():
+                if error_kind == "rate_limit":
                     await rate_limiter.record_error("rate_limit")
-                    error_msg = "请求过于频繁，请稍后重试"
-                elif 'InvalidApiKey' in error_str or 'Invalid API-key' in error_str:
-                    error_msg = "API密钥无效，请检查.local.env文件中的DASHSCOPE_API_KEY配置"
-                elif 'SSLError' in error_str or 'SSL' in error_str:
-                    error_msg = "网络连接异常，请检查网络环境或稍后重试"
-                elif 'ConnectionError' in error_str or 'Timeout' in error_str:
-                    error_msg = "网络连接超时，请检查网络环境"
-                else:
-                    error_msg = f"处理异常: {error_str}"
                 
                 return {
                     'success': False,
-                    'error': error_msg,
+                    'error': _error_message(error_kind, error_str),
                     'attempts': attempt + 1,
                     'original_error': error_str
                 }
@@ -319,21 +419,19 @@ class EmbeddingService:
             # 获取相对路径
             rel_path = os.path.relpath(file_path, MEDIA_ROOT)
             
-            # 构建缩略图路径
+            # 构建缩略图路径（HEIC和视频文件的缩略图是JPEG格式）
+            stem, ext = os.path.splitext(rel_path)
+            if ext[1:].lower() in _JPEG_THUMBNAIL_EXTENSIONS:
+                rel_path = stem + '.jpg'
             thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", rel_path)
             
-            # 对于HEIC文件，缩略图是JPEG格式
-            if file_path.lower().endswith(('.heic', '.heif')):
-                thumbnail_path = thumbnail_path.rsplit('.', 1)[0] + '.jpg'
-            
-            # 对于视频文件，缩略图是JPEG格式  
-            elif file_path.lower().endswith(('.mp4', '.mov', '.hevc', '.avi')):
-                thumbnail_path = thumbnail_path.rsplit('.', 1)[0] + '.jpg'
-            
-            # 如果缩略图存在，返回缩略图路径
-            if os.path.exists(thumbnail_path):
+            # 如果缩略图存在，返回缩略图路径（一次stat同时判断存在性和大小）
+            try:
+                file_size = os.stat(thumbnail_path).st_size
+            except FileNotFoundError:
+                file_size = None
+            if file_size is not None:
                 # 检查文件大小，确保缩略图适合API限制
-                file_size = os.path.getsize(thumbnail_path)
                 if file_size <= 10 * 1024 * 1024:  # 10MB限制
                     logger.info(f"使用缩略图进行embedding: {thumbnail_path} ({file_size/1024/1024:.2f}MB)")
                     return thumbnail_path
@@ -342,8 +440,11 @@ class EmbeddingService:
                     return None
             
             # 检查原始文件大小
-            if os.path.exists(file_path):
-                file_size = os.path.getsize(file_path)
+            try:
+                file_size = os.stat(file_path).st_size
+            except FileNotFoundError:
+                file_size = None
+            if file_size is not None:
                 if file_size <= 10 * 1024 * 1024:  # 10MB限制
                     logger.info(f"使用原始文件进行embedding: {file_path} ({file_size/1024/1024:.2f}MB)")
                     return file_path
@@ -359,7 +460,7 @@ class EmbeddingService:
 
     async def embed_media_file(self, file_path: str, description: Optional[str] = None) -> Dict[str, Any]:
         """
-        为媒体文件生成双模态embedding（串行处理以避免速率限制）
+        为媒体文件生成双模态embedding（文本和图像并发请求）
         
         Args:
             file_path: 媒体文件路径
@@ -381,15 +482,20 @@ class EmbeddingService:
         }
         
         try:
-            # 串行处理文本和图像embedding，避免速率限制
+            # 文本和图像embedding并发请求，速率由rate_limiter统一控制
+            has_text = bool(description and description.strip())
+            image_file_path = self._get_thumbnail_path(file_path)
+            if not has_text:
+                # 没有描述时，不生成文本embedding，稍后用零向量填充
+                logger.info(f"没有描述文本，跳过文本embedding生成: {file_path}")
             
-            # 1. 先处理文本embedding
-            logger.info(f"开始处理文本embedding: {file_path}")
-            if description and description.strip():
-                # 只有在有实际描述时才生成文本embedding
-                text_result = await self.embed_text(description)
-                
-                # 处理文本embedding结果
+            text_result, image_result = await asyncio.gather(
+                self.embed_text(description) if has_text else _none(),
+                self.embed_image_from_file(image_file_path) if image_file_path else _none()
+            )
+            
+            # 处理文本embedding结果
+            if text_result is not None:
                 if text_result.get('success'):
                     result['text_embedding'] = text_result['embedding']
                     result['text_success'] = True
@@ -397,32 +503,18 @@ class EmbeddingService:
                 else:
                     result['errors'].append(f"文本embedding失败: {text_result.get('error', '未知错误')}")
                     logger.warning(f"文本embedding失败: {file_path} - {text_result.get('error', '未知错误')}")
-            else:
-                # 没有描述时，不生成文本embedding，记录为跳过
-                logger.info(f"没有描述文本，跳过文本embedding生成: {file_path}")
-                result['text_embedding'] = None  # 明确设置为None，稍后用零向量填充
-            
-            # 2. 添加0.5秒间隔，避免速率限制
-            logger.info(f"等待0.5秒后处理图像embedding...")
-            await asyncio.sleep(0.5)
             
-            # 3. 处理图像embedding
-            logger.info(f"开始处理图像embedding: {file_path}")
-            image_file_path = self._get_thumbnail_path(file_path)
-            if image_file_path:
-                image_result = await self.embed_image_from_file(image_file_path)
-                
-                # 处理图像embedding结果
-                if image_result.get('success'):
-                    result['image_embedding'] = image_result['embedding']
-                    result['image_success'] = True
-                    logger.info(f"图像embedding成功: {file_path}")
-                else:
-                    result['errors'].append(f"图像embedding失败: {image_result.get('error', '未知错误')}")
-                    logger.warning(f"图像embedding失败: {file_path} - {image_result.get('error', '未知错误')}")
-            else:
+            # 处理图像embedding结果
+            if image_result is None:
                 result['errors'].append('文件过大，无法生成图像embedding（超过10MB限制）')
                 logger.warning(f"文件过大，跳过图像embedding: {file_path}")
+            elif image_result.get('success'):
+                result['image_embedding'] = image_result['embedding']
+                result['image_success'] = True
+                logger.info(f"图像embedding成功: {file_path}")
+            else:
+                result['errors'].append(f"图像embedding失败: {image_result.get('error', '未知错误')}")
+                logger.warning(f"图像embedding失败: {file_path} - {image_result.get('error', '未知错误')}")
             
             # 检查是否至少有一个embedding成功
             if not result['text_success'] and not result['image_success']:
@@ -467,22 +559,38 @@ class EmbeddingService:
                 'is_zero_vector': True  # 标记这是零向量
             }
         
-        return await self._embed_text_with_global_limiter(query.strip())
+        query = query.strip()
+        
+        # 相同查询共享同一个进行中的任务；所有调用方都通过shield等待，
+        # 任一调用方被取消都不会取消共享任务，其他等待者照常拿到结果
+        task = self._inflight.get(query)
+        if task is None:
+            task = asyncio.ensure_future(self._embed_text_with_global_limiter(query))
+            self._inflight[query] = task
+            task.add_done_callback(lambda t: self._finish_inflight(query, t))
+        return await asyncio.shield(task)
+    
+    def _finish_inflight(self, query: str, task: asyncio.Task) -> None:
+        """共享查询任务完成后移除登记，并读取异常，避免没有等待者时输出未读取异常的警告"""
+        if self._inflight.get(query) is task:
+            del self._inflight[query]
+        if not task.cancelled():
+            task.exception()
     
     async def _embed_text_with_global_limiter(self, text: str) -> Dict[str, Any]:
         """使用全局速率限制器进行文本embedding（搜索专用）"""
         global_rate_limiter = get_global_rate_limiter()
         
         try:
-            # 检查全局速率限制
-            if not global_rate_limiter.can_make_request():
-                wait_time = global_rate_limiter.get_wait_time()
+            # 检查全局速率限制（搜索使用URGENT预留配额）
+            if not global_rate_limiter.can_make_request(TaskPriority.URGENT):
+                wait_time = global_rate_limiter.get_wait_time(TaskPriority.URGENT)
                 if wait_time > 0:
                     logger.info(f"等待全局速率限制: {wait_time:.1f}秒")
                     await asyncio.sleep(wait_time)
             
             # 记录请求
-            global_rate_limiter.record_request()
+            global_rate_limiter.record_request(TaskPriority.URGENT)
             
             input_data = [{'text': text}]
             
@@ -517,20 +625,9 @@ class EmbeddingService:
             logger.error(f"搜索文本embedding异常: {error_str}")
             
             # 处理不同类型的错误
-            if 'rate limit' in error_str.lower() or 'throttl' in error_str.lower():
-                error_msg = "请求过于频繁，请稍后重试"
-            elif 'InvalidApiKey' in error_str or 'Invalid API-key' in error_str:
-                error_msg = "API密钥无效，请检查.local.env文件中的DASHSCOPE_API_KEY配置"
-            elif 'SSLError' in error_str or 'SSL' in error_str:
-                error_msg = "网络连接异常，请检查网络环境或稍后重试"
-            elif 'ConnectionError' in error_str or 'Timeout' in error_str:
-                error_msg = "网络连接超时，请检查网络环境"
-            else:
-                error_msg = f"处理异常: {error_str}"
-            
             return {
                 'success': False,
-                'error': error_msg
+                'error': _error_message(_classify_error(error_str), error_str)
             }
         
     # 为兼容性保留原有方法（用于非搜索的embedding生成）
@@ -573,8 +670,9 @@ class EmbeddingService:
             # 补齐描述列表
             descriptions.extend([None] * (len(file_paths) - len(descriptions)))
         
-        # 创建信号量控制并发数
-        semaphore = asyncio.Semaphore(max_concurrent)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(file_paths)
+        # 固定数量的worker共享同一迭代器，协程数量不随文件数量增长
+        pending_files = iter(enumerate(file_paths))
         
         async def process_single_file_with_delay(
             file_index: int, 
@@ -582,50 +680,45 @@ class EmbeddingService:
             description: Optional[str]
         ) -> Dict[str, Any]:
             """处理单个文件，包含延迟控制"""
-            async with semaphore:
-                # 为避免同时启动的任务都立即开始，添加基于索引的小延迟
-                if file_index > 0:
-                    base_delay = (file_index % max_concurrent) * interval_between_files
-                    if base_delay > 0:
-                        logger.info(f"文件 {file_index} 等待 {base_delay:.1f}秒后开始处理")
-                        await asyncio.sleep(base_delay)
-                
-                logger.info(f"开始处理文件 {file_index + 1}/{len(file_paths)}: {os.path.basename(file_path)}")
-                result = await self.embed_media_file(file_path, description)
-                
-                # 处理完成后再等待一小段时间，确保不会立即开始下一个文件
-                if file_index < len(file_paths) - 1:  # 不是最后一个文件
-                    await asyncio.sleep(0.2)  # 短暂间隔
-                
-                return result
-        
-        # 创建任务列表
-        tasks = [
-            process_single_file_with_delay(i, file_path, descriptions[i])
-            for i, file_path in enumerate(file_paths)
-        ]
+            # 为避免同时启动的任务都立即开始，添加基于索引的小延迟
+            if file_index > 0:
+                base_delay = (file_index % max_concurrent) * interval_between_files
+                if base_delay > 0:
+                    logger.info(f"文件 {file_index} 等待 {base_delay:.1f}秒后开始处理")
+                    await asyncio.sleep(base_delay)
+            
+            logger.info(f"开始处理文件 {file_index + 1}/{len(file_paths)}: {os.path.basename(file_path)}")
+            result = await self.embed_media_file(file_path, description)
+            
+            # 处理完成后再等待一小段时间，确保不会立即开始下一个文件
+            if file_index < len(file_paths) - 1:  # 不是最后一个文件
+                await asyncio.sleep(0.2)  # 短暂间隔
+            
+            return result
         
-        # 执行所有任务
-        try:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 处理异常结果
-            processed_results = []
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    logger.error(f"文件 {i} 处理异常: {str(result)}")
-                    processed_results.append({
+        async def worker():
+            for file_index, file_path in pending_files:
+                try:
+                    results[file_index] = await process_single_file_with_delay(
+                        file_index, file_path, descriptions[file_index]
+                    )
+                except Exception as e:
+                    # 单个文件异常记录在对应结果中，不影响其他文件
+                    logger.error(f"文件 {file_index} 处理异常: {str(e)}")
+                    results[file_index] = {
                         'success': False,
-                        'file_path': file_paths[i],
-                        'error': str(result),
+                        'file_path': file_path,
+                        'error': str(e),
                         'text_success': False,
                         'image_success': False
-                    })
-                else:
-                    processed_results.append(result)
+                    }
+        
+        # 执行所有任务
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, max_concurrent))))
             
-            logger.info(f"批量处理完成，成功: {sum(1 for r in processed_results if r.get('success', False))} / {len(file_paths)}")
-            return processed_results
+            logger.info(f"批量处理完成，成功: {sum(1 for r in results if r.get('success', False))} / {len(file_paths)}")
+            return results
             
         except Exception as e:
             logger.error(f"批量处理异常: {str(e)}")
@@ -3,16 +3,103 @@ Embedding相关的任务处理器
 处理文件上传和描述更新的embedding生成任务
 """
 
+import asyncio
 import logging
-from typing import Dict, Any
-from app.services.embedding_service import get_embedding_service
-from app.services.vector_storage_service import get_vector_storage_service
+import os
+import numpy as np
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+from qdrant_client.http.models import PointStruct
+from app.models.search_models import EmbeddingResponse
+from app.services.embedding_service import EmbeddingService
+from app.services.vector_storage_service import VectorStorageService
 from app.utils.file_handler import generate_global_media_id
-from app.database.qdrant_manager import get_qdrant_manager
+from app.database.qdrant_manager import QdrantManager, media_id_to_point_id
 
 logger = logging.getLogger(__name__)
 
-async def handle_upload_embedding_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+@dataclass
+class TaskServices:
+    """任务处理器依赖的服务实例，由任务管理器初始化时创建并绑定到处理器"""
+    embedding_service: EmbeddingService
+    vector_storage: VectorStorageService
+    qdrant_manager: QdrantManager
+
+def _prepare_upload_embedding(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    解析上传embedding任务的payload，确定全局媒体ID和用于生成embedding的文件
+    
+    Args:
+        payload: 上传embedding任务的payload
+    
+    Returns:
+        Dict: 可直接传给向量存储服务的媒体文件信息
+    """
+    file_path = payload['file_path']
+    thumbnail_path = payload['thumbnail_path']
+    extra_metadata = payload['extra_metadata']
+    
+    # 生成全局媒体ID
+    global_media_id = extra_metadata.get('global_media_id')
+    if not global_media_id:
+        # 如果没有提供全局ID，则生成一个
+        global_media_id = generate_global_media_id(
+            extra_metadata.get('original_name', ''),
+            extra_metadata.get('upload_time', '')
+        )
+    
+    logger.info("使用全局媒体ID: %s", global_media_id)
+    
+    # 使用缩略图路径作为处理文件（如果存在且文件存在）
+    # 缩略图生成方已告知是否就绪时直接使用，否则才检查文件系统
+    thumbnail_ready = payload.get('thumbnail_ready')
+    if thumbnail_ready is None and thumbnail_path:
+        try:
+            os.stat(thumbnail_path)
+            thumbnail_ready = True
+        except OSError:
+            thumbnail_ready = False
+    
+    processing_file_path = file_path
+    if thumbnail_path and thumbnail_ready:
+        processing_file_path = thumbnail_path
+        logger.info("使用缩略图进行embedding生成: %s", thumbnail_path)
+    else:
+        logger.info("使用原文件进行embedding生成: %s", file_path)
+    
+    return {
+        'media_id': global_media_id,
+        'file_path': processing_file_path,
+        'file_type': extra_metadata.get('file_type', 'photo'),
+        'file_size': extra_metadata.get('file_size', 0),
+        'upload_time': extra_metadata.get('upload_time', ''),
+        'description': payload['description'],
+        'extra_metadata': extra_metadata,
+        'force_regenerate': extra_metadata.get('force_regenerate', False)
+    }
+
+def _build_upload_result(
+    payload: Dict[str, Any],
+    media_info: Dict[str, Any],
+    store_result: EmbeddingResponse
+) -> Dict[str, Any]:
+    """根据向量存储结果构建上传embedding任务的执行结果"""
+    if not store_result.success:
+        raise Exception(f"向量存储失败: {store_result.error_message}")
+    
+    return {
+        'success': True,
+        'media_id': media_info['media_id'],
+        'file_path': payload['file_path'],
+        'thumbnail_path': payload['thumbnail_path'],
+        'processing_file_path': media_info['file_path'],
+        'text_embedding_generated': store_result.text_embedding_generated,
+        'image_embedding_generated': store_result.image_embedding_generated,
+        'processing_time': store_result.processing_time
+    }
+
+async def handle_upload_embedding_task(payload: Dict[str, Any], services: TaskServices) -> Dict[str, Any]:
     """
     处理文件上传后的embedding生成任务
     
@@ -22,75 +109,178 @@ async def handle_upload_embedding_task(payload: Dict[str, Any]) -> Dict[str, Any
             - thumbnail_path: 缩略图路径  
             - description: 文件描述
             - extra_metadata: 额外元数据
+            - thumbnail_ready: 缩略图是否已生成（可选，未提供时检查文件是否存在）
+        services: 任务处理器依赖的服务实例
     
     Returns:
         Dict: 任务执行结果
     """
     try:
         file_path = payload['file_path']
-        thumbnail_path = payload['thumbnail_path']
-        description = payload['description']
-        extra_metadata = payload['extra_metadata']
-        
-        logger.info(f"开始处理上传文件embedding: {file_path}")
-        
-        # 获取服务实例
-        vector_storage = get_vector_storage_service()
-        
-        # 生成全局媒体ID
-        global_media_id = extra_metadata.get('global_media_id')
-        if not global_media_id:
-            # 如果没有提供全局ID，则生成一个
-            global_media_id = generate_global_media_id(
-                extra_metadata.get('original_name', ''),
-                extra_metadata.get('upload_time', '')
-            )
+        logger.info("开始处理上传文件embedding: %s", file_path)
         
-        logger.info(f"使用全局媒体ID: {global_media_id}")
+        vector_storage = services.vector_storage
         
-        # 使用缩略图路径作为处理文件（如果存在且文件存在）
-        import os
-        processing_file_path = file_path
-        if thumbnail_path and os.path.exists(thumbnail_path):
-            processing_file_path = thumbnail_path
-            logger.info(f"使用缩略图进行embedding生成: {thumbnail_path}")
-        else:
-            logger.info(f"使用原文件进行embedding生成: {file_path}")
+        media_info = _prepare_upload_embedding(payload)
         
         # 直接调用向量存储服务生成并存储embedding
-        store_result = await vector_storage.store_media_embedding(
-            media_id=global_media_id,
-            file_path=processing_file_path,
-            file_type=extra_metadata.get('file_type', 'photo'),
-            file_size=extra_metadata.get('file_size', 0),
-            upload_time=extra_metadata.get('upload_time', ''),
-            description=description,
-            extra_metadata=extra_metadata,
-            force_regenerate=extra_metadata.get('force_regenerate', False)
-        )
-        
-        if not store_result.success:
-            raise Exception(f"向量存储失败: {store_result.error_message}")
+        store_result = await vector_storage.store_media_embedding(**media_info)
         
-        result = {
-            'success': True,
-            'media_id': global_media_id,
-            'file_path': file_path,
-            'thumbnail_path': thumbnail_path,
-            'processing_file_path': processing_file_path,
-            'text_embedding_generated': store_result.text_embedding_generated,
-            'image_embedding_generated': store_result.image_embedding_generated,
-            'processing_time': store_result.processing_time
-        }
+        result = _build_upload_result(payload, media_info, store_result)
         
-        logger.info(f"文件embedding处理完成: {file_path}")
+        logger.info("文件embedding处理完成: %s", file_path)
         return result
         
     except Exception as e:
-        logger.error(f"处理上传文件embedding失败: {str(e)}")
+        logger.error("处理上传文件embedding失败: %s", e)
         raise
 
-async def handle_description_update_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_upload_embedding_batch_task(payloads: List[Dict[str, Any]], services: TaskServices) -> List[Any]:
+    """
+    批量处理文件上传后的embedding生成任务
+    由任务队列将同时待处理的upload_embedding任务合并后调用，
+    embedding生成后以单次请求写入向量数据库
+    
+    Args:
+        payloads: 上传embedding任务的payload列表（字段同 handle_upload_embedding_task）
+        services: 任务处理器依赖的服务实例
+    
+    Returns:
+        List: 与payloads一一对应的任务执行结果，失败的任务对应Exception实例
+    """
+    logger.info("开始批量处理上传文件embedding: %s 个文件", len(payloads))
+    
+    vector_storage = services.vector_storage
+    
+    results: List[Any] = [None] * len(payloads)
+    media_infos = []
+    indices = []
+    for i, payload in enumerate(payloads):
+        try:
+            media_infos.append(_prepare_upload_embedding(payload))
+            indices.append(i)
+        except Exception as e:
+            logger.error("处理上传文件embedding失败: %s", e)
+            results[i] = e
+    
+    store_results = await vector_storage.store_media_embeddings_batch(media_infos)
+    
+    for i, media_info, store_result in zip(indices, media_infos, store_results):
+        try:
+            results[i] = _build_upload_result(payloads[i], media_info, store_result)
+        except Exception as e:
+            logger.error("处理上传文件embedding失败: %s", e)
+            results[i] = e
+    
+    logger.info("批量文件embedding处理完成: %s 个文件", len(payloads))
+    return results
+
+async def _generate_description_embedding(
+    embedding_service: EmbeddingService,
+    new_description: str,
+    file_path: str
+) -> List[float]:
+    """为新的描述生成文本embedding，失败时抛出异常"""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("生成新的文本embedding: %s...", new_description[:50] if new_description else '(空描述)')
+    text_embedding_result = await embedding_service.get_text_embedding(new_description)
+    
+    if not text_embedding_result.get('success'):
+        raise Exception(f"文本embedding生成失败: {text_embedding_result.get('error')}")
+    
+    # 记录是否使用了零向量
+    if text_embedding_result.get('is_zero_vector'):
+        logger.info("使用零向量作为文本embedding（描述为空）: %s", file_path)
+    
+    return text_embedding_result['embedding']
+
+def _build_description_update_point(
+    point_id: Any,
+    existing_point: Any,
+    new_description: str,
+    text_embedding: List[float]
+) -> PointStruct:
+    """基于现有点构建更新了描述和文本embedding的点（图像embedding保持不变）"""
+    existing_vectors = existing_point.vector
+    
+    # 更新payload中的描述
+    updated_payload = existing_point.payload.copy()
+    updated_payload['description'] = new_description
+    
+    # 构建新的向量（保持图像embedding不变，更新文本embedding）
+    if isinstance(existing_vectors, dict):
+        # 命名向量格式
+        updated_vectors = existing_vectors.copy()
+        updated_vectors['text_embedding'] = text_embedding  # 修正字段名
+    else:
+        # 密集向量格式（假设前1024维是图像，后1024维是文本）
+        # 预分配float32数组按切片写入，避免拼接时逐元素构建Python列表
+        # 图像部分直接从现有向量读取前1024维，不再先切片生成中间列表
+        combined = np.empty(1024 + len(text_embedding), dtype=np.float32)
+        combined[:1024] = np.fromiter(existing_vectors, dtype=np.float32, count=1024)
+        combined[1024:] = text_embedding
+        updated_vectors = combined.tolist()
+    
+    return PointStruct(
+        id=point_id,  # 使用数字ID
+        vector=updated_vectors,
+        payload=updated_payload
+    )
+
+def _build_description_update_result(
+    payload: Dict[str, Any],
+    text_embedding: List[float]
+) -> Dict[str, Any]:
+    """构建描述更新任务的执行结果"""
+    return {
+        'success': True,
+        'media_id': payload['media_id'],
+        'file_path': payload.get('file_path', payload['media_id']),
+        'new_description': payload['new_description'],
+        'text_embedding_size': len(text_embedding),
+        'updated_at': datetime.now().isoformat()
+    }
+
+async def _rewrite_description_points(
+    qdrant_manager: QdrantManager,
+    updates: List[Tuple[Any, str, List[float]]]
+) -> List[Any]:
+    """
+    密集向量集合的回退路径：读取完整向量后拼接新的文本embedding并整点写回
+    
+    Args:
+        qdrant_manager: Qdrant管理器
+        updates: (点ID, 新描述, 文本embedding) 列表
+    
+    Returns:
+        List: 已更新的点ID列表（未找到的点不包含在内）
+    """
+    existing_points = await qdrant_manager.async_client.retrieve(
+        collection_name=qdrant_manager.collection_name,
+        ids=[point_id for point_id, _, _ in updates],
+        with_payload=True,
+        with_vectors=True
+    )
+    existing_by_key = {str(point.id): point for point in existing_points}
+    
+    points = []
+    updated_ids = []
+    for point_id, new_description, text_embedding in updates:
+        existing_point = existing_by_key.get(str(point_id))
+        if existing_point is None:
+            continue
+        points.append(_build_description_update_point(point_id, existing_point, new_description, text_embedding))
+        updated_ids.append(point_id)
+    
+    if points:
+        await qdrant_manager.async_client.upsert(
+            collection_name=qdrant_manager.collection_name,
+            points=points
+        )
+    
+    return updated_ids
+
+async def handle_description_update_task(payload: Dict[str, Any], services: TaskServices) -> Dict[str, Any]:
     """
     处理描述更新后的embedding更新任务
     
@@ -99,6 +289,7 @@ async def handle_description_update_task(payload: Dict[str, Any]) -> Dict[str, A
             - media_id: 媒体文件的全局ID
             - new_description: 新的描述文本
             - file_path: 文件路径（可选，用于日志）
+        services: 任务处理器依赖的服务实例
     
     Returns:
         Dict: 任务执行结果
@@ -108,95 +299,130 @@ async def handle_description_update_task(payload: Dict[str, Any]) -> Dict[str, A
         new_description = payload['new_description']
         file_path = payload.get('file_path', media_id)
         
-        logger.info(f"开始更新描述embedding: {file_path}")
+        logger.info("开始更新描述embedding: %s", file_path)
         
-        # 获取服务实例
-        embedding_service = get_embedding_service()
-        qdrant_manager = get_qdrant_manager()
+        qdrant_manager = services.qdrant_manager
         
         # 生成新的文本embedding
-        logger.info(f"生成新的文本embedding: {new_description[:50] if new_description else '(空描述)'}...")
-        text_embedding_result = await embedding_service.get_text_embedding(new_description)
-        
-        if not text_embedding_result.get('success'):
-            raise Exception(f"文本embedding生成失败: {text_embedding_result.get('error')}")
-        
-        text_embedding = text_embedding_result['embedding']
-        
-        # 记录是否使用了零向量
-        if text_embedding_result.get('is_zero_vector'):
-            logger.info(f"使用零向量作为文本embedding（描述为空）: {file_path}")
+        text_embedding = await _generate_description_embedding(
+            services.embedding_service, new_description, file_path
+        )
         
         # 更新向量数据库中的文本embedding和描述
-        logger.info(f"更新向量数据库: {media_id}")
+        logger.info("更新向量数据库: %s", media_id)
         
         # 转换全局媒体ID为数字ID（与Qdrant存储格式一致）
-        if isinstance(media_id, str) and not media_id.isdigit():
-            import hashlib
-            # 使用MD5哈希的前7位（28位整数），确保在安全范围内
-            point_id = int(hashlib.md5(media_id.encode()).hexdigest()[:7], 16)
-            logger.info(f"转换字符串ID {media_id} 为数字ID: {point_id}")
-        else:
-            point_id = media_id
-        
-        # 获取现有点的信息
-        existing_points = qdrant_manager.client.retrieve(
-            collection_name=qdrant_manager.collection_name,
-            ids=[point_id],
-            with_payload=True,
-            with_vectors=True
-        )
+        point_id = media_id_to_point_id(media_id)
+        if point_id != media_id:
+            logger.info("转换字符串ID %s 为数字ID: %s", media_id, point_id)
         
-        if not existing_points:
-            raise Exception(f"未找到媒体ID: {media_id} (数字ID: {point_id})")
-        
-        existing_point = existing_points[0]
-        existing_payload = existing_point.payload
-        existing_vectors = existing_point.vector
-        
-        # 更新payload中的描述
-        updated_payload = existing_payload.copy()
-        updated_payload['description'] = new_description
-        
-        # 构建新的向量（保持图像embedding不变，更新文本embedding）
-        if isinstance(existing_vectors, dict):
-            # 命名向量格式
-            updated_vectors = existing_vectors.copy()
-            updated_vectors['text_embedding'] = text_embedding  # 修正字段名
+        if await qdrant_manager.uses_named_vectors():
+            # 命名向量：只更新文本向量和描述，无需读取现有向量
+            await qdrant_manager.update_text_embeddings([(point_id, new_description, text_embedding)])
         else:
-            # 密集向量格式（假设前1024维是图像，后1024维是文本）
-            image_embedding = existing_vectors[:1024]
-            updated_vectors = image_embedding + text_embedding
-        
-        # 更新点
-        qdrant_manager.client.upsert(
-            collection_name=qdrant_manager.collection_name,
-            points=[
-                {
-                    "id": point_id,  # 使用数字ID
-                    "vector": updated_vectors,
-                    "payload": updated_payload
-                }
-            ]
-        )
+            updated_ids = await _rewrite_description_points(
+                qdrant_manager, [(point_id, new_description, text_embedding)]
+            )
+            if not updated_ids:
+                raise Exception(f"未找到媒体ID: {media_id} (数字ID: {point_id})")
         
-        result = {
-            'success': True,
-            'media_id': media_id,
-            'file_path': file_path,
-            'new_description': new_description,
-            'text_embedding_size': len(text_embedding),
-            'updated_at': existing_payload.get('upload_time')
-        }
+        result = _build_description_update_result(payload, text_embedding)
         
-        logger.info(f"描述embedding更新完成: {file_path}")
+        logger.info("描述embedding更新完成: %s", file_path)
         return result
         
     except Exception as e:
-        logger.error(f"更新描述embedding失败: {str(e)}")
+        logger.error("更新描述embedding失败: %s", e)
         raise
 
-async def handle_search_embedding_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_description_update_batch_task(payloads: List[Dict[str, Any]], services: TaskServices) -> List[Any]:
+    """
+    批量处理描述更新后的embedding更新任务
+    同一批的更新通过一次Qdrant写请求完成；同一媒体的多次更新只应用最后一次
+    
+    Args:
+        payloads: 描述更新任务的payload列表（字段同 handle_description_update_task）
+        services: 任务处理器依赖的服务实例
+    
+    Returns:
+        List: 与payloads一一对应的任务执行结果，失败的任务对应Exception实例
+    """
+    logger.info("开始批量更新描述embedding: %s 个任务", len(payloads))
+    
+    qdrant_manager = services.qdrant_manager
+    results: List[Any] = [None] * len(payloads)
+    
+    # 同一媒体按最后一次更新为准（点ID统一转为字符串，兼容数字字符串ID）
+    point_keys = [str(media_id_to_point_id(payload['media_id'])) for payload in payloads]
+    latest: Dict[str, int] = {}
+    for i, key in enumerate(point_keys):
+        latest[key] = i
+    
+    # 并发生成文本embedding（由embedding服务的速率限制器控制实际请求频率）
+    embeddings = await asyncio.gather(
+        *(
+            _generate_description_embedding(
+                services.embedding_service,
+                payloads[i]['new_description'],
+                payloads[i].get('file_path', payloads[i]['media_id'])
+            )
+            for i in latest.values()
+        ),
+        return_exceptions=True
+    )
+    
+    ready: Dict[str, Any] = {}
+    for (key, i), text_embedding in zip(latest.items(), embeddings):
+        if isinstance(text_embedding, Exception):
+            logger.error("更新描述embedding失败: %s", text_embedding)
+            results[i] = text_embedding
+        else:
+            ready[key] = (i, text_embedding)
+    
+    if ready:
+        try:
+            updates = [
+                (media_id_to_point_id(payloads[i]['media_id']), payloads[i]['new_description'], text_embedding)
+                for i, text_embedding in ready.values()
+            ]
+            
+            if await qdrant_manager.uses_named_vectors():
+                # 命名向量：只查询点是否存在（不取向量），避免单个缺失点导致整批写入失败
+                existing_points = await qdrant_manager.async_client.retrieve(
+                    collection_name=qdrant_manager.collection_name,
+                    ids=[point_id for point_id, _, _ in updates],
+                    with_payload=False,
+                    with_vectors=False
+                )
+                existing_keys = {str(point.id) for point in existing_points}
+                updates = [update for update in updates if str(update[0]) in existing_keys]
+                if updates:
+                    await qdrant_manager.update_text_embeddings(updates)
+                updated_keys = {str(point_id) for point_id, _, _ in updates}
+            else:
+                updated_ids = await _rewrite_description_points(qdrant_manager, updates)
+                updated_keys = {str(point_id) for point_id in updated_ids}
+            
+            for key, (i, text_embedding) in ready.items():
+                payload = payloads[i]
+                if key in updated_keys:
+                    results[i] = _build_description_update_result(payload, text_embedding)
+                else:
+                    results[i] = Exception(f"未找到媒体ID: {payload['media_id']} (数字ID: {key})")
+        except Exception as e:
+            logger.error("批量更新描述embedding失败: %s", e)
+            for i, _ in ready.values():
+                results[i] = e
+    
+    # 被同一媒体后续更新覆盖的任务，结果与最后一次更新一致
+    for i, key in enumerate(point_keys):
+        if results[i] is None:
+            results[i] = results[latest[key]]
+    
+    logger.info("批量描述embedding更新完成: %s 个任务", len(payloads))
+    return results
+
+async def handle_search_embedding_task(payload: Dict[str, Any], services: TaskServices) -> Dict[str, Any]:
     """
     处理搜索查询的embedding生成任务（高优先级，使用配置的固定阈值）
     
@@ -204,6 +430,7 @@ async def handle_search_embedding_task(payload: Dict[str, Any]) -> Dict[str, Any
         payload: 包含以下字段的字典
             - query: 搜索查询文本
             - limit: 搜索结果限制
+        services: 任务处理器依赖的服务实例
     
     Returns:
         Dict: 搜索结果
@@ -212,10 +439,9 @@ async def handle_search_embedding_task(payload: Dict[str, Any]) -> Dict[str, Any
         query = payload['query']
         limit = payload.get('limit', 20)
         
-        logger.info(f"开始处理搜索查询: {query}")
+        logger.info("开始处理搜索查询: %s", query)
         
-        # 获取服务实例
-        vector_storage = get_vector_storage_service()
+        vector_storage = services.vector_storage
         
         # 执行搜索（使用配置的固定阈值）
         search_result = await vector_storage.search_by_text(
@@ -234,9 +460,9 @@ async def handle_search_embedding_task(payload: Dict[str, Any]) -> Dict[str, Any
             'results': search_result.get('results', [])
         }
         
-        logger.info(f"搜索查询处理完成: {query} -> {result['total_results']} 个结果")
+        logger.info("搜索查询处理完成: %s -> %s 个结果", query, result['total_results'])
         return result
         
     except Exception as e:
-        logger.error(f"处理搜索查询失败: {str(e)}")
+        logger.error("处理搜索查询失败: %s", e)
         raise 
\ No newline at end of file
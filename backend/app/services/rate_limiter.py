@@ -24,69 +24,86 @@ class RateLimiter:
         """
         self.max_calls = max_calls
         self.time_window = time_window
-        self.calls = deque()  # 存储调用时间戳
+        self.calls = deque()  # 存储调用时间戳（time.monotonic，不受系统时间调整影响）
         self._lock = asyncio.Lock()
         
         logger.info(f"速率限制器初始化: {max_calls}次/{time_window}秒")
     
+    def _evict_expired(self, now: float) -> None:
+        """清理时间窗口之外的调用记录（队首最旧，均摊O(1)）"""
+        cutoff = now - self.time_window
+        while self.calls and self.calls[0] <= cutoff:
+            self.calls.popleft()
+    
+    def _try_acquire(self, now: float) -> float:
+        """
+        尝试记录一次调用（调用方需持有锁）
+        
+        Returns:
+            float: 获得许可时返回0，否则返回距最早调用过期还需等待的秒数
+        """
+        self._evict_expired(now)
+        
+        # 自适应限制器可能调低max_calls，队列中可能暂时多于上限
+        if len(self.calls) >= self.max_calls:
+            return self.calls[-self.max_calls] + self.time_window - now
+        
+        self.calls.append(now)
+        return 0.0
+    
     async def acquire(self) -> bool:
         """
-        获取调用许可
+        获取调用许可（不等待）
         
         Returns:
             bool: 是否获得许可
         """
         async with self._lock:
-            current_time = time.time()
-            
-            # 清理过期的调用记录
-            while self.calls and current_time - self.calls[0] > self.time_window:
-                self.calls.popleft()
-            
-            # 检查是否超出限制
-            if len(self.calls) >= self.max_calls:
-                # 计算需要等待的时间
-                oldest_call = self.calls[0]
-                wait_time = self.time_window - (current_time - oldest_call)
-                
-                if wait_time > 0:
-                    logger.warning(f"速率限制触发，需等待 {wait_time:.2f} 秒")
-                    return False
-            
-            # 记录这次调用
-            self.calls.append(current_time)
-            return True
+            wait_time = self._try_acquire(time.monotonic())
+        
+        if wait_time > 0:
+            logger.warning(f"速率限制触发，需等待 {wait_time:.2f} 秒")
+            return False
+        return True
     
     async def wait_for_permit(self) -> None:
         """
         等待直到获得调用许可
+        按最早调用的过期时间精确休眠，而不是固定间隔轮询
         """
-        while not await self.acquire():
-            # 计算等待时间
-            current_time = time.time()
-            if self.calls:
-                oldest_call = self.calls[0]
-                wait_time = max(1.0, self.time_window - (current_time - oldest_call))
-            else:
-                wait_time = 1.0
+        while True:
+            async with self._lock:
+                wait_time = self._try_acquire(time.monotonic())
+            
+            if wait_time <= 0:
+                return
             
             logger.info(f"等待速率限制解除，等待时间: {wait_time:.2f}秒")
-            await asyncio.sleep(min(wait_time, 5.0))  # 最多等待5秒后重试
+            await asyncio.sleep(wait_time)
+    
+    def get_wait_time(self) -> float:
+        """获取距下一个可用许可的等待时间（秒），不记录调用"""
+        now = time.monotonic()
+        self._evict_expired(now)
+        
+        if len(self.calls) >= self.max_calls:
+            return max(0.0, self.calls[-self.max_calls] + self.time_window - now)
+        return 0.0
     
     def get_status(self) -> dict:
         """获取当前状态"""
-        current_time = time.time()
+        now = time.monotonic()
+        self._evict_expired(now)
         
-        # 清理过期记录
-        while self.calls and current_time - self.calls[0] > self.time_window:
-            self.calls.popleft()
+        # 将单调时钟换算为墙上时间，便于展示
+        reset_in = self.calls[0] + self.time_window - now if self.calls else 0.0
         
         return {
             'current_calls': len(self.calls),
             'max_calls': self.max_calls,
             'time_window': self.time_window,
-            'available_calls': self.max_calls - len(self.calls),
-            'reset_time': self.calls[0] + self.time_window if self.calls else current_time
+            'available_calls': max(0, self.max_calls - len(self.calls)),
+            'reset_time': time.time() + reset_in
         }
 
 class AdaptiveRateLimiter(RateLimiter):
@@ -98,7 +115,7 @@ class AdaptiveRateLimiter(RateLimiter):
         self.original_max_calls = max_calls
         self.error_count = 0
         self.success_count = 0
-        self.last_adjustment = time.time()
+        self.last_adjustment = time.monotonic()
         
     async def record_success(self):
         """记录成功调用"""
@@ -119,7 +136,7 @@ class AdaptiveRateLimiter(RateLimiter):
     
     async def _adjust_rate(self):
         """动态调整速率"""
-        current_time = time.time()
+        current_time = time.monotonic()
         
         # 每分钟调整一次
         if current_time - self.last_adjustment < 60:
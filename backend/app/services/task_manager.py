@@ -5,12 +5,19 @@
 
 import asyncio
 import logging
+from functools import partial
 from app.services.task_queue import get_task_queue, TaskPriority
 from app.services.embedding_task_handlers import (
+    TaskServices,
     handle_upload_embedding_task,
+    handle_upload_embedding_batch_task,
     handle_description_update_task,
+    handle_description_update_batch_task,
     handle_search_embedding_task
 )
+from app.services.embedding_service import get_embedding_service
+from app.services.vector_storage_service import get_vector_storage_service
+from app.database.qdrant_manager import get_qdrant_manager
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +26,7 @@ class TaskManager:
     
     def __init__(self):
         self.task_queue = get_task_queue()
+        self.services: TaskServices = None
         self.is_initialized = False
     
     async def initialize(self):
@@ -28,10 +36,36 @@ class TaskManager:
         
         logger.info("初始化任务管理器...")
         
+        # 一次性创建处理器依赖的服务实例，通过partial绑定到处理器，避免每个任务重复获取
+        self.services = TaskServices(
+            embedding_service=get_embedding_service(),
+            vector_storage=get_vector_storage_service(),
+            qdrant_manager=get_qdrant_manager()
+        )
+        
         # 注册任务处理器
-        self.task_queue.register_handler("upload_embedding", handle_upload_embedding_task)
-        self.task_queue.register_handler("description_update", handle_description_update_task)
-        self.task_queue.register_handler("search_embedding", handle_search_embedding_task)
+        self.task_queue.register_handler(
+            "upload_embedding", partial(handle_upload_embedding_task, services=self.services)
+        )
+        self.task_queue.register_handler(
+            "description_update", partial(handle_description_update_task, services=self.services)
+        )
+        self.task_queue.register_handler(
+            "search_embedding", partial(handle_search_embedding_task, services=self.services)
+        )
+        
+        # 上传embedding和描述更新任务支持批量合并处理
+        self.task_queue.register_batch_handler(
+            "upload_embedding", partial(handle_upload_embedding_batch_task, services=self.services)
+        )
+        self.task_queue.register_batch_handler(
+            "description_update",
+            partial(handle_description_update_batch_task, services=self.services),
+            batch_window=0.05  # 合并50ms内连续到达的描述编辑
+        )
+        
+        # 预热完成后再启动worker，已入队的任务会在预热后开始处理
+        await self._warmup()
         
         # 启动worker进程
         await self.task_queue.start_workers()
@@ -39,6 +73,15 @@ class TaskManager:
         self.is_initialized = True
         logger.info("任务管理器初始化完成")
     
+    async def _warmup(self):
+        """预先建立Qdrant连接，避免首个任务承担初始化开销"""
+        try:
+            # 建立异步客户端连接，同时缓存集合的向量格式
+            await self.services.qdrant_manager.uses_named_vectors()
+            logger.info("任务处理服务预热完成")
+        except Exception as e:
+            logger.warning(f"任务处理服务预热失败，将在首个任务时初始化: {str(e)}")
+    
     async def shutdown(self):
         """关闭任务管理器"""
         if not self.is_initialized:
@@ -54,7 +97,8 @@ class TaskManager:
         file_path: str,
         thumbnail_path: str,
         description: str,
-        extra_metadata: dict
+        extra_metadata: dict,
+        thumbnail_ready: bool = None
     ) -> str:
         """添加文件上传embedding生成任务"""
         return self.task_queue.add_task(
@@ -63,7 +107,8 @@ class TaskManager:
                 "file_path": file_path,
                 "thumbnail_path": thumbnail_path,
                 "description": description,
-                "extra_metadata": extra_metadata
+                "extra_metadata": extra_metadata,
+                "thumbnail_ready": thumbnail_ready
             },
             priority=TaskPriority.NORMAL,
             max_retries=3
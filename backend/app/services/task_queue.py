@@ -5,17 +5,22 @@
 
 import asyncio
 import logging
+import random
+import re
 import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Callable
 from enum import Enum
 from dataclasses import dataclass, field
-from queue import PriorityQueue
+from collections import OrderedDict, deque
 import uuid
-import threading
+from app.services.rate_limiter import get_rate_limiter as get_api_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+# 限流类错误（含embedding服务转换后的中文提示），重试时需等待限流窗口恢复
+_RATE_LIMIT_ERROR = re.compile(r"rate.?limit|throttl|请求过于频繁", re.IGNORECASE)
+
 class TaskPriority(Enum):
     """任务优先级"""
     URGENT = 1      # 搜索查询 - 最高优先级
@@ -44,80 +49,199 @@ class Task:
     status: TaskStatus = TaskStatus.PENDING
     error_message: Optional[str] = None
     result: Optional[Any] = None
+
+class QueueFullError(Exception):
+    """队列积压超过上限，拒绝接收新任务（相当于HTTP 429）"""
+    pass
+
+class TokenBucket:
+    """令牌桶：按固定速率补充令牌，容量即允许的突发请求数"""
+    
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
     
-    def __lt__(self, other):
-        """优先级比较，数值越小优先级越高"""
-        if self.priority.value != other.priority.value:
-            return self.priority.value < other.priority.value
-        # 同优先级按创建时间排序
-        return self.created_at < other.created_at
+    def _refill(self, now: float):
+        """按距上次更新的时间补充令牌"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+    
+    def available(self, now: float) -> float:
+        """当前可用令牌数"""
+        self._refill(now)
+        return self.tokens
+    
+    def take(self, now: float):
+        """消耗一个令牌"""
+        self._refill(now)
+        self.tokens -= 1
+    
+    def wait_time(self, now: float, floor: float = 0.0) -> float:
+        """令牌数补充到 floor+1 所需的时间（秒）"""
+        self._refill(now)
+        return max(0.0, (floor + 1 - self.tokens) / self.refill_per_second)
 
 class GlobalRateLimiter:
-    """全局速率限制器"""
+    """
+    全局速率限制器
+    
+    外层按滑动窗口限制总请求数；内层为每个优先级维护按权重补充的令牌桶，
+    为高优先级预留配额，避免大量上传任务挤占搜索和描述更新的请求额度。
+    """
+    
+    # 各令牌桶占总配额的比例（NORMAL和LOW共用一个桶）
+    BUCKET_SHARES = {
+        TaskPriority.URGENT: 0.3,
+        TaskPriority.HIGH: 0.4,
+        TaskPriority.NORMAL: 0.3,
+    }
+    # 低优先级借用高优先级桶时，需为其保留的令牌比例
+    BORROW_RESERVE = 0.5
     
     def __init__(self, max_requests_per_minute: int = 120):
         self.max_requests_per_minute = max_requests_per_minute
-        self.requests_log = []
-        self.lock = threading.Lock()
+        self.time_window = 60.0
+        # 请求时间戳（time.monotonic），队首最旧
+        # 所有调用都在事件循环线程中进行且不跨越await，无需加锁
+        self.requests_log = deque()
+        self.buckets: Dict[TaskPriority, TokenBucket] = {
+            priority: TokenBucket(
+                capacity=max_requests_per_minute * share,
+                refill_per_second=max_requests_per_minute * share / self.time_window
+            )
+            for priority, share in self.BUCKET_SHARES.items()
+        }
+    
+    def _evict_expired(self, now: float):
+        """清理一分钟前的记录"""
+        cutoff = now - self.time_window
+        while self.requests_log and self.requests_log[0] <= cutoff:
+            self.requests_log.popleft()
+    
+    def _bucket_candidates(self, priority: TaskPriority):
+        """
+        返回该优先级可使用的令牌桶及需保留的令牌数，按使用顺序排列
+        先用自己的桶；高优先级可用尽低优先级的桶，低优先级借用高优先级的桶时需保留一部分令牌
+        """
+        own = priority if priority in self.buckets else TaskPriority.NORMAL
+        candidates = [(self.buckets[own], 0.0)]
+        for other, bucket in self.buckets.items():
+            if other == own:
+                continue
+            floor = bucket.capacity * self.BORROW_RESERVE if other.value < own.value else 0.0
+            candidates.append((bucket, floor))
+        return candidates
+    
+    def _pick_bucket(self, priority: TaskPriority, now: float) -> Optional[TokenBucket]:
+        """选出当前可以扣减令牌的桶，没有时返回None"""
+        for bucket, floor in self._bucket_candidates(priority):
+            if bucket.available(now) >= floor + 1:
+                return bucket
+        return None
         
-    def can_make_request(self) -> bool:
-        """检查是否可以发起请求"""
-        with self.lock:
-            now = datetime.now()
-            # 清理一分钟前的记录
-            cutoff = now - timedelta(minutes=1)
-            self.requests_log = [req_time for req_time in self.requests_log if req_time > cutoff]
-            
-            return len(self.requests_log) < self.max_requests_per_minute
+    def can_make_request(self, priority: Optional[TaskPriority] = None) -> bool:
+        """检查是否可以发起请求（指定优先级时同时检查对应令牌桶）"""
+        now = time.monotonic()
+        self._evict_expired(now)
+        if len(self.requests_log) >= self.max_requests_per_minute:
+            return False
+        return priority is None or self._pick_bucket(priority, now) is not None
     
-    def record_request(self):
-        """记录一次请求"""
-        with self.lock:
-            self.requests_log.append(datetime.now())
+    def record_request(self, priority: Optional[TaskPriority] = None):
+        """记录一次请求（指定优先级时从对应令牌桶扣减）"""
+        now = time.monotonic()
+        self.requests_log.append(now)
+        if priority is not None:
+            bucket = self._pick_bucket(priority, now)
+            if bucket is not None:
+                bucket.take(now)
     
-    def get_wait_time(self) -> float:
+    def get_wait_time(self, priority: Optional[TaskPriority] = None) -> float:
         """获取需要等待的时间（秒）"""
-        with self.lock:
-            if len(self.requests_log) < self.max_requests_per_minute:
-                return 0.0
-            
+        now = time.monotonic()
+        self._evict_expired(now)
+        
+        wait_time = 0.0
+        if len(self.requests_log) >= self.max_requests_per_minute:
             # 计算最早的请求什么时候会过期
-            oldest_request = min(self.requests_log)
-            next_available = oldest_request + timedelta(minutes=1)
-            wait_seconds = (next_available - datetime.now()).total_seconds()
-            return max(0.0, wait_seconds)
+            wait_time = max(0.0, self.requests_log[0] + self.time_window - now)
+        
+        if priority is not None:
+            bucket_wait = min(
+                bucket.wait_time(now, floor) for bucket, floor in self._bucket_candidates(priority)
+            )
+            wait_time = max(wait_time, bucket_wait)
+        
+        return wait_time
     
     def get_status(self) -> Dict[str, Any]:
         """获取速率限制状态"""
-        with self.lock:
-            now = datetime.now()
-            cutoff = now - timedelta(minutes=1)
-            recent_requests = [req for req in self.requests_log if req > cutoff]
-            
-            return {
-                "max_requests_per_minute": self.max_requests_per_minute,
-                "current_requests_count": len(recent_requests),
-                "remaining_requests": max(0, self.max_requests_per_minute - len(recent_requests)),
-                "reset_time": cutoff + timedelta(minutes=1),
-                "can_make_request": len(recent_requests) < self.max_requests_per_minute
+        now = time.monotonic()
+        self._evict_expired(now)
+        current_count = len(self.requests_log)
+        reset_in = self.requests_log[0] + self.time_window - now if self.requests_log else 0.0
+        
+        return {
+            "max_requests_per_minute": self.max_requests_per_minute,
+            "current_requests_count": current_count,
+            "remaining_requests": max(0, self.max_requests_per_minute - current_count),
+            "reset_time": datetime.now() + timedelta(seconds=reset_in),
+            "can_make_request": current_count < self.max_requests_per_minute,
+            "bucket_tokens": {
+                priority.name: round(bucket.available(now), 1) for priority, bucket in self.buckets.items()
             }
+        }
 
 class TaskQueue:
     """任务队列管理器"""
     
     def __init__(self, rate_limiter: GlobalRateLimiter):
-        self.queue = PriorityQueue()
+        # asyncio优先级队列：worker在空队列上阻塞等待，无需轮询
+        # 队列元素为 (优先级, 创建时间, 任务ID)，任务对象只保存在 self.tasks 中
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
         self.rate_limiter = rate_limiter
         self.tasks: Dict[str, Task] = {}  # 任务存储
+        # 各状态任务数和各优先级待处理任务数，状态变化时增量维护
+        self.status_counts: Dict[TaskStatus, int] = {status: 0 for status in TaskStatus}
+        self.pending_by_priority: Dict[TaskPriority, int] = {priority: 0 for priority in TaskPriority}
+        # 已结束（完成/失败）任务的结束时间，按结束先后排列，用于过期清理
+        self.finished_at: "OrderedDict[str, float]" = OrderedDict()
+        self.finished_ttl = 3600  # 已结束任务保留时间（秒）
+        self.cleanup_interval = 60  # 过期任务清理间隔（秒）
+        self.cleanup_task: Optional[asyncio.Task] = None
         self.workers_running = False
         self.worker_tasks: List[asyncio.Task] = []
         self.task_handlers: Dict[str, Callable] = {}
+        self.batch_handlers: Dict[str, Callable] = {}  # 批量任务处理器
+        self.batch_windows: Dict[str, float] = {}  # 批量任务的合并等待窗口（秒）
         self.max_workers = 3  # 最大并发worker数
+        self.max_batch_size = 16  # 单批最多合并的任务数
+        self.retry_base_delay = 1.0  # 重试退避基准延迟（秒），每次重试翻倍
+        self.retry_max_delay = 60.0  # 重试退避最大延迟（秒）
+        self.max_queue_size = 1000  # 队列积压上限，超过后拒绝新的非紧急任务
         
     def register_handler(self, task_type: str, handler: Callable):
         """注册任务处理器"""
         self.task_handlers[task_type] = handler
-        logger.info(f"注册任务处理器: {task_type}")
+        logger.info("注册任务处理器: %s", task_type)
+    
+    def register_batch_handler(self, task_type: str, handler: Callable, batch_window: float = 0.0):
+        """
+        注册批量任务处理器
+        
+        处理器接收payload列表，返回一一对应的结果列表（失败项为Exception实例）。
+        worker会将队列中同类型、同优先级的待处理任务合并后一次性交给该处理器。
+        
+        Args:
+            task_type: 任务类型
+            handler: 批量处理器
+            batch_window: 取到首个任务后等待后续任务到达的时间（秒），用于合并突发请求
+        """
+        self.batch_handlers[task_type] = handler
+        self.batch_windows[task_type] = batch_window
+        logger.info("注册批量任务处理器: %s", task_type)
     
     def add_task(
         self, 
@@ -126,7 +250,15 @@ class TaskQueue:
         priority: TaskPriority = TaskPriority.NORMAL,
         max_retries: int = 3
     ) -> str:
-        """添加任务到队列"""
+        """
+        添加任务到队列
+        
+        Raises:
+            QueueFullError: 队列积压超过上限（URGENT任务不受限制）
+        """
+        if priority != TaskPriority.URGENT and self.queue.qsize() >= self.max_queue_size:
+            raise QueueFullError(f"任务队列已满 ({self.queue.qsize()}/{self.max_queue_size})，请稍后重试")
+        
         task_id = str(uuid.uuid4())
         task = Task(
             task_id=task_id,
@@ -137,9 +269,11 @@ class TaskQueue:
         )
         
         self.tasks[task_id] = task
-        self.queue.put(task)
+        self.status_counts[TaskStatus.PENDING] += 1
+        self.pending_by_priority[priority] += 1
+        self._enqueue(task)
         
-        logger.info(f"添加任务: {task_type} (ID: {task_id}, 优先级: {priority.name})")
+        logger.info("添加任务: %s (ID: %s, 优先级: %s)", task_type, task_id, priority.name)
         return task_id
     
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
@@ -161,25 +295,18 @@ class TaskQueue:
         }
     
     def get_queue_stats(self) -> Dict[str, Any]:
-        """获取队列统计信息"""
-        pending_tasks = [task for task in self.tasks.values() if task.status == TaskStatus.PENDING]
-        processing_tasks = [task for task in self.tasks.values() if task.status == TaskStatus.PROCESSING]
-        completed_tasks = [task for task in self.tasks.values() if task.status == TaskStatus.COMPLETED]
-        failed_tasks = [task for task in self.tasks.values() if task.status == TaskStatus.FAILED]
-        
+        """获取队列统计信息（读取增量维护的计数器，不遍历任务）"""
         # 按优先级统计待处理任务
-        priority_stats = {}
-        for priority in TaskPriority:
-            priority_stats[priority.name] = len([
-                task for task in pending_tasks if task.priority == priority
-            ])
+        priority_stats = {
+            priority.name: count for priority, count in self.pending_by_priority.items()
+        }
         
         return {
             "total_tasks": len(self.tasks),
-            "pending": len(pending_tasks),
-            "processing": len(processing_tasks),
-            "completed": len(completed_tasks),
-            "failed": len(failed_tasks),
+            "pending": self.status_counts[TaskStatus.PENDING],
+            "processing": self.status_counts[TaskStatus.PROCESSING],
+            "completed": self.status_counts[TaskStatus.COMPLETED],
+            "failed": self.status_counts[TaskStatus.FAILED],
             "queue_size": self.queue.qsize(),
             "workers_running": self.workers_running,
             "active_workers": len(self.worker_tasks),
@@ -193,11 +320,13 @@ class TaskQueue:
             return
             
         self.workers_running = True
-        logger.info(f"启动 {self.max_workers} 个worker进程")
+        logger.info("启动 %s 个worker进程", self.max_workers)
         
         for i in range(self.max_workers):
             worker_task = asyncio.create_task(self._worker(f"worker-{i}"))
             self.worker_tasks.append(worker_task)
+        
+        self.cleanup_task = asyncio.create_task(self._cleanup_loop())
     
     async def stop_workers(self):
         """停止worker进程"""
@@ -207,9 +336,13 @@ class TaskQueue:
         self.workers_running = False
         logger.info("停止worker进程...")
         
-        # 取消所有worker任务
+        # 取消所有worker任务和清理任务
         for worker_task in self.worker_tasks:
             worker_task.cancel()
+        if self.cleanup_task:
+            self.cleanup_task.cancel()
+            await asyncio.gather(self.cleanup_task, return_exceptions=True)
+            self.cleanup_task = None
         
         # 等待worker任务完成
         if self.worker_tasks:
@@ -220,37 +353,35 @@ class TaskQueue:
     
     async def _worker(self, worker_name: str):
         """Worker进程"""
-        logger.info(f"{worker_name} 启动")
+        logger.info("%s 启动", worker_name)
         
         while self.workers_running:
             try:
-                # 检查速率限制
-                if not self.rate_limiter.can_make_request():
-                    wait_time = self.rate_limiter.get_wait_time()
-                    if wait_time > 0:
-                        logger.info(f"{worker_name} 等待速率限制: {wait_time:.1f}秒")
-                        await asyncio.sleep(min(wait_time, 10))  # 最多等待10秒
-                        continue
-                
-                # 获取任务（非阻塞）
-                try:
-                    task = self.queue.get_nowait()
-                except:
-                    # 队列为空，等待一会
-                    await asyncio.sleep(1)
+                # 获取任务（队列为空时阻塞等待）
+                task = self._resolve_task(await self.queue.get())
+                if task is None:
                     continue
                 
-                # 检查任务是否还有效
-                if task.task_id not in self.tasks:
+                # 检查速率限制
+                while not self.rate_limiter.can_make_request(task.priority):
+                    wait_time = self.rate_limiter.get_wait_time(task.priority)
+                    if wait_time <= 0:
+                        break
+                    logger.info("%s 等待速率限制: %.1f秒", worker_name, wait_time)
+                    await asyncio.sleep(min(wait_time, 10))  # 最多等待10秒
+                
+                # 支持批量处理的任务类型，合并同类待处理任务后一次性处理
+                if task.task_type in self.batch_handlers:
+                    await self._process_batch(worker_name, await self._collect_batch(task))
                     continue
                 
                 # 更新任务状态
-                task.status = TaskStatus.PROCESSING
-                logger.info(f"{worker_name} 处理任务: {task.task_type} (ID: {task.task_id})")
+                self._set_status(task, TaskStatus.PROCESSING)
+                logger.info("%s 处理任务: %s (ID: %s)", worker_name, task.task_type, task.task_id)
                 
                 try:
                     # 记录请求
-                    self.rate_limiter.record_request()
+                    self.rate_limiter.record_request(task.priority)
                     
                     # 执行任务
                     handler = self.task_handlers.get(task.task_type)
@@ -258,36 +389,156 @@ class TaskQueue:
                         raise Exception(f"未找到任务处理器: {task.task_type}")
                     
                     result = await handler(task.payload)
-                    
-                    # 任务成功
-                    task.status = TaskStatus.COMPLETED
-                    task.result = result
-                    logger.info(f"{worker_name} 任务完成: {task.task_id}")
+                    self._complete_task(worker_name, task, result)
                     
                 except Exception as e:
-                    # 任务失败
-                    error_msg = str(e)
-                    task.error_message = error_msg
-                    task.retry_count += 1
-                    
-                    if task.retry_count <= task.max_retries:
-                        # 重试
-                        task.status = TaskStatus.PENDING
-                        self.queue.put(task)
-                        logger.warning(f"{worker_name} 任务重试 ({task.retry_count}/{task.max_retries}): {task.task_id} - {error_msg}")
-                    else:
-                        # 达到最大重试次数，标记为失败
-                        task.status = TaskStatus.FAILED
-                        logger.error(f"{worker_name} 任务失败: {task.task_id} - {error_msg}")
+                    self._fail_task(worker_name, task, e)
                 
             except asyncio.CancelledError:
-                logger.info(f"{worker_name} 被取消")
+                logger.info("%s 被取消", worker_name)
                 break
             except Exception as e:
-                logger.error(f"{worker_name} 异常: {str(e)}")
+                logger.error("%s 异常: %s", worker_name, e)
                 await asyncio.sleep(1)
         
-        logger.info(f"{worker_name} 停止")
+        logger.info("%s 停止", worker_name)
+    
+    async def _collect_batch(self, first_task: Task) -> List[Task]:
+        """
+        从队列中取出与首个任务同类型、同优先级的待处理任务组成一批
+        每个任务入批前检查并记录一次速率限制，批大小不超过当前可用的请求配额
+        """
+        batch = [first_task]
+        # 首个任务已由worker完成速率限制检查
+        self.rate_limiter.record_request(first_task.priority)
+        
+        # 等待合并窗口，让突发到达的同类任务进入同一批
+        batch_window = self.batch_windows.get(first_task.task_type, 0.0)
+        if batch_window > 0:
+            await asyncio.sleep(batch_window)
+        
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            
+            task = self._resolve_task(item)
+            if task is None:
+                continue
+            
+            if task.task_type != first_task.task_type or task.priority != first_task.priority:
+                # 队列按优先级和创建时间排序，遇到不同类的任务即放回并停止合并
+                self.queue.put_nowait(item)
+                break
+            
+            if not self.rate_limiter.can_make_request(task.priority):
+                # 配额已用尽，剩余任务留在队列中等待下一轮
+                self.queue.put_nowait(item)
+                break
+            
+            self.rate_limiter.record_request(task.priority)
+            batch.append(task)
+        
+        return batch
+    
+    async def _process_batch(self, worker_name: str, batch: List[Task]):
+        """使用批量处理器执行一批任务，并分别更新每个任务的状态"""
+        task_type = batch[0].task_type
+        logger.info("%s 批量处理任务: %s x %s", worker_name, task_type, len(batch))
+        
+        # 速率限制已在组批时逐个记录
+        for task in batch:
+            self._set_status(task, TaskStatus.PROCESSING)
+        
+        try:
+            results = await self.batch_handlers[task_type]([task.payload for task in batch])
+            if len(results) != len(batch):
+                raise Exception(f"批量处理器返回结果数量不匹配: {len(results)} != {len(batch)}")
+        except Exception as e:
+            results = [e] * len(batch)
+        
+        for task, result in zip(batch, results):
+            if isinstance(result, Exception):
+                self._fail_task(worker_name, task, result)
+            else:
+                self._complete_task(worker_name, task, result)
+    
+    def _enqueue(self, task: Task):
+        """将任务以 (优先级, 创建时间, 任务ID) 的形式放入优先级队列"""
+        self.queue.put_nowait((task.priority.value, task.created_at, task.task_id))
+    
+    def _resolve_task(self, item: tuple) -> Optional[Task]:
+        """根据队列元素取出任务，已清理或已取消的任务返回None"""
+        task = self.tasks.get(item[2])
+        if task is None or task.status == TaskStatus.CANCELLED:
+            return None
+        return task
+    
+    def _set_status(self, task: Task, status: TaskStatus):
+        """更新任务状态并同步维护计数器"""
+        self.status_counts[task.status] -= 1
+        self.status_counts[status] += 1
+        if task.status == TaskStatus.PENDING:
+            self.pending_by_priority[task.priority] -= 1
+        if status == TaskStatus.PENDING:
+            self.pending_by_priority[task.priority] += 1
+        task.status = status
+        
+        if status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+            self.finished_at[task.task_id] = time.monotonic()
+    
+    def _evict_finished_tasks(self, now: float) -> int:
+        """清理结束时间超过保留期的任务，返回清理数量"""
+        evicted = 0
+        while self.finished_at:
+            task_id, finished_at = next(iter(self.finished_at.items()))
+            if now - finished_at < self.finished_ttl:
+                break
+            self.finished_at.popitem(last=False)
+            task = self.tasks.pop(task_id, None)
+            if task is not None:
+                self.status_counts[task.status] -= 1
+                evicted += 1
+        return evicted
+    
+    async def _cleanup_loop(self):
+        """定期清理过期的已结束任务，避免任务记录无限增长"""
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            evicted = self._evict_finished_tasks(time.monotonic())
+            if evicted:
+                logger.info("清理过期任务记录: %s 个", evicted)
+    
+    def _complete_task(self, worker_name: str, task: Task, result: Any):
+        """标记任务成功"""
+        self._set_status(task, TaskStatus.COMPLETED)
+        task.result = result
+        logger.info("%s 任务完成: %s", worker_name, task.task_id)
+    
+    def _fail_task(self, worker_name: str, task: Task, error: Exception):
+        """记录任务失败，未达到最大重试次数时重新入队"""
+        error_msg = str(error)
+        task.error_message = error_msg
+        task.retry_count += 1
+        
+        if task.retry_count <= task.max_retries:
+            # 指数退避加随机抖动后重新入队，避免失败任务同时重试
+            delay = min(self.retry_base_delay * (2 ** (task.retry_count - 1)), self.retry_max_delay)
+            delay += random.uniform(0, self.retry_base_delay)
+            if _RATE_LIMIT_ERROR.search(error_msg):
+                # 限流错误至少等到速率限制器放出下一个许可
+                delay = max(delay, get_api_rate_limiter().get_wait_time(), self.rate_limiter.get_wait_time(task.priority))
+            self._set_status(task, TaskStatus.PENDING)
+            asyncio.get_running_loop().call_later(delay, self._enqueue, task)
+            logger.warning(
+                "%s 任务重试 (%s/%s, %.1f秒后): %s - %s",
+                worker_name, task.retry_count, task.max_retries, delay, task.task_id, error_msg
+            )
+        else:
+            # 达到最大重试次数，标记为失败
+            self._set_status(task, TaskStatus.FAILED)
+            logger.error("%s 任务失败: %s - %s", worker_name, task.task_id, error_msg)
 
 # 全局实例
 _global_rate_limiter = GlobalRateLimiter(max_requests_per_minute=120)
@@ -5,14 +5,18 @@
 
 import logging
 import time
-from typing import Dict, List, Optional, Any
+from itertools import groupby
+from typing import Dict, Iterator, List, Optional, Any, Set, Tuple
 from datetime import datetime
 
-from app.database.qdrant_manager import get_qdrant_manager
+from app.database.qdrant_manager import get_qdrant_manager, media_id_to_point_id
 from app.services.embedding_service import get_embedding_service
 from app.models.search_models import EmbeddingData, EmbeddingResponse
 from app.core.config import settings
+from app.utils.description_handler import get_media_description
+from app.utils.file_handler import get_media_type, iter_media_files
 import asyncio
+import heapq
 import os
 import json
 from pathlib import Path
@@ -26,6 +30,9 @@ class VectorStorageService:
         """初始化向量存储服务"""
         self.qdrant_manager = get_qdrant_manager()
         self.embedding_service = get_embedding_service()
+        # 向量维度固定，预先构建共享零向量（不可变元组），缺失模态的记录复用同一对象
+        self.vector_dimension = self.embedding_service.vector_dimension
+        self._zero_vector: Tuple[float, ...] = (0.0,) * self.vector_dimension
         logger.info("向量存储服务初始化成功")
     
     async def store_media_embedding(
@@ -60,112 +67,323 @@ class VectorStorageService:
         start_time = time.time()
         
         try:
-            # 检查是否已存在embedding（如果不强制重新生成）
-            if not force_regenerate:
-                existing_info = await self.get_media_embedding_info(media_id)
-                if existing_info:
-                    logger.info(f"媒体文件 {media_id} 的embedding已存在，跳过生成")
-                    return EmbeddingResponse(
-                        success=True,
-                        media_id=media_id,
-                        text_embedding_generated=False,
-                        image_embedding_generated=False,
-                        processing_time=time.time() - start_time,
-                        error_message="Embedding已存在，跳过生成"
-                    )
-            
-            # 生成embedding
-            embedding_result = await self.embedding_service.embed_media_file(file_path, description)
-            
-            if not embedding_result.get('success'):
-                error_msg = ', '.join(embedding_result.get('errors', ['未知错误']))
-                return EmbeddingResponse(
-                    success=False,
-                    media_id=media_id,
-                    text_embedding_generated=False,
-                    image_embedding_generated=False,
-                    processing_time=time.time() - start_time,
-                    error_message=f"Embedding生成失败: {error_msg}"
-                )
-            
-            # 准备元数据
-            metadata = {
-                'global_media_id': media_id,  # 32位全局ID作为主ID
-                'file_path': file_path,
-                'file_name': file_path.split('/')[-1],
-                'file_type': file_type,
-                'file_size': file_size,
-                'upload_time': upload_time,
-                'description': description or '',
-                'tags': tags or [],
-                'last_updated': datetime.now().isoformat(),
-                'embedding_version': '1.0'
-            }
-            
-            # 合并额外的元数据
-            if extra_metadata:
-                metadata.update(extra_metadata)
-            
-            # 确保向量维度正确
-            text_embedding = embedding_result.get('text_embedding')
-            image_embedding = embedding_result.get('image_embedding')
-            
-            # 如果向量为空或None，用零向量填充
-            vector_dim = self.embedding_service.vector_dimension
-            text_embedding_generated = False
-            image_embedding_generated = False
-            
-            if not text_embedding or text_embedding is None:
-                text_embedding = [0.0] * vector_dim
-                logger.info(f"文本embedding为空，使用零向量: {media_id}")
-            else:
-                text_embedding_generated = True
-                
-            if not image_embedding or image_embedding is None:
-                image_embedding = [0.0] * vector_dim
-                logger.info(f"图像embedding为空，使用零向量: {media_id}")
-            else:
-                image_embedding_generated = True
+            record, response = await self._prepare_embedding_record(
+                media_id=media_id,
+                file_path=file_path,
+                file_type=file_type,
+                file_size=file_size,
+                upload_time=upload_time,
+                description=description,
+                tags=tags,
+                force_regenerate=force_regenerate,
+                extra_metadata=extra_metadata,
+                start_time=start_time
+            )
+            if record is None:
+                return response
             
             # 确保即使描述为空也要存储记录到向量数据库
             # 这样后续更新描述时就能找到对应的记录
-            success = await self.qdrant_manager.insert_embedding(
+            success = await self.qdrant_manager.insert_embedding(**record)
+            
+            return self._finalize_embedding_response(response, success, start_time)
+            
+        except Exception as e:
+            logger.error(f"存储媒体文件embedding失败 {media_id}: {str(e)}")
+            return EmbeddingResponse(
+                success=False,
                 media_id=media_id,
-                text_vector=text_embedding,
-                image_vector=image_embedding,
-                metadata=metadata
+                text_embedding_generated=False,
+                image_embedding_generated=False,
+                processing_time=time.time() - start_time,
+                error_message=f"处理异常: {str(e)}"
             )
+    
+    async def store_media_embeddings_batch(
+        self,
+        media_files: List[Dict[str, Any]],
+        max_concurrent: int = 3,
+        upsert_batch_size: Optional[int] = None,
+        upsert_concurrency: int = 2,
+        wait: bool = True
+    ) -> List[EmbeddingResponse]:
+        """
+        批量生成embedding并写入向量数据库
+        生成与写入两阶段流水线执行：生成worker将记录放入队列，写入worker合并为批量upsert，
+        两个阶段各自控制并发
+        
+        Args:
+            media_files: 媒体文件信息列表（字段同 store_media_embedding 的参数）
+            max_concurrent: embedding生成的最大并发数
+            upsert_batch_size: 单次upsert最多写入的记录数，默认使用配置QDRANT_UPSERT_BATCH_SIZE
+            upsert_concurrency: 同时进行的upsert请求数
+            wait: upsert是否等待写入生效，批量导入时可设为False
             
-            if not success:
-                return EmbeddingResponse(
+        Returns:
+            List[EmbeddingResponse]: 与输入顺序一致的处理结果列表
+        """
+        if not media_files:
+            return []
+        
+        start_time = time.time()
+        upsert_batch_size = upsert_batch_size or settings.QDRANT_UPSERT_BATCH_SIZE
+        
+        results: List[Optional[EmbeddingResponse]] = [None] * len(media_files)
+        written = 0
+        
+        # 生成阶段与写入阶段通过有界队列衔接，写入跟不上时生成阶段自动等待
+        ready_queue: asyncio.Queue = asyncio.Queue(maxsize=2 * upsert_batch_size)
+        pending_files = iter(enumerate(media_files))
+        updated_at = datetime.now().isoformat()
+        existing_keys = await self._find_existing_point_keys(media_files)
+        
+        async def prepare_single_media(media_info: Dict[str, Any]):
+            try:
+                force_regenerate = media_info.get('force_regenerate', False)
+                exists = None
+                if existing_keys is not None and not force_regenerate:
+                    exists = str(media_id_to_point_id(media_info['media_id'])) in existing_keys
+                return await self._prepare_embedding_record(
+                    media_id=media_info['media_id'],
+                    file_path=media_info['file_path'],
+                    file_type=media_info['file_type'],
+                    file_size=media_info['file_size'],
+                    upload_time=media_info['upload_time'],
+                    description=media_info.get('description'),
+                    tags=media_info.get('tags'),
+                    force_regenerate=force_regenerate,
+                    extra_metadata=media_info.get('extra_metadata', {}),
+                    start_time=start_time,
+                    exists=exists,
+                    updated_at=updated_at
+                )
+            except Exception as e:
+                logger.error(f"生成媒体文件embedding失败 {media_info.get('media_id')}: {str(e)}")
+                return None, EmbeddingResponse(
                     success=False,
-                    media_id=media_id,
-                    text_embedding_generated=text_embedding_generated,
-                    image_embedding_generated=image_embedding_generated,
+                    media_id=media_info.get('media_id', ''),
+                    text_embedding_generated=False,
+                    image_embedding_generated=False,
                     processing_time=time.time() - start_time,
-                    error_message="向量数据库存储失败"
+                    error_message=f"处理异常: {str(e)}"
                 )
+        
+        async def produce():
+            # 固定数量的生成worker共享文件迭代器，控制embedding API并发
+            for index, media_info in pending_files:
+                record, response = await prepare_single_media(media_info)
+                if record is None:
+                    results[index] = response
+                else:
+                    await ready_queue.put((index, record, response))
+        
+        async def consume():
+            nonlocal written
+            while True:
+                # 等待至少一条记录，再取走此刻已就绪的其他记录组成一批
+                item = await ready_queue.get()
+                if item is None:
+                    return
+                
+                batch = [item]
+                finished = False
+                while len(batch) < upsert_batch_size and not ready_queue.empty():
+                    item = ready_queue.get_nowait()
+                    if item is None:
+                        finished = True
+                        break
+                    batch.append(item)
+                
+                # 写入期间其余文件的embedding生成继续进行
+                success = await self.qdrant_manager.insert_embeddings_batch(
+                    [record for _, record, _ in batch],
+                    wait=wait
+                )
+                for index, _, response in batch:
+                    results[index] = self._finalize_embedding_response(response, success, start_time)
+                if success:
+                    written += len(batch)
+                
+                if finished:
+                    return
+        
+        consumers = [asyncio.create_task(consume()) for _ in range(upsert_concurrency)]
+        try:
+            await asyncio.gather(*(produce() for _ in range(max(1, max_concurrent))))
+            # 每个写入worker收到一个结束标记
+            for _ in consumers:
+                await ready_queue.put(None)
+            await asyncio.gather(*consumers)
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+        
+        logger.info(f"批量存储embedding完成: {written}/{len(media_files)} 条写入向量数据库")
+        return results
+    
+    async def _find_existing_point_keys(self, media_files: List[Dict[str, Any]]) -> Optional[set]:
+        """
+        通过一次retrieve批量查询哪些媒体已有embedding（只查ID，不取payload和向量）
+        
+        Args:
+            media_files: 媒体文件信息列表
             
-            logger.info(f"成功存储媒体文件embedding: {media_id} (文本: {text_embedding_generated}, 图像: {image_embedding_generated})")
-            
-            return EmbeddingResponse(
-                success=True,
-                media_id=media_id,
-                text_embedding_generated=text_embedding_generated,
-                image_embedding_generated=image_embedding_generated,
-                processing_time=time.time() - start_time
+        Returns:
+            set: 已存在的点ID（字符串形式）；查询失败时返回None，由各文件单独查询
+        """
+        point_ids = [
+            media_id_to_point_id(media_info['media_id'])
+            for media_info in media_files
+            if not media_info.get('force_regenerate', False) and media_info.get('media_id')
+        ]
+        if not point_ids:
+            return set()
+        
+        try:
+            points = await self.qdrant_manager.async_client.retrieve(
+                collection_name=self.qdrant_manager.collection_name,
+                ids=point_ids,
+                with_payload=False,
+                with_vectors=False
             )
-            
+            return {str(point.id) for point in points}
         except Exception as e:
-            logger.error(f"存储媒体文件embedding失败 {media_id}: {str(e)}")
-            return EmbeddingResponse(
+            logger.warning(f"批量查询已存在embedding失败，改为逐个查询: {str(e)}")
+            return None
+    
+    async def _prepare_embedding_record(
+        self,
+        media_id: str,
+        file_path: str,
+        file_type: str,
+        file_size: int,
+        upload_time: str,
+        description: Optional[str],
+        tags: Optional[List[str]],
+        force_regenerate: bool,
+        extra_metadata: Optional[Dict[str, Any]],
+        start_time: float,
+        exists: Optional[bool] = None,
+        updated_at: Optional[str] = None
+    ) -> Tuple[Optional[Dict[str, Any]], EmbeddingResponse]:
+        """
+        生成媒体文件的embedding并构建待写入的记录
+        
+        Args:
+            exists: 调用方已批量确认的embedding存在状态，为None时单独查询
+            updated_at: 记录的last_updated时间，批量处理时由调用方统一传入，为None时取当前时间
+        
+        Returns:
+            Tuple: (待写入记录, 处理结果)。跳过或失败时记录为None，处理结果即最终结果
+        """
+        # 检查是否已存在embedding（如果不强制重新生成）
+        if not force_regenerate:
+            if exists is None:
+                exists = await self.get_media_embedding_info(media_id) is not None
+            if exists:
+                logger.info(f"媒体文件 {media_id} 的embedding已存在，跳过生成")
+                return None, EmbeddingResponse(
+                    success=True,
+                    media_id=media_id,
+                    text_embedding_generated=False,
+                    image_embedding_generated=False,
+                    processing_time=time.time() - start_time,
+                    error_message="Embedding已存在，跳过生成"
+                )
+        
+        # 生成embedding
+        embedding_result = await self.embedding_service.embed_media_file(file_path, description)
+        
+        if not embedding_result.get('success'):
+            error_msg = ', '.join(embedding_result.get('errors', ['未知错误']))
+            return None, EmbeddingResponse(
                 success=False,
                 media_id=media_id,
                 text_embedding_generated=False,
                 image_embedding_generated=False,
                 processing_time=time.time() - start_time,
-                error_message=f"处理异常: {str(e)}"
+                error_message=f"Embedding生成失败: {error_msg}"
             )
+        
+        # 准备元数据
+        metadata = {
+            'global_media_id': media_id,  # 32位全局ID作为主ID
+            'file_path': file_path,
+            'file_name': os.path.basename(file_path),
+            'file_type': file_type,
+            'file_size': file_size,
+            'upload_time': upload_time,
+            'description': description or '',
+            'tags': tags or [],
+            'last_updated': updated_at or datetime.now().isoformat(),
+            'embedding_version': '1.0'
+        }
+        
+        # 合并额外的元数据
+        if extra_metadata:
+            metadata.update(extra_metadata)
+        
+        # 确保向量维度正确
+        text_embedding = embedding_result.get('text_embedding')
+        image_embedding = embedding_result.get('image_embedding')
+        
+        # 如果向量为空或None，用零向量填充
+        text_embedding_generated = False
+        image_embedding_generated = False
+        
+        if text_embedding is None or len(text_embedding) == 0:
+            text_embedding = self._zero_vector
+            logger.info(f"文本embedding为空，使用零向量: {media_id}")
+        else:
+            text_embedding_generated = True
+            
+        if image_embedding is None or len(image_embedding) == 0:
+            image_embedding = self._zero_vector
+            logger.info(f"图像embedding为空，使用零向量: {media_id}")
+        else:
+            image_embedding_generated = True
+        
+        record = {
+            'media_id': media_id,
+            'text_vector': text_embedding,
+            'image_vector': image_embedding,
+            'metadata': metadata
+        }
+        return record, EmbeddingResponse(
+            success=True,
+            media_id=media_id,
+            text_embedding_generated=text_embedding_generated,
+            image_embedding_generated=image_embedding_generated,
+            processing_time=time.time() - start_time
+        )
+    
+    def _finalize_embedding_response(
+        self,
+        response: EmbeddingResponse,
+        stored: bool,
+        start_time: float
+    ) -> EmbeddingResponse:
+        """根据向量数据库写入结果生成最终处理结果"""
+        if not stored:
+            return EmbeddingResponse(
+                success=False,
+                media_id=response.media_id,
+                text_embedding_generated=response.text_embedding_generated,
+                image_embedding_generated=response.image_embedding_generated,
+                processing_time=time.time() - start_time,
+                error_message="向量数据库存储失败"
+            )
+        
+        logger.info(f"成功存储媒体文件embedding: {response.media_id} "
+                    f"(文本: {response.text_embedding_generated}, 图像: {response.image_embedding_generated})")
+        
+        return EmbeddingResponse(
+            success=True,
+            media_id=response.media_id,
+            text_embedding_generated=response.text_embedding_generated,
+            image_embedding_generated=response.image_embedding_generated,
+            processing_time=time.time() - start_time
+        )
     
     async def update_media_description(
         self,
@@ -244,32 +462,32 @@ class VectorStorageService:
             logger.error(f"删除媒体文件embedding失败 {media_id}: {str(e)}")
             return False
     
-    async def get_media_embedding_info(self, media_id: str) -> Optional[Dict[str, Any]]:
+    async def get_media_embedding_info(
+        self,
+        media_id: str,
+        with_vectors: bool = False
+    ) -> Optional[Dict[str, Any]]:
         """
         获取媒体文件的embedding信息
         支持通过全局媒体ID或文件ID查找
         
         Args:
             media_id: 媒体文件ID（可以是全局ID或文件ID）
+            with_vectors: 是否同时返回向量（结果中的vectors字段）
             
         Returns:
             Dict: embedding信息，如果不存在则返回None
         """
         try:
             # 方法1：尝试作为全局媒体ID直接查找
-            if isinstance(media_id, str) and not media_id.isdigit():
-                import hashlib
-                # 使用MD5哈希的前7位（28位整数），确保在安全范围内
-                point_id = int(hashlib.md5(media_id.encode()).hexdigest()[:7], 16)
-            else:
-                point_id = media_id
+            point_id = media_id_to_point_id(media_id)
             
-            # 使用retrieve方法直接获取点信息
-            points = self.qdrant_manager.client.retrieve(
+            # 使用retrieve按点ID直接获取（走ID索引，不经过向量检索）
+            points = await self.qdrant_manager.async_client.retrieve(
                 collection_name=self.qdrant_manager.collection_name,
                 ids=[point_id],
                 with_payload=True,
-                with_vectors=False  # 不需要向量数据，只要元数据
+                with_vectors=with_vectors
             )
             
             if points:
@@ -280,21 +498,25 @@ class VectorStorageService:
                     'metadata': point.payload,
                     'exists': True
                 }
+                if with_vectors:
+                    embedding_info['vectors'] = point.vector
                 logger.debug(f"通过全局ID找到媒体文件embedding信息: {media_id}")
                 return embedding_info
             
             # 方法2：如果直接查找失败，尝试通过file_id或file_name搜索
             logger.debug(f"直接查找失败，尝试通过file_id搜索: {media_id}")
             
-            # 使用scroll方法查找所有记录
-            scroll_result = self.qdrant_manager.client.scroll(
-                collection_name=self.qdrant_manager.collection_name,
-                limit=100,
-                with_payload=True,
-                with_vectors=False
-            )
+            # 先按payload索引精确匹配，未命中时再扫描记录做后缀匹配
+            records = await self.qdrant_manager.find_by_payload_value(media_id, with_vectors=with_vectors)
+            if not records:
+                scroll_result = await self.qdrant_manager.async_client.scroll(
+                    collection_name=self.qdrant_manager.collection_name,
+                    limit=100,
+                    with_payload=True,
+                    with_vectors=with_vectors
+                )
+                records = scroll_result[0]
             
-            records = scroll_result[0]
             for record in records:
                 payload = record.payload
                 stored_file_id = payload.get('file_id', '')
@@ -302,7 +524,8 @@ class VectorStorageService:
                 stored_original_name = payload.get('original_name', '')
                 
                 # 尝试多种匹配方式
-                if (stored_file_id == media_id or 
+                if (payload.get('global_media_id') == media_id or
+                    stored_file_id == media_id or 
                     stored_file_name == media_id or 
                     stored_original_name == media_id or
                     stored_file_name.endswith(media_id) or 
@@ -315,6 +538,8 @@ class VectorStorageService:
                         'exists': True,
                         'found_by_file_id': True
                     }
+                    if with_vectors:
+                        embedding_info['vectors'] = record.vector
                     logger.info(f"通过file_id找到媒体文件embedding信息: {media_id} -> {embedding_info['media_id']}")
                     return embedding_info
             
@@ -328,7 +553,7 @@ class VectorStorageService:
     async def batch_store_embeddings(
         self,
         media_files: List[Dict[str, Any]],
-        max_concurrent: int = 3
+        max_concurrent: int = 8
     ) -> List[EmbeddingResponse]:
         """
         批量存储媒体文件embedding
@@ -343,49 +568,14 @@ class VectorStorageService:
         if not media_files:
             return []
         
-        # 创建信号量控制并发数
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
-        async def process_single_media(media_info: Dict[str, Any]) -> EmbeddingResponse:
-            async with semaphore:
-                return await self.store_media_embedding(
-                    media_id=media_info['media_id'],
-                    file_path=media_info['file_path'],
-                    file_type=media_info['file_type'],
-                    file_size=media_info['file_size'],
-                    upload_time=media_info['upload_time'],
-                    description=media_info.get('description'),
-                    tags=media_info.get('tags'),
-                    force_regenerate=media_info.get('force_regenerate', False),
-                    extra_metadata=media_info.get('extra_metadata', {})
-                )
-        
-        # 创建任务列表
-        tasks = [process_single_media(media_info) for media_info in media_files]
-        
-        # 执行批量处理
+        # embedding生成并发进行，生成结果按批合并写入向量数据库
         logger.info(f"开始批量存储 {len(media_files)} 个媒体文件的embedding")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # 处理异常结果
-        processed_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                processed_results.append(EmbeddingResponse(
-                    success=False,
-                    media_id=media_files[i].get('media_id', f'unknown_{i}'),
-                    text_embedding_generated=False,
-                    image_embedding_generated=False,
-                    processing_time=0,
-                    error_message=str(result)
-                ))
-            else:
-                processed_results.append(result)
+        results = await self.store_media_embeddings_batch(media_files, max_concurrent=max_concurrent)
         
-        success_count = sum(1 for r in processed_results if r.success)
+        success_count = sum(1 for r in results if r.success)
         logger.info(f"批量embedding存储完成: {success_count}/{len(media_files)} 成功")
         
-        return processed_results
+        return results
     
     async def get_storage_stats(self) -> Dict[str, Any]:
         """
@@ -402,6 +592,7 @@ class VectorStorageService:
                 'total_embeddings': collection_info.get('points_count', 0),
                 'vectors_count': collection_info.get('vectors_count', 0),
                 'status': collection_info.get('status', 'unknown'),
+                'quantization': collection_info.get('config', {}).get('quantization'),
                 'vector_dimension': self.embedding_service.vector_dimension,
                 'model_info': self.embedding_service.get_model_info()
             }
@@ -439,17 +630,27 @@ class VectorStorageService:
         start_time = time.time()
         all_results = []
         
-        # 分批处理
-        for i in range(0, len(media_files), batch_size):
-            batch = media_files[i:i + batch_size]
-            logger.info(f"处理批次 {i//batch_size + 1}/{(len(media_files) + batch_size - 1)//batch_size}")
-            
-            # 为批次中的每个文件添加强制重新生成标志
-            for media_info in batch:
-                media_info['force_regenerate'] = True
-            
-            batch_results = await self.batch_store_embeddings(batch, max_concurrent=3)
-            all_results.extend(batch_results)
+        # 重建期间暂停HNSW索引，避免每批写入都触发增量索引更新，全部写入后统一建立索引
+        indexing_suspended, previous_threshold = await self.qdrant_manager.suspend_indexing()
+        try:
+            # 分批处理
+            for i in range(0, len(media_files), batch_size):
+                batch = media_files[i:i + batch_size]
+                logger.info(f"处理批次 {i//batch_size + 1}/{(len(media_files) + batch_size - 1)//batch_size}")
+                
+                # 为批次中的每个文件添加强制重新生成标志
+                for media_info in batch:
+                    media_info['force_regenerate'] = True
+                
+                # 中间批次不等待写入生效；最后一批等待生效，由于写入按顺序应用，此时之前的批次也已全部生效
+                is_last_batch = i + batch_size >= len(media_files)
+                batch_results = await self.store_media_embeddings_batch(
+                    batch, max_concurrent=3, wait=is_last_batch
+                )
+                all_results.extend(batch_results)
+        finally:
+            if indexing_suspended:
+                await self.qdrant_manager.resume_indexing(previous_threshold)
         
         # 统计结果
         total_count = len(all_results)
@@ -468,13 +669,70 @@ class VectorStorageService:
             'results': all_results
         }
 
-    async def migrate_existing_descriptions(self, force_regenerate: bool = False) -> Dict[str, Any]:
+    def _iter_migration_chunks(
+        self,
+        force_regenerate: bool,
+        chunk_size: int = 1000
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        分块产出待迁移的媒体文件信息（阻塞操作，每次取下一块都应在线程中调用）
+        流式遍历媒体目录，按目录分组用已存在路径集合查找缩略图，无需逐个检查文件
+        
+        Args:
+            force_regenerate: 是否强制重新生成已存在的embeddings
+            chunk_size: 每块包含的最大文件数
+            
+        Returns:
+            Iterator[List[Dict]]: 媒体文件信息列表（字段同 store_media_embedding 的参数）
+        """
+        chunk = []
+        
+        # iter_media_files逐个目录产出目录项，同一目录的文件连续出现；缩略图与原文件位于同一目录，
+        # 因此只需保留当前目录的路径集合，无需先物化整个媒体库
+        for _, dir_entries in groupby(iter_media_files(), key=lambda entry: os.path.dirname(entry.path)):
+            dir_entries = list(dir_entries)
+            existing_paths = {entry.path for entry in dir_entries}
+            
+            # 目录项来自遍历结果，文件必然存在
+            for entry in dir_entries:
+                media_id = entry.name
+                file_type = get_media_type(entry.name).value
+                stat = entry.stat()
+                
+                # 获取缩略图路径
+                thumbnail_path = self._get_thumbnail_path(entry.path, file_type, existing_paths)
+                
+                # 获取描述（按主键单条查询，无需整体加载描述）
+                description = get_media_description(media_id) or ""
+                
+                chunk.append({
+                    'media_id': media_id,
+                    'file_path': thumbnail_path or entry.path,
+                    'file_type': file_type,
+                    'file_size': stat.st_size,
+                    'upload_time': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                    'description': description,
+                    'force_regenerate': force_regenerate
+                })
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        
+        if chunk:
+            yield chunk
+    
+    async def migrate_existing_descriptions(
+        self,
+        force_regenerate: bool = False,
+        verbose: bool = False
+    ) -> Dict[str, Any]:
         """
         迁移现有描述数据到向量数据库
-        从JSON文件读取描述，结合缩略图生成embeddings
+        遍历媒体目录读取描述，结合缩略图生成embeddings；按块流式处理，内存占用与媒体库规模无关
         
         Args:
             force_regenerate: 是否强制重新生成已存在的embeddings
+            verbose: 是否在结果中返回每个文件的处理详情
             
         Returns:
             Dict: 迁移结果统计
@@ -490,62 +748,15 @@ class VectorStorageService:
         }
         
         try:
-            # 加载现有描述
-            descriptions = load_descriptions()
-            logger.info(f"加载了 {len(descriptions)} 个媒体文件描述")
-            
-            # 获取所有媒体文件
-            media_list_result = list_media_files(page=1, page_size=1000)  # 获取所有文件
-            all_media_files = []
-            
-            # 收集所有页面的媒体文件
-            current_page = 1
+            # 目录遍历、stat和描述查询均为阻塞操作，每块都在线程中生成，不占用事件循环
+            chunks = self._iter_migration_chunks(force_regenerate)
             while True:
-                page_result = list_media_files(page=current_page, page_size=100)
-                if not page_result.items:
+                migration_files = await asyncio.to_thread(next, chunks, None)
+                if migration_files is None:
                     break
-                all_media_files.extend(page_result.items)
-                if len(page_result.items) < 100:  # 最后一页
-                    break
-                current_page += 1
-            
-            logger.info(f"发现 {len(all_media_files)} 个媒体文件")
-            
-            # 准备迁移数据
-            migration_files = []
-            for media_file in all_media_files:
-                media_id = media_file.file_id
-                file_path = os.path.join(MEDIA_ROOT, media_file.relative_path)
-                
-                # 检查文件是否存在
-                if not os.path.exists(file_path):
-                    migration_results['details'].append({
-                        'media_id': media_id,
-                        'status': 'skipped',
-                        'reason': '文件不存在'
-                    })
-                    migration_results['skipped'] += 1
-                    continue
-                
-                # 获取缩略图路径
-                thumbnail_path = self._get_thumbnail_path(file_path, media_file.file_type)
                 
-                # 获取描述
-                description = descriptions.get(media_id, "")
+                migration_results['total_processed'] += len(migration_files)
                 
-                migration_files.append({
-                    'media_id': media_id,
-                    'file_path': thumbnail_path if thumbnail_path and os.path.exists(thumbnail_path) else file_path,
-                    'file_type': media_file.file_type,
-                    'file_size': media_file.file_size,
-                    'upload_time': media_file.create_time.isoformat() if hasattr(media_file, 'create_time') else "",
-                    'description': description,
-                    'force_regenerate': force_regenerate
-                })
-            
-            migration_results['total_processed'] = len(migration_files)
-            
-            if migration_files:
                 # 执行批量处理
                 batch_results = await self.batch_store_embeddings(
                     migration_files,
@@ -553,21 +764,25 @@ class VectorStorageService:
                 )
                 
                 # 统计结果
-                for i, result in enumerate(batch_results):
+                for result in batch_results:
                     if result.success:
                         migration_results['successful'] += 1
-                        migration_results['details'].append({
-                            'media_id': result.media_id,
-                            'status': 'success',
-                            'processing_time': result.processing_time
-                        })
+                        if verbose:
+                            migration_results['details'].append({
+                                'media_id': result.media_id,
+                                'status': 'success',
+                                'processing_time': result.processing_time
+                            })
                     else:
                         migration_results['failed'] += 1
-                        migration_results['details'].append({
-                            'media_id': result.media_id,
-                            'status': 'failed',
-                            'error': result.error_message
-                        })
+                        if verbose:
+                            migration_results['details'].append({
+                                'media_id': result.media_id,
+                                'status': 'failed',
+                                'error': result.error_message
+                            })
+                
+                logger.info(f"数据迁移进度: 已处理 {migration_results['total_processed']} 个文件")
             
             migration_results['processing_time'] = time.time() - start_time
             
@@ -583,8 +798,13 @@ class VectorStorageService:
             migration_results['processing_time'] = time.time() - start_time
             return migration_results
     
-    def _get_thumbnail_path(self, file_path: str, file_type: str) -> Optional[str]:
-        """获取缩略图路径"""
+    def _get_thumbnail_path(
+        self,
+        file_path: str,
+        file_type: str,
+        existing_paths: Optional[Set[str]] = None
+    ) -> Optional[str]:
+        """获取缩略图路径（提供existing_paths时用集合查找代替逐个检查文件）"""
         try:
             file_path_obj = Path(file_path)
             parent_dir = file_path_obj.parent
@@ -595,7 +815,10 @@ class VectorStorageService:
             
             for ext in thumbnail_extensions:
                 thumbnail_path = parent_dir / f"{file_stem}_thumbnail{ext}"
-                if thumbnail_path.exists():
+                if existing_paths is not None:
+                    if str(thumbnail_path) in existing_paths:
+                        return str(thumbnail_path)
+                elif thumbnail_path.exists():
                     return str(thumbnail_path)
             
             # 如果没找到缩略图，对于图片类型返回原文件
@@ -644,50 +867,36 @@ class VectorStorageService:
             text_to_text_threshold = settings.TEXT_TO_TEXT_THRESHOLD  # 文搜文（搜索媒体描述）
             text_to_image_threshold = settings.TEXT_TO_IMAGE_THRESHOLD  # 文搜图（搜索图像内容）
             
-            # 1. 搜索文本模态（使用文搜文阈值）
-            text_results = await self.qdrant_manager.search_by_text(
-                query_vector=query_vector,
-                limit=limit * 2  # 获取更多候选，确保去重后有足够结果
-            )
-            
-            # 2. 搜索图像模态（使用文搜图阈值）
-            image_results = await self.qdrant_manager.search_by_image(
+            # 1-2. 一次批量请求同时搜索文本模态（文搜文阈值）和图像模态（文搜图阈值）
+            text_results, image_results = await self.qdrant_manager.search_text_and_image(
                 query_vector=query_vector,
                 limit=limit * 2,  # 获取更多候选，确保去重后有足够结果
                 search_type="text_to_image"
             )
             
-            # 3. 合并去重结果
-            combined_results = {}
+            # 3. 合并去重结果：只记录(最高分, 来源, 结果)，入选top-k后再构建输出字典
+            combined_scores: Dict[str, Tuple[float, str, Dict[str, Any]]] = {}
             
             # 添加文本搜索结果
             for result in text_results:
-                media_id = result["media_id"]
-                combined_results[media_id] = {
-                    **result,
-                    "search_source": "text_modal",
-                    "final_score": result["score"]
-                }
+                combined_scores[result["media_id"]] = (result["score"], "text_modal", result)
             
             # 添加图像搜索结果（去重）
             for result in image_results:
                 media_id = result["media_id"]
-                if media_id not in combined_results:
-                    combined_results[media_id] = {
-                        **result,
-                        "search_source": "image_modal",
-                        "final_score": result["score"]
-                    }
+                existing = combined_scores.get(media_id)
+                if existing is None:
+                    combined_scores[media_id] = (result["score"], "image_modal", result)
                 else:
                     # 如果已存在，保留更高的分数，并标记为双重匹配
-                    if result["score"] > combined_results[media_id]["final_score"]:
-                        combined_results[media_id]["final_score"] = result["score"]
-                    combined_results[media_id]["search_source"] = "both_modals"
+                    combined_scores[media_id] = (max(existing[0], result["score"]), "both_modals", existing[2])
             
-            # 4. 按分数排序并限制数量
-            final_results = list(combined_results.values())
-            final_results.sort(key=lambda x: x["final_score"], reverse=True)
-            final_results = final_results[:limit]
+            # 4. 按分数取前limit个
+            top_results = heapq.nlargest(limit, combined_scores.values(), key=lambda item: item[0])
+            final_results = [
+                {**result, "search_source": source, "final_score": score}
+                for score, source, result in top_results
+            ]
             
             search_time = time.time() - start_time
             
@@ -731,21 +940,52 @@ class VectorStorageService:
         Returns:
             Dict: 搜索结果
         """
+        start_time = time.time()
+        
         try:
             # 使用图搜图的阈值
             image_search_threshold = settings.IMAGE_SEARCH_THRESHOLD
             
-            # 获取目标媒体的embedding
-            # TODO: 实现通过media_id获取embedding的方法
-            # 目前暂时返回空结果
+            # 按点ID获取目标媒体的embedding
+            embedding_info = await self.get_media_embedding_info(media_id, with_vectors=True)
+            if not embedding_info:
+                return {
+                    'success': False,
+                    'error': f"未找到媒体文件的embedding: {media_id}"
+                }
+            
+            vectors = embedding_info.get('vectors')
+            if not isinstance(vectors, dict):
+                vectors = {}
+            text_vector = vectors.get(self.qdrant_manager.text_vector_name)
+            image_vector = vectors.get(self.qdrant_manager.image_vector_name)
+            # 描述为空时文本向量为零向量，不参与检索
+            if text_vector is not None and not any(text_vector):
+                text_vector = None
+            
+            # 多取一个结果，用于排除目标媒体自身
+            if similarity_type == "text" and text_vector:
+                results = await self.qdrant_manager.search_by_text(text_vector, limit + 1)
+            elif similarity_type == "image" and image_vector:
+                results = await self.qdrant_manager.search_by_image(
+                    image_vector, limit + 1, search_type="image_to_image"
+                )
+            else:
+                results = await self.qdrant_manager.search_multimodal(
+                    text_vector=text_vector,
+                    image_vector=image_vector,
+                    limit=limit + 1
+                )
+            
+            point_id = embedding_info['point_id']
+            results = [result for result in results if result['media_id'] != point_id][:limit]
             
             return {
                 'success': True,
-                'results': [],
-                'search_time': 0,
+                'results': results,
+                'search_time': time.time() - start_time,
                 'media_id': media_id,
-                'threshold_used': image_search_threshold,
-                'message': '相似内容查找功能开发中'
+                'threshold_used': image_search_threshold
             }
             
         except Exception as e:
@@ -818,6 +1058,7 @@ class VectorStorageService:
                 'total_embeddings': stats.get('total_embeddings', 0),
                 'vectors_count': stats.get('vectors_count', 0),
                 'status': stats.get('status', 'unknown'),
+                'quantization': stats.get('quantization'),
                 'vector_dimension': stats.get('vector_dimension', 1024),
                 'model_name': 'multimodal-embedding-v1',
                 'provider': 'Alibaba Cloud DashScope'
@@ -1,42 +1,134 @@
-import json
 import os
-from typing import Dict, Optional
+import sqlite3
+import threading
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional
 
 from app.core.config import MEDIA_ROOT
 
+# 优先使用orjson解析旧版JSON描述文件，不可用时回退到标准库
+try:
+    import orjson
 
-# 描述文件路径
+    def _json_loads(data: bytes):
+        return orjson.loads(data)
+except ImportError:
+    import json
+
+    def _json_loads(data: bytes):
+        return json.loads(data.decode('utf-8'))
+
+
+# 描述存储路径（SQLite），旧版JSON文件仅用于一次性迁移
+DESCRIPTIONS_DB = os.path.join(MEDIA_ROOT, "descriptions.db")
 DESCRIPTIONS_FILE = os.path.join(MEDIA_ROOT, "descriptions.json")
 
+# 全局共享连接，多线程访问时通过锁串行化
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
 
-def load_descriptions() -> Dict[str, str]:
+# 进程内描述缓存，按SQLite的data_version失效（其他连接提交写入时该值变化，本连接的写入直接同步到缓存）
+_CACHE: Dict[str, object] = {"version": None, "data": None}
+
+
+def _migrate_json_descriptions(conn: sqlite3.Connection) -> None:
     """
-    加载所有媒体描述
+    将旧版JSON描述文件导入SQLite，完成后重命名原文件避免重复导入
     """
     if not os.path.exists(DESCRIPTIONS_FILE):
-        return {}
-    
+        return
+
     try:
-        with open(DESCRIPTIONS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(DESCRIPTIONS_FILE, 'rb') as f:
+            descriptions = _json_loads(f.read())
+
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO descriptions (media_id, description) VALUES (?, ?)",
+                descriptions.items()
+            )
+        os.replace(DESCRIPTIONS_FILE, DESCRIPTIONS_FILE + ".migrated")
+        print(f"已将 {len(descriptions)} 条描述从JSON迁移到SQLite")
     except Exception as e:
-        print(f"加载描述文件失败: {e}")
-        return {}
+        print(f"迁移描述文件失败: {e}")
+
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    获取描述数据库连接（首次调用时建表并迁移旧版JSON数据），调用方需持有锁
+    """
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(DESCRIPTIONS_DB), exist_ok=True)
+
+        conn = sqlite3.connect(DESCRIPTIONS_DB, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            "media_id TEXT PRIMARY KEY, description TEXT NOT NULL)"
+        )
+        conn.commit()
+
+        _migrate_json_descriptions(conn)
+        _connection = conn
+    return _connection
+
+
+def _cached_descriptions(conn: sqlite3.Connection) -> Dict[str, str]:
+    """
+    返回缓存的全部描述，数据库被其他连接修改过时重新加载，调用方需持有锁
+    """
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _CACHE["data"] is None or _CACHE["version"] != version:
+        rows = conn.execute("SELECT media_id, description FROM descriptions").fetchall()
+        _CACHE["data"] = dict(rows)
+        _CACHE["version"] = version
+    return _CACHE["data"]
+
+
+def _update_cache(media_id: str, description: Optional[str]) -> None:
+    """
+    本连接写入后同步更新缓存（description为None表示删除），调用方需持有锁
+    """
+    data = _CACHE["data"]
+    if data is None:
+        return
+    if description is None:
+        data.pop(media_id, None)
+    else:
+        data[media_id] = description
+
+
+def load_descriptions() -> Mapping[str, str]:
+    """
+    加载所有媒体描述（只读视图，重复调用直接使用进程内缓存）
+    """
+    try:
+        with _lock:
+            return MappingProxyType(_cached_descriptions(_get_connection()))
+    except Exception as e:
+        print(f"加载描述失败: {e}")
+        return MappingProxyType({})
 
 
 def save_descriptions(descriptions: Dict[str, str]) -> bool:
     """
-    保存所有媒体描述
+    保存所有媒体描述（整体替换现有描述）
     """
     try:
-        # 确保目录存在
-        os.makedirs(os.path.dirname(DESCRIPTIONS_FILE), exist_ok=True)
-        
-        with open(DESCRIPTIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(descriptions, f, ensure_ascii=False, indent=2)
+        with _lock:
+            conn = _get_connection()
+            with conn:
+                conn.execute("DELETE FROM descriptions")
+                conn.executemany(
+                    "INSERT INTO descriptions (media_id, description) VALUES (?, ?)",
+                    descriptions.items()
+                )
+            _CACHE["data"] = dict(descriptions)
         return True
     except Exception as e:
-        print(f"保存描述文件失败: {e}")
+        print(f"保存描述失败: {e}")
         return False
 
 
@@ -44,25 +136,67 @@ def get_media_description(media_id: str) -> Optional[str]:
     """
     获取特定媒体的描述
     """
-    descriptions = load_descriptions()
-    return descriptions.get(media_id)
+    try:
+        with _lock:
+            return _cached_descriptions(_get_connection()).get(media_id)
+    except Exception as e:
+        print(f"读取描述失败: {e}")
+        return None
+
+
+def get_media_descriptions(media_ids: Iterable[str]) -> Dict[str, str]:
+    """
+    批量获取多个媒体的描述（只加锁和校验缓存一次，适用于列表分页）
+
+    Args:
+        media_ids: 媒体ID列表
+
+    Returns:
+        Dict[str, str]: 媒体ID到描述的映射，没有描述的媒体不包含在结果中
+    """
+    try:
+        with _lock:
+            descriptions = _cached_descriptions(_get_connection())
+            return {
+                media_id: descriptions[media_id]
+                for media_id in media_ids
+                if media_id in descriptions
+            }
+    except Exception as e:
+        print(f"读取描述失败: {e}")
+        return {}
 
 
 def set_media_description(media_id: str, description: str) -> bool:
     """
     设置特定媒体的描述
     """
-    descriptions = load_descriptions()
-    descriptions[media_id] = description
-    return save_descriptions(descriptions)
+    try:
+        with _lock:
+            conn = _get_connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO descriptions (media_id, description) VALUES (?, ?)",
+                    (media_id, description)
+                )
+            _update_cache(media_id, description)
+        return True
+    except Exception as e:
+        print(f"保存描述失败: {e}")
+        return False
 
 
 def delete_media_description(media_id: str) -> bool:
     """
     删除特定媒体的描述
     """
-    descriptions = load_descriptions()
-    if media_id in descriptions:
-        del descriptions[media_id]
-        return save_descriptions(descriptions)
-    return True 
\ No newline at end of file
+    try:
+        with _lock:
+            conn = _get_connection()
+            with conn:
+                conn.execute("DELETE FROM descriptions WHERE media_id = ?", (media_id,))
+            _update_cache(media_id, None)
+        return True
+    except Exception as e:
+        print(f"删除描述失败: {e}")
+        return False
@@ -1,12 +1,18 @@
+import asyncio
+import io
+import multiprocessing
 import os
 import shutil
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
 
-import aiofiles
+from blake3 import blake3
 from fastapi import UploadFile
-from PIL import Image, UnidentifiedImageError
 
 # 导入HEIF支持
 try:
@@ -16,24 +22,91 @@ try:
 except ImportError:
     HEIF_SUPPORTED = False
 
-from app.core.config import PHOTOS_DIR, VIDEOS_DIR, settings, MEDIA_ROOT
+from app.core.config import PHOTOS_DIR, VIDEOS_DIR, MEDIA_ROOT
 from app.schemas.media import MediaType
-from app.utils.media_processor import create_thumbnail, create_video_thumbnail
-from app.utils.description_handler import get_media_description, delete_media_description
+from app.utils.media_processor import (
+    create_thumbnail,
+    create_video_thumbnail,
+    ensure_directory,
+    forget_directory,
+    get_image_dimensions,
+    is_heif_file
+)
+from app.utils.description_handler import (
+    get_media_description,
+    get_media_descriptions,
+    delete_media_description
+)
+from app.utils.media_index import (
+    EXTENSION_MEDIA_TYPES,
+    find_indexed_paths,
+    index_media_file,
+    query_media_index,
+    unindex_media_file
+)
+
+# 保存上传文件时每次复制的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 缩略图目录 -> (目录修改时间, 文件名集合)
+_THUMBNAIL_DIR_CACHE: Dict[str, Tuple[int, frozenset]] = {}
+
+
+def _new_photo_thumbnail_executor() -> ProcessPoolExecutor:
+    """创建照片缩略图进程池"""
+    return ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, 4),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+# 缩略图后台生成执行器（照片用进程池，视频用线程池，工作进程/线程在首次提交时才创建），以及正在生成中的任务 {文件路径: Future}
+# 照片进程池损坏（工作进程崩溃）后会在锁内重建
+_PHOTO_THUMBNAIL_EXECUTOR = _new_photo_thumbnail_executor()
+_photo_executor_lock = threading.Lock()
+_VIDEO_THUMBNAIL_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="video-thumbnail")
+_pending_thumbnails: Dict[str, Future] = {}
+_pending_thumbnails_lock = threading.Lock()
+
+# 媒体文件读写专用线程池（保存、删除、列表查询），与默认执行器和缩略图生成相互隔离，互不抢占
+_MEDIA_IO_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="media-io")
+
+
+# 媒体文件、缩略图的访问URL前缀，以及视频缩略图未生成时使用的占位图
+MEDIA_URL_PREFIX = "/media/"
+THUMBNAIL_URL_PREFIX = "/thumbnails/"
+VIDEO_PLACEHOLDER_URL = "/app-static/video-thumbnail.png"
+
+# 媒体根目录前缀（带结尾分隔符），用于直接切片得到相对路径
+_MEDIA_ROOT_PREFIX = os.path.join(MEDIA_ROOT, "")
+
+
+async def run_media_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    在媒体文件I/O线程池中执行阻塞函数
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_MEDIA_IO_EXECUTOR, partial(func, *args, **kwargs))
+
+
+def shutdown_media_executors() -> None:
+    """
+    关闭媒体相关执行器（应用关闭时调用）：等待文件读写完成，未开始的缩略图任务直接取消（下次列表时会重新提交）
+    """
+    _MEDIA_IO_EXECUTOR.shutdown(wait=True)
+    _VIDEO_THUMBNAIL_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    _PHOTO_THUMBNAIL_EXECUTOR.shutdown(wait=False, cancel_futures=True)
 
 
 def get_media_type(filename: str) -> Optional[MediaType]:
     """
     根据文件扩展名确定媒体类型
     """
-    ext = os.path.splitext(filename.lower())[1]
-    
-    if ext in settings.ALLOWED_PHOTO_EXTENSIONS:
-        return MediaType.PHOTO
-    elif ext in settings.ALLOWED_VIDEO_EXTENSIONS:
-        return MediaType.VIDEO
-    
-    return None
+    # 只对扩展名部分做小写转换
+    i = filename.rfind('.')
+    if i < 0:
+        return None
+    return EXTENSION_MEDIA_TYPES.get(filename[i:].lower())
 
 
 def get_date_directory(media_type: MediaType) -> Tuple[str, str]:
@@ -51,20 +124,35 @@ def get_date_directory(media_type: MediaType) -> Tuple[str, str]:
         raise ValueError(f"不支持的媒体类型: {media_type}")
     
     date_dir = os.path.join(base_dir, today)
-    os.makedirs(date_dir, exist_ok=True)
+    ensure_directory(date_dir)
     
     return base_dir, date_dir
 
 
-def generate_unique_filename(filename: str) -> str:
+def generate_unique_filename(filename: str, attempt: int = 0) -> str:
     """
     生成唯一文件名，避免冲突
+    
+    Args:
+        filename: 原始文件名
+        attempt: 重试序号，同一秒内已存在同名文件时追加在时间戳之后
     """
     name, ext = os.path.splitext(filename)
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    if attempt:
+        return f"{name}_{timestamp}_{attempt}{ext}"
     return f"{name}_{timestamp}{ext}"
 
 
+def _id_digest(data: bytes) -> str:
+    """
+    计算全局媒体ID使用的128位BLAKE3摘要
+    
+    固定使用同一算法、不做回退：ID会根据文件名和上传时间重新计算，算法不同会导致同一文件得到不同的ID
+    """
+    return blake3(data).hexdigest(length=16)
+
+
 def generate_global_media_id(filename: str, upload_time: str) -> str:
     """
     生成全局唯一的32位媒体ID
@@ -77,14 +165,45 @@ def generate_global_media_id(filename: str, upload_time: str) -> str:
     Returns:
         str: 32位十六进制字符串ID
     """
-    import hashlib
-    
     # 结合文件名和上传时间生成唯一标识
     unique_string = f"{filename}_{upload_time}"
     
-    # 生成MD5哈希并取前32位
-    hash_object = hashlib.md5(unique_string.encode())
-    return hash_object.hexdigest()[:32]
+    # 生成128位摘要（32位十六进制）。embedding任务和check_vectors.py会用相同输入重新计算ID，
+    # 因此结果必须稳定，不能随运行环境变化
+    return _id_digest(unique_string.encode())
+
+
+def _write_upload_file(source: BinaryIO, file_path: str) -> int:
+    """
+    将上传文件内容按块复制到目标路径（阻塞操作，应在线程中调用）
+    目标文件以独占方式创建，已存在时抛出FileExistsError，不会覆盖已有文件
+    
+    Returns:
+        int: 写入的字节数
+    """
+    source.seek(0)
+    # 上传内容超过内存阈值时已落盘到临时文件，此时用sendfile在内核中直接复制，不经过用户态缓冲
+    spooled = getattr(source, '_file', source)
+    with open(file_path, "xb") as out_file:
+        if hasattr(os, 'sendfile') and not isinstance(spooled, io.BytesIO):
+            try:
+                in_fd = spooled.fileno()
+                size = os.fstat(in_fd).st_size
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(out_file.fileno(), in_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return offset
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                # 不支持sendfile时回退为按块复制
+                source.seek(0)
+                out_file.seek(0)
+                out_file.truncate()
+        
+        shutil.copyfileobj(source, out_file, UPLOAD_CHUNK_SIZE)
+        return out_file.tell()
 
 
 async def save_upload_file(file: UploadFile, media_type: MediaType) -> Dict:
@@ -93,17 +212,28 @@ async def save_upload_file(file: UploadFile, media_type: MediaType) -> Dict:
     """
     _, date_dir = get_date_directory(media_type)
     
-    # 生成唯一文件名
-    unique_filename = generate_unique_filename(file.filename)
-    file_path = os.path.join(date_dir, unique_filename)
-    
-    # 保存文件
-    async with aiofiles.open(file_path, "wb") as out_file:
-        content = await file.read()
-        await out_file.write(content)
+    # 保存文件：整个复制过程在一次线程池调用中完成，按块读取避免整个文件进入内存
+    attempt = 0
+    dir_recreated = False
+    while True:
+        # 生成唯一文件名
+        unique_filename = generate_unique_filename(file.filename, attempt)
+        file_path = os.path.join(date_dir, unique_filename)
+        try:
+            file_size = await run_media_io(_write_upload_file, file.file, file_path)
+            break
+        except FileExistsError:
+            # 同一秒内上传了同名文件，追加序号后重试，避免覆盖
+            attempt += 1
+        except FileNotFoundError:
+            # 日期目录在本进程记录创建后被外部删除，重新创建后重试一次
+            if dir_recreated:
+                raise
+            forget_directory(date_dir)
+            ensure_directory(date_dir)
+            dir_recreated = True
     
     # 返回文件信息
-    file_size = os.path.getsize(file_path)
     relative_path = os.path.relpath(file_path, MEDIA_ROOT)
     upload_time = datetime.now().isoformat()
     
@@ -111,32 +241,24 @@ async def save_upload_file(file: UploadFile, media_type: MediaType) -> Dict:
     global_media_id = generate_global_media_id(file.filename, upload_time)
     
     # 构建URL
-    original_url = f"/media/{relative_path}"
+    original_url = MEDIA_URL_PREFIX + relative_path
     
     # 构建缩略图URL
     thumbnail_url = None
-    if media_type == MediaType.PHOTO:
-        # 对于HEIC文件，缩略图会被转换为JPEG格式
-        if file_path.lower().endswith(('.heic', '.heif')):
-            thumbnail_rel_path = relative_path.rsplit('.', 1)[0] + '.jpg'
-            thumbnail_url = f"/thumbnails/{thumbnail_rel_path}"
-        else:
-            thumbnail_url = f"/thumbnails/{relative_path}"
-    elif media_type == MediaType.VIDEO:
-        # 视频缩略图使用.jpg扩展名
-        thumbnail_rel_path = relative_path.rsplit('.', 1)[0] + '.jpg'
-        thumbnail_url = f"/thumbnails/{thumbnail_rel_path}"
+    if media_type in (MediaType.PHOTO, MediaType.VIDEO):
+        # HEIC和视频的缩略图会被转换为JPEG格式
+        thumbnail_url = THUMBNAIL_URL_PREFIX + _thumbnail_rel_path(relative_path, media_type)
     
     # 获取图片尺寸（如果是照片）
     width = None
     height = None
     if media_type == MediaType.PHOTO:
-        try:
-            with Image.open(file_path) as img:
-                width, height = img.size
-        except UnidentifiedImageError:
-            # 无法识别的图像格式，忽略
-            pass
+        # 无法识别的图像格式返回None，忽略；HEIC等格式可能需要读取较多数据，放到线程中避免阻塞事件循环
+        dimensions = await run_media_io(get_image_dimensions, file_path)
+        if dimensions:
+            width, height = dimensions
+    
+    await run_media_io(index_media_file, file_path, media_type, width, height)
     
     return {
         "file_name": unique_filename,
@@ -155,6 +277,198 @@ async def save_upload_file(file: UploadFile, media_type: MediaType) -> Dict:
     }
 
 
+def iter_media_files(media_type: Optional[MediaType] = None) -> Iterator[os.DirEntry]:
+    """
+    流式遍历所有媒体文件（基于os.scandir，不排序不分页，适合全量处理）
+    
+    Args:
+        media_type: 媒体类型，为None时遍历照片和视频
+        
+    Returns:
+        Iterator[os.DirEntry]: 受支持媒体文件的目录项
+    """
+    if media_type == MediaType.PHOTO:
+        pending_dirs = [PHOTOS_DIR]
+    elif media_type == MediaType.VIDEO:
+        pending_dirs = [VIDEOS_DIR]
+    else:
+        pending_dirs = [PHOTOS_DIR, VIDEOS_DIR]
+    
+    while pending_dirs:
+        try:
+            with os.scandir(pending_dirs.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.is_file() and get_media_type(entry.name):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def _rebuild_photo_executor(broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+    """
+    照片缩略图进程池损坏（工作进程崩溃、被OOM终止等）后重建，返回当前可用的进程池
+    多个线程同时发现损坏时只重建一次
+    
+    Args:
+        broken: 发现已损坏的进程池
+    """
+    global _PHOTO_THUMBNAIL_EXECUTOR
+    with _photo_executor_lock:
+        if _PHOTO_THUMBNAIL_EXECUTOR is broken:
+            print("照片缩略图进程池已损坏，重新创建")
+            broken.shutdown(wait=False, cancel_futures=True)
+            _PHOTO_THUMBNAIL_EXECUTOR = _new_photo_thumbnail_executor()
+        return _PHOTO_THUMBNAIL_EXECUTOR
+
+
+def _submit_photo_thumbnail(file_path: str) -> Future:
+    """
+    向进程池提交照片缩略图任务，进程池已损坏时重建后重试一次
+    """
+    executor = _PHOTO_THUMBNAIL_EXECUTOR
+    try:
+        future = executor.submit(create_thumbnail, file_path)
+    except BrokenProcessPool:
+        executor = _rebuild_photo_executor(executor)
+        future = executor.submit(create_thumbnail, file_path)
+    future.add_done_callback(partial(_photo_thumbnail_done, executor))
+    return future
+
+
+def _photo_thumbnail_done(executor: ProcessPoolExecutor, future: Future) -> None:
+    """
+    照片缩略图任务完成回调：任务因进程池损坏而失败时立即重建，后续任务不受影响
+    """
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        _rebuild_photo_executor(executor)
+
+
+def _thumbnail_done(file_path: str, future: Future) -> None:
+    """
+    缩略图后台任务完成回调：记录异常并移出生成中集合
+    """
+    with _pending_thumbnails_lock:
+        _pending_thumbnails.pop(file_path, None)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        print(f"创建缩略图出错 {file_path}: {error}")
+
+
+def _schedule_thumbnail(file_path: str, media_type: MediaType) -> Optional[Future]:
+    """
+    提交缩略图后台生成任务（同一文件正在生成时直接返回已有任务），不阻塞调用方
+    照片的PIL解码缩放在进程池中并行执行以绕开GIL，视频抽帧由OpenCV释放GIL，使用线程池即可
+    
+    Returns:
+        Optional[Future]: 生成任务，提交失败时返回None
+    """
+    with _pending_thumbnails_lock:
+        future = _pending_thumbnails.get(file_path)
+        if future is not None:
+            return future
+        
+        try:
+            if media_type == MediaType.VIDEO:
+                future = _VIDEO_THUMBNAIL_EXECUTOR.submit(create_video_thumbnail, file_path)
+            else:
+                future = _submit_photo_thumbnail(file_path)
+        except Exception as e:
+            print(f"提交缩略图任务失败 {file_path}: {e}")
+            return None
+        _pending_thumbnails[file_path] = future
+    
+    future.add_done_callback(partial(_thumbnail_done, file_path))
+    return future
+
+
+async def generate_thumbnail(file_path: str, media_type: MediaType) -> bool:
+    """
+    在缩略图执行器中生成缩略图并等待完成（上传时使用，不阻塞事件循环，并发上传共享执行器的并发上限）
+    
+    Args:
+        file_path: 媒体文件完整路径
+        media_type: 媒体类型
+        
+    Returns:
+        bool: 缩略图是否生成成功
+    """
+    future = _schedule_thumbnail(file_path, media_type)
+    if future is None:
+        return False
+    try:
+        return bool(await asyncio.wrap_future(future))
+    except BrokenProcessPool as e:
+        # 进程池在生成过程中损坏（可能由其他文件导致），已在完成回调中重建，重新提交一次
+        print(f"缩略图进程池损坏，重试 {file_path}: {e}")
+        future = _schedule_thumbnail(file_path, media_type)
+        if future is None:
+            return False
+        try:
+            return bool(await asyncio.wrap_future(future))
+        except Exception as e:
+            print(f"创建缩略图失败 {file_path}: {e}")
+            return False
+    except Exception as e:
+        print(f"创建缩略图失败 {file_path}: {e}")
+        return False
+
+
+def _media_rel_path(file_path: str) -> str:
+    """
+    计算媒体文件相对MEDIA_ROOT的路径（索引中的路径均以MEDIA_ROOT开头，直接切片）
+    """
+    if file_path.startswith(_MEDIA_ROOT_PREFIX):
+        return file_path[len(_MEDIA_ROOT_PREFIX):]
+    return os.path.relpath(file_path, MEDIA_ROOT)
+
+
+def _thumbnail_rel_path(rel_path: str, media_type: Optional[MediaType]) -> str:
+    """
+    计算媒体文件对应的缩略图相对路径（HEIC和视频的缩略图为.jpg格式）
+
+    Args:
+        rel_path: 媒体文件相对路径
+        media_type: 媒体类型
+
+    Returns:
+        str: 缩略图相对路径
+    """
+    if media_type == MediaType.VIDEO or is_heif_file(rel_path):
+        return rel_path[:rel_path.rfind('.')] + '.jpg'
+    return rel_path
+
+
+def _thumbnail_exists(thumbnail_path: str, validated_dirs: Optional[set] = None) -> bool:
+    """
+    判断缩略图是否存在（按目录缓存文件名集合，目录修改时间变化时重新扫描）
+    
+    Args:
+        thumbnail_path: 缩略图完整路径
+        validated_dirs: 本次请求中已校验过修改时间的目录集合，同一目录只stat一次
+    """
+    thumbnail_dir, thumbnail_name = os.path.split(thumbnail_path)
+    cached = _THUMBNAIL_DIR_CACHE.get(thumbnail_dir)
+    if cached is not None and validated_dirs is not None and thumbnail_dir in validated_dirs:
+        return thumbnail_name in cached[1]
+    
+    try:
+        dir_mtime_ns = os.stat(thumbnail_dir).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    
+    if validated_dirs is not None:
+        validated_dirs.add(thumbnail_dir)
+    if cached is None or cached[0] != dir_mtime_ns:
+        with os.scandir(thumbnail_dir) as entries:
+            cached = (dir_mtime_ns, frozenset(entry.name for entry in entries))
+        _THUMBNAIL_DIR_CACHE[thumbnail_dir] = cached
+    return thumbnail_name in cached[1]
+
+
 def list_media_files(
     media_type: Optional[MediaType] = None,
     page: int = 1,
@@ -162,114 +476,55 @@ def list_media_files(
     date_dir: Optional[str] = None
 ) -> Dict:
     """
-    列出媒体文件
+    列出媒体文件（基于媒体索引分页，只处理当前页的文件）
     """
     items = []
-    base_dirs = []
     
-    # 确定要搜索的基本目录
-    if media_type == MediaType.PHOTO:
-        base_dirs = [PHOTOS_DIR]
-    elif media_type == MediaType.VIDEO:
-        base_dirs = [VIDEOS_DIR]
-    else:
-        base_dirs = [PHOTOS_DIR, VIDEOS_DIR]
-    
-    all_files = []
-    
-    # 遍历目录收集文件
-    for base_dir in base_dirs:
-        if date_dir:
-            # 如果指定了日期目录，只搜索该目录
-            target_dir = os.path.join(base_dir, date_dir)
-            if os.path.exists(target_dir):
-                for file in os.listdir(target_dir):
-                    file_path = os.path.join(target_dir, file)
-                    if os.path.isfile(file_path):
-                        all_files.append(file_path)
-        else:
-            # 否则搜索所有日期目录
-            for root, _, files in os.walk(base_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    all_files.append(file_path)
+    # 按修改时间排序（最新的在前）并分页
+    rows, total = query_media_index(
+        media_type=media_type,
+        date_dir=date_dir,
+        offset=(page - 1) * page_size,
+        limit=page_size
+    )
     
-    # 按修改时间排序（最新的在前）
-    all_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
+    # 当前页的描述一次性批量读取
+    file_names = [row[0][row[0].rfind(os.sep) + 1:] for row in rows]
+    descriptions = get_media_descriptions(file_names)
     
-    # 分页
-    start_idx = (page - 1) * page_size
-    end_idx = start_idx + page_size
-    files_page = all_files[start_idx:end_idx]
+    # 当前页的文件通常集中在少数几个日期目录中，每个缩略图目录只校验一次
+    validated_dirs: set = set()
     
     # 构建媒体项目列表
-    for file_path in files_page:
-        file_name = os.path.basename(file_path)
-        media_type = get_media_type(file_name)
-        
-        if not media_type:
-            continue  # 跳过不支持的文件类型
-        
-        file_size = os.path.getsize(file_path)
-        file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
+    for file_name, (file_path, mtime, file_size, mtype, width, height) in zip(file_names, rows):
+        media_type = MediaType(mtype)
+        file_mtime = datetime.fromtimestamp(mtime)
         
         # 构建访问URL（相对路径）
-        rel_path = os.path.relpath(file_path, MEDIA_ROOT)
-        url = f"/media/{rel_path}"
+        rel_path = _media_rel_path(file_path)
+        url = MEDIA_URL_PREFIX + rel_path
         
         # 缩略图URL
-        thumbnail_url = None
+        thumbnail_rel_path = _thumbnail_rel_path(rel_path, media_type)
+        thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", thumbnail_rel_path)
+        thumbnail_url = THUMBNAIL_URL_PREFIX + thumbnail_rel_path
         if media_type == MediaType.PHOTO:
-            # 对于HEIC文件，缩略图会被转换为JPEG格式
-            if file_path.lower().endswith(('.heic', '.heif')):
-                # HEIC缩略图使用.jpg扩展名
-                thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
-                thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", thumbnail_rel_path)
-                thumbnail_url = f"/thumbnails/{thumbnail_rel_path}"
-            else:
-                # 其他格式使用原扩展名
-                thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", rel_path)
-                thumbnail_url = f"/thumbnails/{rel_path}"
-            
-            # 如果缩略图不存在则创建
-            if not os.path.exists(thumbnail_path):
-                try:
-                    create_thumbnail(file_path)
-                except Exception as e:
-                    print(f"创建缩略图出错: {e}")
-                    # 创建失败时使用原图
-                    thumbnail_url = url
+            # 如果缩略图不存在则提交后台生成，本次先使用原图
+            if not _thumbnail_exists(thumbnail_path, validated_dirs):
+                _schedule_thumbnail(file_path, media_type)
+                thumbnail_url = url
             
         elif media_type == MediaType.VIDEO:
-            # 视频缩略图使用.jpg扩展名
-            thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
-            thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", thumbnail_rel_path)
-            thumbnail_url = f"/thumbnails/{thumbnail_rel_path}"
-            
-            # 如果缩略图不存在则创建
-            if not os.path.exists(thumbnail_path):
-                try:
-                    create_video_thumbnail(file_path)
-                except Exception as e:
-                    print(f"创建视频缩略图出错: {e}")
-                    # 创建失败时使用默认占位图
-                    thumbnail_url = "/app-static/video-thumbnail.png"
+            # 如果缩略图不存在则提交后台生成，本次先使用默认占位图
+            if not _thumbnail_exists(thumbnail_path, validated_dirs):
+                _schedule_thumbnail(file_path, media_type)
+                thumbnail_url = VIDEO_PLACEHOLDER_URL
         
-        # 图片尺寸（如果是照片）
-        width = None
-        height = None
+        # 图片尺寸已记录在索引中
         duration = None
         
-        if media_type == MediaType.PHOTO:
-            try:
-                with Image.open(file_path) as img:
-                    width, height = img.size
-            except Exception:
-                # 忽略无法处理的图片
-                pass
-        
         # 获取媒体描述
-        description = get_media_description(file_name)
+        description = descriptions.get(file_name)
         
         item = {
             "id": file_name,
@@ -290,59 +545,87 @@ def list_media_files(
     
     return {
         "items": items,
-        "total": len(all_files),
+        "total": total,
         "page": page,
         "page_size": page_size
     }
 
 
+def _remove_file(path: str) -> bool:
+    """
+    删除文件，文件不存在时返回False（直接尝试删除，省去单独的存在性检查）
+    """
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _media_thumbnail_path(file_path: str) -> str:
+    """
+    计算媒体文件对应缩略图的完整路径（HEIC和视频文件的缩略图是.jpg格式）
+    """
+    thumbnail_rel_path = _thumbnail_rel_path(_media_rel_path(file_path), get_media_type(file_path))
+    return os.path.join(MEDIA_ROOT, "thumbnails", thumbnail_rel_path)
+
+
+def _remove_media_files(file_paths: List[str]) -> List[str]:
+    """
+    删除原文件及对应的缩略图并移出媒体索引（阻塞操作，异步调用方应整体放到线程中执行）
+
+    Args:
+        file_paths: 原文件完整路径列表
+
+    Returns:
+        List[str]: 实际删除的项目说明
+    """
+    deleted_items = []
+    for file_path in file_paths:
+        # 删除原文件
+        if _remove_file(file_path):
+            deleted_items.append(f"原文件: {file_path}")
+            print(f"删除原文件: {file_path}")
+        unindex_media_file(file_path)
+        
+        # 删除对应的缩略图
+        thumbnail_path = _media_thumbnail_path(file_path)
+        if _remove_file(thumbnail_path):
+            deleted_items.append(f"缩略图: {thumbnail_path}")
+            print(f"删除缩略图: {thumbnail_path}")
+    return deleted_items
+
+
+def _locate_media_files(file_id: str) -> List[str]:
+    """
+    查找文件名为file_id的媒体文件路径：优先查媒体索引，索引未命中或已过期时回退到目录遍历
+    """
+    indexed_paths = [path for path in find_indexed_paths(file_id) if os.path.isfile(path)]
+    if indexed_paths:
+        return indexed_paths
+    return [entry.path for entry in iter_media_files() if entry.name == file_id]
+
+
 def delete_media_file(file_id: str) -> bool:
     """
     删除媒体文件和对应的缩略图、描述、embedding记录
     """
     try:
         # 查找文件
-        all_files = []
-        base_dirs = [PHOTOS_DIR, VIDEOS_DIR]
-        
-        for base_dir in base_dirs:
-            for root, _, files in os.walk(base_dir):
-                for file in files:
-                    if file == file_id:
-                        file_path = os.path.join(root, file)
-                        all_files.append(file_path)
+        all_files = _locate_media_files(file_id)
         
         if not all_files:
             print(f"文件未找到: {file_id}")
             raise FileNotFoundError(f"文件未找到: {file_id}")
         
         # 通常应该只有一个文件，但以防万一
-        for file_path in all_files:
-            # 删除原文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"删除原文件: {file_path}")
-            
-            # 删除对应的缩略图
-            rel_path = os.path.relpath(file_path, MEDIA_ROOT)
-            
-            # 对于HEIC和视频文件，缩略图是.jpg格式
-            if file_path.lower().endswith(('.heic', '.heif')) or get_media_type(file_path) == MediaType.VIDEO:
-                thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
-            else:
-                thumbnail_rel_path = rel_path
-            
-            thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", thumbnail_rel_path)
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-                print(f"删除缩略图: {thumbnail_path}")
+        _remove_media_files(all_files)
         
         # 删除媒体描述
         delete_media_description(file_id)
         
         # 删除向量数据库中的embedding记录
         try:
-            import asyncio
             from app.services.vector_storage_service import get_vector_storage_service
             
             # 如果在异步上下文中运行，直接调用
@@ -367,9 +650,12 @@ def delete_media_file(file_id: str) -> bool:
         return False
 
 
-async def _delete_embedding_record(file_id: str):
+async def _delete_embedding_record(file_id: str) -> Optional[str]:
     """
     删除向量数据库中的embedding记录（内部辅助函数）
+    
+    Returns:
+        Optional[str]: 成功删除时返回全局媒体ID，否则返回None
     """
     try:
         from app.services.vector_storage_service import get_vector_storage_service
@@ -384,13 +670,15 @@ async def _delete_embedding_record(file_id: str):
             success = await vector_storage.delete_media_embedding(global_media_id)
             if success:
                 print(f"成功删除embedding记录: {file_id} -> {global_media_id}")
-            else:
-                print(f"删除embedding记录失败: {file_id}")
+                return global_media_id
+            print(f"删除embedding记录失败: {file_id}")
         else:
             print(f"未找到对应的embedding记录: {file_id}")
             
     except Exception as e:
+        # 不因为embedding删除失败而中断整个删除过程
         print(f"删除embedding记录异常: {str(e)}")
+    return None
 
 
 async def delete_media_file_async(file_id: str) -> bool:
@@ -400,73 +688,24 @@ async def delete_media_file_async(file_id: str) -> bool:
     """
     try:
         # 查找文件
-        all_files = []
-        base_dirs = [PHOTOS_DIR, VIDEOS_DIR]
-        
-        for base_dir in base_dirs:
-            for root, _, files in os.walk(base_dir):
-                for file in files:
-                    if file == file_id:
-                        file_path = os.path.join(root, file)
-                        all_files.append(file_path)
+        all_files = await run_media_io(_locate_media_files, file_id)
         
         if not all_files:
             print(f"文件未找到: {file_id}")
             raise FileNotFoundError(f"文件未找到: {file_id}")
         
-        deleted_items = []
-        
-        # 通常应该只有一个文件，但以防万一
-        for file_path in all_files:
-            # 删除原文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                deleted_items.append(f"原文件: {file_path}")
-                print(f"删除原文件: {file_path}")
-            
-            # 删除对应的缩略图
-            rel_path = os.path.relpath(file_path, MEDIA_ROOT)
-            
-            # 对于HEIC和视频文件，缩略图是.jpg格式
-            if file_path.lower().endswith(('.heic', '.heif')) or get_media_type(file_path) == MediaType.VIDEO:
-                thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
-            else:
-                thumbnail_rel_path = rel_path
-            
-            thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", thumbnail_rel_path)
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-                deleted_items.append(f"缩略图: {thumbnail_path}")
-                print(f"删除缩略图: {thumbnail_path}")
+        # 文件删除（通常只有一个文件，但以防万一）、描述删除和embedding记录删除互不依赖，并发执行
+        deleted_items, desc_deleted, deleted_media_id = await asyncio.gather(
+            run_media_io(_remove_media_files, all_files),
+            run_media_io(delete_media_description, file_id),
+            _delete_embedding_record(file_id)
+        )
         
-        # 删除媒体描述
-        desc_deleted = delete_media_description(file_id)
         if desc_deleted:
             deleted_items.append(f"描述文件条目: {file_id}")
             print(f"删除描述文件条目: {file_id}")
-        
-        # 删除向量数据库中的embedding记录
-        try:
-            from app.services.vector_storage_service import get_vector_storage_service
-            vector_storage = get_vector_storage_service()
-            
-            # 通过file_id查找对应的embedding记录
-            embedding_info = await vector_storage.get_media_embedding_info(file_id)
-            
-            if embedding_info:
-                # 使用找到的全局媒体ID删除记录
-                global_media_id = embedding_info['media_id']
-                success = await vector_storage.delete_media_embedding(global_media_id)
-                if success:
-                    deleted_items.append(f"Embedding记录: {global_media_id}")
-                    print(f"成功删除embedding记录: {file_id} -> {global_media_id}")
-                else:
-                    print(f"删除embedding记录失败: {file_id}")
-            else:
-                print(f"未找到对应的embedding记录: {file_id}")
-        except Exception as e:
-            print(f"删除embedding记录异常: {str(e)}")
-            # 不因为embedding删除失败而中断整个删除过程
+        if deleted_media_id:
+            deleted_items.append(f"Embedding记录: {deleted_media_id}")
         
         print(f"文件删除完成，共删除项目: {deleted_items}")
         return True
@@ -494,50 +733,37 @@ def find_media_file_by_id(file_id: str) -> Optional[Dict]:
         Dict: 文件信息字典，如果未找到返回None
     """
     try:
-        # 查找文件
-        base_dirs = [PHOTOS_DIR, VIDEOS_DIR]
-        
-        for base_dir in base_dirs:
-            for root, _, files in os.walk(base_dir):
-                for file in files:
-                    if file == file_id:
-                        file_path = os.path.join(root, file)
-                        
-                        # 获取文件信息
-                        file_size = os.path.getsize(file_path)
-                        file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                        media_type = get_media_type(file)
-                        
-                        # 构建相对路径和URL
-                        rel_path = os.path.relpath(file_path, MEDIA_ROOT)
-                        url = f"/media/{rel_path}"
-                        
-                        # 缩略图URL
-                        thumbnail_url = None
-                        if media_type == MediaType.PHOTO:
-                            if file_path.lower().endswith(('.heic', '.heif')):
-                                thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
-                                thumbnail_url = f"/thumbnails/{thumbnail_rel_path}"
-                            else:
-                                thumbnail_url = f"/thumbnails/{rel_path}"
-                        elif media_type == MediaType.VIDEO:
-                            thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
-                            thumbnail_url = f"/thumbnails/{thumbnail_rel_path}"
-                        
-                        # 获取描述
-                        description = get_media_description(file_id)
-                        
-                        return {
-                            "id": file_id,
-                            "name": file,
-                            "type": media_type,
-                            "path": rel_path,
-                            "size": file_size,
-                            "url": url,
-                            "thumbnail_url": thumbnail_url,
-                            "upload_date": file_mtime.isoformat(),
-                            "description": description
-                        }
+        # 查找文件（优先使用媒体索引）
+        for file_path in _locate_media_files(file_id)[:1]:
+            # 获取文件信息
+            stat = os.stat(file_path)
+            file_size = stat.st_size
+            file_mtime = datetime.fromtimestamp(stat.st_mtime)
+            media_type = get_media_type(file_id)
+            
+            # 构建相对路径和URL
+            rel_path = os.path.relpath(file_path, MEDIA_ROOT)
+            url = MEDIA_URL_PREFIX + rel_path
+            
+            # 缩略图URL
+            thumbnail_url = None
+            if media_type in (MediaType.PHOTO, MediaType.VIDEO):
+                thumbnail_url = THUMBNAIL_URL_PREFIX + _thumbnail_rel_path(rel_path, media_type)
+            
+            # 获取描述
+            description = get_media_description(file_id)
+            
+            return {
+                "id": file_id,
+                "name": file_id,
+                "type": media_type,
+                "path": rel_path,
+                "size": file_size,
+                "url": url,
+                "thumbnail_url": thumbnail_url,
+                "upload_date": file_mtime.isoformat(),
+                "description": description
+            }
         
         return None
         
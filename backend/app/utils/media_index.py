@@ -0,0 +1,283 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import MEDIA_ROOT, PHOTOS_DIR, VIDEOS_DIR, settings
+from app.schemas.media import MediaType
+from app.utils.media_processor import get_image_dimensions
+
+# 媒体文件元数据索引（SQLite），列表查询直接按索引分页，无需每次遍历目录
+MEDIA_INDEX_DB = os.path.join(MEDIA_ROOT, ".media_index.sqlite")
+
+# 索引表结构版本（记录在PRAGMA user_version中）
+SCHEMA_VERSION = 2
+
+# 两次目录校验之间的最短间隔（秒），上传和删除会直接写入索引，不依赖目录校验
+REFRESH_INTERVAL = 2.0
+
+_UPSERT_SQL = (
+    "INSERT OR REPLACE INTO media_index (path, dir, name, mtime, size, mtype, w, h) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# 小写扩展名 -> 媒体类型（模块加载时构建，同一扩展名同时出现在两个列表中时按照片处理）
+EXTENSION_MEDIA_TYPES: Dict[str, MediaType] = {
+    **{ext.lower(): MediaType.VIDEO for ext in settings.ALLOWED_VIDEO_EXTENSIONS},
+    **{ext.lower(): MediaType.PHOTO for ext in settings.ALLOWED_PHOTO_EXTENSIONS},
+}
+
+# 全局共享连接，多线程访问时通过锁串行化
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+_last_refresh = 0.0
+
+# 索引内容版本号（每次写入递增），以及按过滤条件缓存的文件总数 {(媒体类型, 日期目录): (版本号, 总数)}
+_version = 0
+_count_cache: Dict[Tuple[Optional[str], Optional[str]], Tuple[int, int]] = {}
+
+
+def _media_type_of(filename: str) -> Optional[MediaType]:
+    """
+    根据文件扩展名确定媒体类型（与file_handler.get_media_type一致，避免循环导入）
+    """
+    i = filename.rfind('.')
+    if i < 0:
+        return None
+    return EXTENSION_MEDIA_TYPES.get(filename[i:].lower())
+
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    获取索引数据库连接（首次调用时建表），调用方需持有锁
+    """
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(MEDIA_INDEX_DB), exist_ok=True)
+
+        conn = sqlite3.connect(MEDIA_INDEX_DB, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # 索引可随时从磁盘重建，表结构版本不一致时直接丢弃旧表
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS media_index")
+            conn.execute("DROP TABLE IF EXISTS media_dirs")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS media_index ("
+            "path TEXT PRIMARY KEY, dir TEXT NOT NULL, name TEXT NOT NULL, mtime REAL NOT NULL, "
+            "size INTEGER NOT NULL, mtype TEXT NOT NULL, w INTEGER, h INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_media_index_mtime ON media_index (mtime DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_media_index_dir ON media_index (dir)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_media_index_name ON media_index (name)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS media_dirs (dir TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL)"
+        )
+        conn.commit()
+        _connection = conn
+    return _connection
+
+
+def _image_size(file_path: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    读取图片尺寸（只解析文件头），无法识别时返回(None, None)
+    """
+    return get_image_dimensions(file_path) or (None, None)
+
+
+def _scan_directory(conn: sqlite3.Connection, dir_path: str, entries: List[os.DirEntry]) -> None:
+    """
+    重新索引单个目录中的媒体文件，只对新增或变化的照片读取尺寸，调用方需持有锁
+    """
+    known = {
+        path: (mtime, size, w, h)
+        for path, mtime, size, w, h in conn.execute(
+            "SELECT path, mtime, size, w, h FROM media_index WHERE dir = ?", (dir_path,)
+        )
+    }
+
+    rows = []
+    for entry in entries:
+        media_type = _media_type_of(entry.name)
+        if not media_type:
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+
+        previous = known.pop(entry.path, None)
+        if previous and previous[0] == stat.st_mtime and previous[1] == stat.st_size:
+            width, height = previous[2], previous[3]
+        elif media_type == MediaType.PHOTO:
+            width, height = _image_size(entry.path)
+        else:
+            width, height = None, None
+        rows.append((entry.path, dir_path, entry.name, stat.st_mtime, stat.st_size, media_type.value, width, height))
+
+    conn.executemany(_UPSERT_SQL, rows)
+    # 剩余的已知路径在目录中已不存在
+    conn.executemany("DELETE FROM media_index WHERE path = ?", ((path,) for path in known))
+
+
+def _bump_version() -> None:
+    """
+    索引内容变化后递增版本号，使缓存的总数失效，调用方需持有锁
+    """
+    global _version
+    _version += 1
+
+
+def _refresh(conn: sqlite3.Connection) -> None:
+    """
+    校验目录修改时间，只重新扫描发生变化的目录，调用方需持有锁
+    """
+    stored_dirs: Dict[str, int] = dict(conn.execute("SELECT dir, mtime_ns FROM media_dirs"))
+    seen_dirs = set()
+    pending_dirs = [PHOTOS_DIR, VIDEOS_DIR]
+
+    with conn:
+        while pending_dirs:
+            dir_path = pending_dirs.pop()
+            try:
+                dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except FileNotFoundError:
+                continue
+
+            seen_dirs.add(dir_path)
+            files = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                else:
+                    files.append(entry)
+
+            # 目录修改时间未变说明没有文件增删，跳过逐个stat
+            if stored_dirs.get(dir_path) != dir_mtime_ns:
+                _scan_directory(conn, dir_path, files)
+                _bump_version()
+                conn.execute(
+                    "INSERT OR REPLACE INTO media_dirs (dir, mtime_ns) VALUES (?, ?)",
+                    (dir_path, dir_mtime_ns)
+                )
+
+        for dir_path in stored_dirs.keys() - seen_dirs:
+            conn.execute("DELETE FROM media_index WHERE dir = ?", (dir_path,))
+            conn.execute("DELETE FROM media_dirs WHERE dir = ?", (dir_path,))
+            _bump_version()
+
+
+def query_media_index(
+    media_type: Optional[MediaType] = None,
+    date_dir: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 20
+) -> Tuple[List[Tuple], int]:
+    """
+    按修改时间倒序分页查询媒体文件（必要时先增量刷新索引）
+
+    Args:
+        media_type: 媒体类型过滤
+        date_dir: 日期目录过滤
+        offset: 起始偏移
+        limit: 返回数量
+
+    Returns:
+        Tuple: ([(path, mtime, size, mtype, w, h), ...], 符合条件的总数)
+    """
+    global _last_refresh
+
+    conditions = []
+    params: List = []
+    if media_type:
+        conditions.append("mtype = ?")
+        params.append(media_type.value)
+    if date_dir:
+        conditions.append("dir IN (?, ?)")
+        params.extend([os.path.join(PHOTOS_DIR, date_dir), os.path.join(VIDEOS_DIR, date_dir)])
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with _lock:
+        conn = _get_connection()
+        now = time.monotonic()
+        if now - _last_refresh >= REFRESH_INTERVAL:
+            _refresh(conn)
+            _last_refresh = now
+
+        # 总数只在索引内容变化后重新统计
+        count_key = (media_type.value if media_type else None, date_dir)
+        cached = _count_cache.get(count_key)
+        if cached is not None and cached[0] == _version:
+            total = cached[1]
+        else:
+            total = conn.execute(f"SELECT COUNT(*) FROM media_index{where}", params).fetchone()[0]
+            _count_cache[count_key] = (_version, total)
+        rows = conn.execute(
+            f"SELECT path, mtime, size, mtype, w, h FROM media_index{where} "
+            "ORDER BY mtime DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+    return rows, total
+
+
+def find_indexed_paths(file_name: str) -> List[str]:
+    """
+    按文件名查找已索引的媒体文件路径（不触发目录校验，调用方需自行确认文件仍存在）
+
+    Args:
+        file_name: 文件名（即file_id）
+
+    Returns:
+        List[str]: 匹配的完整路径列表
+    """
+    try:
+        with _lock:
+            rows = _get_connection().execute(
+                "SELECT path FROM media_index WHERE name = ?", (file_name,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    except Exception as e:
+        print(f"查询媒体索引失败: {e}")
+        return []
+
+
+def index_media_file(
+    file_path: str,
+    media_type: MediaType,
+    width: Optional[int] = None,
+    height: Optional[int] = None
+) -> None:
+    """
+    将新保存的媒体文件写入索引
+    """
+    try:
+        stat = os.stat(file_path)
+        with _lock:
+            conn = _get_connection()
+            with conn:
+                conn.execute(
+                    _UPSERT_SQL,
+                    (file_path, os.path.dirname(file_path), os.path.basename(file_path),
+                     stat.st_mtime, stat.st_size, media_type.value, width, height)
+                )
+            _bump_version()
+    except Exception as e:
+        print(f"更新媒体索引失败: {e}")
+
+
+def unindex_media_file(file_path: str) -> None:
+    """
+    从索引中移除已删除的媒体文件
+    """
+    try:
+        with _lock:
+            conn = _get_connection()
+            with conn:
+                conn.execute("DELETE FROM media_index WHERE path = ?", (file_path,))
+            _bump_version()
+    except Exception as e:
+        print(f"更新媒体索引失败: {e}")
@@ -1,7 +1,10 @@
 import os
+import shutil
+import struct
+import subprocess
 from io import BytesIO
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -9,7 +12,7 @@ from PIL import Image, UnidentifiedImageError
 
 # 导入HEIF支持
 try:
-    from pillow_heif import register_heif_opener
+    from pillow_heif import open_heif, register_heif_opener
     register_heif_opener()
     HEIF_SUPPORTED = True
 except ImportError:
@@ -17,31 +20,73 @@ except ImportError:
 
 from app.core.config import PHOTOS_DIR, MEDIA_ROOT, settings
 
+# 包含图像尺寸的JPEG帧起始标记（SOF0-SOF15，排除DHT/JPG/DAC）
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# 系统ffmpeg路径，不存在时视频缩略图回退到OpenCV抽帧
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+# ffmpeg抽帧超时时间（秒）
+FFMPEG_TIMEOUT = 30
+
+# 本进程已确认存在的目录，避免每次生成缩略图/保存上传时重复调用makedirs
+_CREATED_DIRS: set = set()
+
+# HEIF容器（ISO-BMFF）ftyp中的主品牌，以及允许读取的meta box最大字节数
+_HEIF_BRANDS = frozenset({b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1'})
+_HEIF_META_LIMIT = 4 * 1024 * 1024
+
+
+def is_heif_file(file_path: str) -> bool:
+    """
+    判断是否为HEIC/HEIF文件（只对最后5个字符做小写转换）
+    """
+    return file_path[-5:].lower() in ('.heic', '.heif')
+
+
+def ensure_directory(path: str) -> None:
+    """
+    确保目录存在（本进程内每个目录只调用一次makedirs）
+    """
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
+
+
+def forget_directory(path: str) -> None:
+    """
+    写入失败后移除目录的已创建记录（目录可能已被外部删除），下次使用时重新创建
+    """
+    _CREATED_DIRS.discard(path)
+
 
 def create_thumbnail(file_path: str) -> str:
     """
     为图像创建缩略图
     """
+    # 获取相对路径，构建缩略图路径
+    rel_path = os.path.relpath(file_path, MEDIA_ROOT)
+    thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", rel_path)
+    
     try:
-        # 确保缩略图目录存在
-        thumbnail_dir = os.path.join(MEDIA_ROOT, "thumbnails")
-        os.makedirs(thumbnail_dir, exist_ok=True)
-        
-        # 获取相对路径
-        rel_path = os.path.relpath(file_path, MEDIA_ROOT)
-        
-        # 构建缩略图路径
-        thumbnail_path = os.path.join(thumbnail_dir, rel_path)
-        
-        # 确保缩略图目录存在
-        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        # 确保缩略图目录存在（会同时创建thumbnails根目录）
+        ensure_directory(os.path.dirname(thumbnail_path))
         
         # 特殊处理HEIC文件
-        if file_path.lower().endswith(('.heic', '.heif')):
-            return create_heic_thumbnail(file_path, thumbnail_path)
+        if is_heif_file(file_path):
+            result = create_heic_thumbnail(file_path, thumbnail_path)
+            if not result:
+                forget_directory(os.path.dirname(thumbnail_path))
+            return result
         
         # 处理其他格式的图片
         with Image.open(file_path) as img:
+            # JPEG在解码阶段直接按1/2、1/4、1/8缩小（需在copy触发完整解码前调用），
+            # 保留目标尺寸两倍的余量，与Pillow的thumbnail默认reducing_gap一致，避免影响缩放质量
+            if img.format == 'JPEG':
+                width, height = settings.THUMBNAIL_SIZE
+                img.draft('RGB', (width * 2, height * 2))
+            
             # 其他格式正常处理
             img_copy = img.copy()
             
@@ -63,6 +108,7 @@ def create_thumbnail(file_path: str) -> str:
         return thumbnail_path
         
     except (UnidentifiedImageError, Exception) as e:
+        forget_directory(os.path.dirname(thumbnail_path))
         print(f"创建缩略图失败: {str(e)}")
         import traceback
         print(f"详细错误信息: {traceback.format_exc()}")
@@ -143,10 +189,184 @@ def create_heic_thumbnail(file_path: str, thumbnail_path: str) -> str:
         return ""
 
 
+def _jpeg_dimensions(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """
+    扫描JPEG段标记，读取SOFn段中的尺寸（跳过EXIF等段的内容，不解码图像）
+    """
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # 无长度字段的独立标记
+            continue
+        
+        header = f.read(2)
+        if len(header) < 2:
+            return None
+        length = struct.unpack('>H', header)[0]
+        if marker in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _iter_boxes(data: memoryview) -> Iterator[Tuple[bytes, memoryview]]:
+    """
+    遍历ISO-BMFF数据中的box，产出(box类型, box内容)
+    """
+    offset = 0
+    end = len(data)
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return
+        yield box_type, data[offset + header_size:offset + size]
+        offset += size
+
+
+def _parse_ipma(payload: memoryview, associations: Dict[int, List[int]]) -> None:
+    """
+    解析ipma box（item与属性的关联），属性序号从1开始
+    """
+    version = payload[0]
+    flags = int.from_bytes(payload[1:4], 'big')
+    entry_count = struct.unpack_from('>I', payload, 4)[0]
+    offset = 8
+    for _ in range(entry_count):
+        if version < 1:
+            item_id = struct.unpack_from('>H', payload, offset)[0]
+            offset += 2
+        else:
+            item_id = struct.unpack_from('>I', payload, offset)[0]
+            offset += 4
+        count = payload[offset]
+        offset += 1
+        indices = associations.setdefault(item_id, [])
+        for _ in range(count):
+            if flags & 1:
+                indices.append(struct.unpack_from('>H', payload, offset)[0] & 0x7FFF)
+                offset += 2
+            else:
+                indices.append(payload[offset] & 0x7F)
+                offset += 1
+
+
+def _heif_dimensions(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """
+    读取HEIC/HEIF主图像的ispe属性得到尺寸（irot旋转90/270度时交换宽高），只读取meta box
+    """
+    # 逐个跳过顶层box，直到找到meta
+    f.seek(0)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        if size < header_size:
+            return None
+        if box_type == b'meta':
+            if size > _HEIF_META_LIMIT:
+                return None
+            meta = memoryview(f.read(size - header_size))
+            break
+        f.seek(size - header_size, os.SEEK_CUR)
+    
+    # meta是FullBox，跳过4字节的版本和标志
+    primary_id = None
+    properties: List[Tuple[bytes, memoryview]] = []
+    associations: Dict[int, List[int]] = {}
+    for box_type, payload in _iter_boxes(meta[4:]):
+        if box_type == b'pitm':
+            primary_id = struct.unpack_from('>H' if payload[0] == 0 else '>I', payload, 4)[0]
+        elif box_type == b'iprp':
+            for child_type, child in _iter_boxes(payload):
+                if child_type == b'ipco':
+                    properties = list(_iter_boxes(child))
+                elif child_type == b'ipma':
+                    _parse_ipma(child, associations)
+    if primary_id is None:
+        return None
+    
+    size = None
+    rotation = 0
+    for index in associations.get(primary_id, ()):
+        if 0 < index <= len(properties):
+            prop_type, prop = properties[index - 1]
+            if prop_type == b'ispe':
+                size = struct.unpack_from('>II', prop, 4)
+            elif prop_type == b'irot':
+                rotation = prop[0] & 0x03
+    if size is None:
+        return None
+    
+    width, height = size
+    return (height, width) if rotation % 2 else (width, height)
+
+
+def _parse_image_header(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """
+    从文件头解析JPEG/PNG/WebP/HEIF图片尺寸，无法识别时返回None
+    """
+    head = f.read(30)
+    if head[4:8] == b'ftyp' and head[8:12] in _HEIF_BRANDS:
+        return _heif_dimensions(f)
+    if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    if head[:2] == b'\xff\xd8':
+        return _jpeg_dimensions(f)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP' and len(head) >= 30:
+        chunk = head[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', head[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            b0, b1, b2, b3 = head[21:25]
+            return 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+        if chunk == b'VP8X':
+            return 1 + int.from_bytes(head[24:27], 'little'), 1 + int.from_bytes(head[27:30], 'little')
+    return None
+
+
 def get_image_dimensions(image_path: str) -> Optional[Tuple[int, int]]:
     """
-    获取图片尺寸
+    获取图片尺寸（JPEG/PNG/WebP/HEIF直接解析文件头，解析失败时依次回退到pillow_heif和PIL）
     """
+    try:
+        with open(image_path, 'rb') as f:
+            size = _parse_image_header(f)
+        if size:
+            return size
+    except (OSError, struct.error, IndexError):
+        pass
+    
+    # 文件头无法解析的HEIC交给open_heif读取元数据，不经过Pillow的Image层也不解码像素
+    if HEIF_SUPPORTED and is_heif_file(image_path):
+        try:
+            return open_heif(image_path).size
+        except (ValueError, OSError, RuntimeError):
+            pass
+    
     try:
         with Image.open(image_path) as img:
             return img.size
@@ -154,24 +374,51 @@ def get_image_dimensions(image_path: str) -> Optional[Tuple[int, int]]:
         return None
 
 
+def _ffmpeg_video_thumbnail(file_path: str, thumbnail_path: str) -> bool:
+    """
+    使用ffmpeg抽取第一帧，并在同一管线中缩放、编码为JPEG（按关键帧定位，可使用硬件解码）
+    
+    Returns:
+        bool: 是否成功生成缩略图
+    """
+    width, height = settings.THUMBNAIL_SIZE
+    cmd = [
+        FFMPEG_PATH, '-y', '-loglevel', 'error',
+        '-ss', '0', '-i', file_path,
+        '-an', '-frames:v', '1',
+        '-vf', f"scale='min({width},iw)':'min({height},ih)':force_original_aspect_ratio=decrease",
+        '-q:v', '5',
+        thumbnail_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"ffmpeg抽帧失败: {str(e)}")
+        return False
+    
+    if result.returncode != 0 or not os.path.exists(thumbnail_path):
+        print(f"ffmpeg抽帧失败: {result.stderr.decode(errors='ignore').strip()}")
+        return False
+    return True
+
+
 def create_video_thumbnail(file_path: str) -> str:
     """
     为视频创建缩略图（提取第一帧）
     """
+    # 获取相对路径，构建缩略图路径，将视频扩展名改为.jpg
+    rel_path = os.path.relpath(file_path, MEDIA_ROOT)
+    thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
+    thumbnail_path = os.path.join(MEDIA_ROOT, "thumbnails", thumbnail_rel_path)
+    
     try:
-        # 确保缩略图目录存在
-        thumbnail_dir = os.path.join(MEDIA_ROOT, "thumbnails")
-        os.makedirs(thumbnail_dir, exist_ok=True)
-        
-        # 获取相对路径
-        rel_path = os.path.relpath(file_path, MEDIA_ROOT)
+        # 确保缩略图目录存在（会同时创建thumbnails根目录）
+        ensure_directory(os.path.dirname(thumbnail_path))
         
-        # 构建缩略图路径，将视频扩展名改为.jpg
-        thumbnail_rel_path = rel_path.rsplit('.', 1)[0] + '.jpg'
-        thumbnail_path = os.path.join(thumbnail_dir, thumbnail_rel_path)
-        
-        # 确保缩略图目录存在
-        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        # 优先使用ffmpeg，不可用或失败时回退到OpenCV
+        if FFMPEG_PATH and _ffmpeg_video_thumbnail(file_path, thumbnail_path):
+            print(f"成功创建视频缩略图: {thumbnail_path}")
+            return thumbnail_path
         
         # 使用OpenCV读取视频第一帧
         cap = cv2.VideoCapture(file_path)
@@ -188,31 +435,41 @@ def create_video_thumbnail(file_path: str) -> str:
             print(f"无法读取视频第一帧: {file_path}")
             return ""
         
-        # 将OpenCV的BGR格式转换为PIL的RGB格式
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # 转换为PIL Image
-        pil_image = Image.fromarray(frame_rgb)
+        # 按比例缩小到缩略图尺寸内（INTER_AREA适合缩小，不放大）
+        height, width = frame.shape[:2]
+        scale = min(settings.THUMBNAIL_SIZE[0] / width, settings.THUMBNAIL_SIZE[1] / height)
+        if scale < 1:
+            target_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            frame = cv2.resize(frame, target_size, interpolation=cv2.INTER_AREA)
         
-        # 创建缩略图
-        pil_image.thumbnail(settings.THUMBNAIL_SIZE)
-        
-        # 保存为JPEG格式
-        pil_image.save(thumbnail_path, 'JPEG', quality=85)
+        # 直接由OpenCV将BGR帧编码为JPEG，无需颜色转换和PIL中转
+        if not cv2.imwrite(thumbnail_path, frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85]):
+            forget_directory(os.path.dirname(thumbnail_path))
+            print(f"保存视频缩略图失败: {thumbnail_path}")
+            return ""
         
         print(f"成功创建视频缩略图: {thumbnail_path}")
         
         return thumbnail_path
         
     except Exception as e:
+        forget_directory(os.path.dirname(thumbnail_path))
         print(f"创建视频缩略图失败: {str(e)}")
         return ""
 
 
 def is_valid_image(file_content: bytes) -> bool:
     """
-    验证文件是否为有效图片
+    验证文件是否为有效图片（先按文件头魔数识别常见格式，其他格式交给PIL识别）
     """
+    head = file_content[:16]
+    if (
+        head.startswith((b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a'))
+        or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')
+        or (head[4:8] == b'ftyp' and head[8:12] in _HEIF_BRANDS)
+    ):
+        return True
+    
     try:
         Image.open(BytesIO(file_content))
         return True
@@ -9,11 +9,17 @@
 """
 
 import asyncio
+import errno
 import sys
 import os
 import shutil
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent
@@ -28,7 +34,177 @@ MEDIA_ROOT = '/media'
 PHOTOS_DIR = '/media/photos'
 VIDEOS_DIR = '/media/videos'
 THUMBNAILS_ROOT = '/media/thumbnails'
-DESCRIPTIONS_FILE = '/media/descriptions.json'
+# 描述存储：SQLite数据库（后端运行时持有WAL连接，只能通过SQL清空，不能删除文件）
+DESCRIPTIONS_DB = '/media/descriptions.db'
+# 旧版JSON描述文件（迁移后会被重命名为.migrated）
+DESCRIPTIONS_JSON_FILES = [
+    '/media/descriptions.json',
+    '/media/descriptions.json.migrated',
+]
+# 描述数据库被后端锁定时的等待时间（秒）
+DESCRIPTIONS_DB_TIMEOUT = 10
+
+# 各类文件的扩展名（小写）
+PHOTO_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.heic', '.webp', '.gif', '.bmp'})
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm'})
+THUMBNAIL_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+
+# 遍历时整体跳过的非媒体目录（Qdrant数据、文件系统及桌面环境的系统目录）
+SKIP_DIRS = frozenset({'qdrant', 'lost+found', '.snapshots', '.Trash-1000'})
+
+# 媒体文件扫描结果的缓存时间（秒），同一命令中的多次统计复用一次扫描
+SCAN_CACHE_TTL = 5.0
+
+
+def _scan_tree(
+    root: str,
+    extensions: frozenset,
+    foreign_suffixes: Optional[Set[str]] = None
+) -> Tuple[int, int]:
+    """
+    统计目录树中匹配扩展名的文件数量和总字节数（可选收集不匹配文件的扩展名）
+    """
+    count = 0
+    total_bytes = 0
+    for entry in _iter_entries(root, extensions, foreign_suffixes=foreign_suffixes):
+        count += 1
+        total_bytes += entry.stat(follow_symlinks=False).st_size
+    return count, total_bytes
+
+
+def _unlink_with_size(path: str) -> Optional[int]:
+    """
+    删除文件并返回其大小，文件不存在时返回None（直接尝试，不做单独的存在性检查）
+    """
+    try:
+        size = os.stat(path, follow_symlinks=False).st_size
+        os.unlink(path)
+        return size
+    except FileNotFoundError:
+        return None
+
+
+def _count_descriptions() -> int:
+    """
+    统计描述数据库中的记录数，数据库或表不存在时返回0
+    """
+    if not os.path.exists(DESCRIPTIONS_DB):
+        return 0
+    conn = sqlite3.connect(DESCRIPTIONS_DB, timeout=DESCRIPTIONS_DB_TIMEOUT)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+def _clear_descriptions_db() -> int:
+    """
+    通过SQL清空描述数据库并返回删除的记录数
+    
+    不删除数据库及其-wal/-shm文件：后端可能正持有WAL连接，删除文件会让后端继续写入已失效的文件。
+    其他连接的提交会改变data_version，后端的描述缓存随之重新加载。
+    """
+    if not os.path.exists(DESCRIPTIONS_DB):
+        return 0
+    conn = sqlite3.connect(DESCRIPTIONS_DB, timeout=DESCRIPTIONS_DB_TIMEOUT)
+    try:
+        with conn:
+            return conn.execute("DELETE FROM descriptions").rowcount
+    except sqlite3.OperationalError as e:
+        # 表尚未创建时视为没有描述
+        if 'no such table' in str(e):
+            return 0
+        raise
+    finally:
+        conn.close()
+
+
+class _Progress:
+    """
+    批量输出删除进度：消息先缓存，累计一定条数或超过时间间隔后一次性写出
+    """
+
+    def __init__(self, batch_size: int = 500, interval: float = 0.5):
+        self._batch_size = batch_size
+        self._interval = interval
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+
+    def note(self, message: str) -> None:
+        """记录一条进度消息，必要时写出缓存"""
+        self._buffer.append(message)
+        if (len(self._buffer) >= self._batch_size
+                or time.monotonic() - self._last_flush >= self._interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """写出所有缓存的进度消息"""
+        if self._buffer:
+            sys.stdout.write("\n".join(self._buffer) + "\n")
+            sys.stdout.flush()
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+
+# 删除过程中的进度输出（逐文件/逐目录消息批量写出）
+progress = _Progress()
+
+
+@dataclass
+class MediaScanResult:
+    """一次遍历得到的媒体文件统计"""
+    photo_count: int = 0
+    video_count: int = 0
+    thumbnail_count: int = 0
+    total_bytes: int = 0
+    descriptions_exist: bool = False
+
+
+def _iter_entries(
+    root: str,
+    extensions: frozenset,
+    visited_dirs: Optional[List[str]] = None,
+    foreign_suffixes: Optional[Set[str]] = None
+) -> Iterator[os.DirEntry]:
+    """
+    基于os.scandir遍历目录树，产出扩展名匹配的文件目录项（不跟随符号链接，不进入SKIP_DIRS中的目录）
+    目录项的stat结果会被缓存，调用方读取大小时无需额外的系统调用
+    
+    Args:
+        root: 根目录
+        extensions: 小写扩展名集合（含点）
+        visited_dirs: 可选，按遍历顺序记录访问过的目录（父目录总在子目录之前）
+        foreign_suffixes: 可选，收集不匹配的文件（含符号链接等）的小写扩展名，无扩展名记为''，跳过的目录记为'目录名/'
+    """
+    pending = deque([root])
+    while pending:
+        dir_path = pending.pop()
+        if visited_dirs is not None:
+            visited_dirs.append(dir_path)
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIRS:
+                            pending.append(entry.path)
+                        elif foreign_suffixes is not None:
+                            # 跳过的目录同样需要保留，记为"目录名/"
+                            foreign_suffixes.add(entry.name + '/')
+                        continue
+                    name = entry.name
+                    i = name.rfind('.')
+                    suffix = name[i:].lower() if i >= 0 else ''
+                    if suffix in extensions and entry.is_file(follow_symlinks=False):
+                        yield entry
+                    elif foreign_suffixes is not None:
+                        foreign_suffixes.add(suffix)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            # 无权限等原因无法读取的目录直接跳过，不中断整个遍历
+            print(f"⚠️ 无法读取目录 {dir_path}: {str(e)}")
 
 class DatabaseCleanupTool:
     """数据库清理工具"""
@@ -36,6 +212,8 @@ class DatabaseCleanupTool:
     def __init__(self):
         self.qdrant_manager = get_qdrant_manager()
         self.vector_service = get_vector_storage_service()
+        # (扫描时间, 扫描结果)，删除文件后清空
+        self._scan_cache: Optional[Tuple[float, MediaScanResult]] = None
     
     async def print_database_status(self):
         """打印数据库状态"""
@@ -43,96 +221,116 @@ class DatabaseCleanupTool:
         print("=" * 60)
         
         try:
-            # 获取集合信息 - 使用统一的方法
-            collection_info = await self.vector_service.get_storage_stats()
-            
-            print(f"🔍 Qdrant向量数据库:")
-            print(f"   集合名称: {collection_info.get('collection_name', 'N/A')}")
-            print(f"   总Embedding数: {collection_info.get('total_embeddings', 0)}")
-            print(f"   向量数量: {collection_info.get('vectors_count', 0)}")
-            print(f"   状态: {collection_info.get('status', 'N/A')}")
-            print(f"   向量维度: {collection_info.get('vector_dimension', 'N/A')}")
-            
-            model_info = collection_info.get('model_info', {})
-            print(f"   模型名称: {model_info.get('model_name', 'N/A')}")
-            print(f"   支持类型: {model_info.get('supported_types', 'N/A')}")
-            
-            # 获取媒体文件统计
-            media_stats = self.get_media_files_stats()
-            print(f"\n📁 媒体文件存储:")
-            print(f"   媒体根目录: {MEDIA_ROOT}")
-            print(f"   照片目录: {PHOTOS_DIR}")
-            print(f"   视频目录: {VIDEOS_DIR}")
-            print(f"   缩略图目录: {THUMBNAILS_ROOT}")
-            print(f"   媒体文件数量: {media_stats['media_count']}")
-            print(f"   缩略图数量: {media_stats['thumbnail_count']}")
-            print(f"   总存储大小: {media_stats['total_size_mb']:.2f} MB")
-            print(f"   描述文件: {'存在' if os.path.exists(DESCRIPTIONS_FILE) else '不存在'}")
-            
-            # 检查一致性
-            total_embeddings = collection_info.get('total_embeddings', 0)
-            media_count = media_stats['media_count']
-            
-            print(f"\n🔗 数据一致性:")
-            if total_embeddings == media_count:
-                print(f"   ✅ Embedding数据与媒体文件数量一致 ({total_embeddings})")
-            else:
-                print(f"   ⚠️ 数据不一致: Embedding{total_embeddings}个 vs 媒体文件{media_count}个")
-                if total_embeddings > 0 and media_count > 0:
-                    print(f"   💡 这可能表示有embedding但向量数据损坏或存储失败")
-                
+            self._render_status(*await self._collect_status())
         except Exception as e:
             print(f"❌ 获取数据库状态失败: {str(e)}")
     
-    def get_media_files_stats(self) -> Dict[str, Any]:
-        """获取媒体文件统计信息"""
-        stats = {
-            'media_count': 0,
-            'thumbnail_count': 0,
-            'total_size_mb': 0.0
-        }
+    async def _collect_status(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """获取集合信息（统一的方法）的同时在线程中统计媒体文件，返回(集合信息, 媒体文件统计)"""
+        return await asyncio.gather(
+            self.vector_service.get_storage_stats(),
+            asyncio.to_thread(self.get_media_files_stats)
+        )
+    
+    def _render_status(self, collection_info: Dict[str, Any], media_stats: Dict[str, Any]):
+        """打印数据库和媒体文件状态"""
+        self._print_collection_info(collection_info)
+        
+        print(f"\n📁 媒体文件存储:")
+        print(f"   媒体根目录: {MEDIA_ROOT}")
+        print(f"   照片目录: {PHOTOS_DIR}")
+        print(f"   视频目录: {VIDEOS_DIR}")
+        print(f"   缩略图目录: {THUMBNAILS_ROOT}")
+        print(f"   媒体文件数量: {media_stats['media_count']}")
+        print(f"   缩略图数量: {media_stats['thumbnail_count']}")
+        print(f"   总存储大小: {media_stats['total_size_mb']:.2f} MB")
+        print(f"   描述文件: {'存在' if media_stats['descriptions_exist'] else '不存在'}")
+        
+        # 检查一致性
+        total_embeddings = collection_info.get('total_embeddings', 0)
+        media_count = media_stats['media_count']
+        
+        print(f"\n🔗 数据一致性:")
+        if total_embeddings == media_count:
+            print(f"   ✅ Embedding数据与媒体文件数量一致 ({total_embeddings})")
+        else:
+            print(f"   ⚠️ 数据不一致: Embedding{total_embeddings}个 vs 媒体文件{media_count}个")
+            if total_embeddings > 0 and media_count > 0:
+                print(f"   💡 这可能表示有embedding但向量数据损坏或存储失败")
+    
+    async def print_db_only(self):
+        """只打印向量数据库状态（不遍历媒体文件）"""
+        print("📊 数据库状态检查")
+        print("=" * 60)
         
         try:
-            # 统计照片文件
-            if os.path.exists(PHOTOS_DIR):
-                for root, dirs, files in os.walk(PHOTOS_DIR):
-                    for file in files:
-                        if file.lower().endswith(('.jpg', '.jpeg', '.png', '.heic', '.webp', '.gif', '.bmp')):
-                            stats['media_count'] += 1
-                            file_path = os.path.join(root, file)
-                            if os.path.exists(file_path):
-                                stats['total_size_mb'] += os.path.getsize(file_path) / (1024 * 1024)
-            
-            # 统计视频文件
-            if os.path.exists(VIDEOS_DIR):
-                for root, dirs, files in os.walk(VIDEOS_DIR):
-                    for file in files:
-                        if file.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm')):
-                            stats['media_count'] += 1
-                            file_path = os.path.join(root, file)
-                            if os.path.exists(file_path):
-                                stats['total_size_mb'] += os.path.getsize(file_path) / (1024 * 1024)
-
-            # 统计缩略图
-            if os.path.exists(THUMBNAILS_ROOT):
-                for root, dirs, files in os.walk(THUMBNAILS_ROOT):
-                    for file in files:
-                        if file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                            stats['thumbnail_count'] += 1
-                            file_path = os.path.join(root, file)
-                            if os.path.exists(file_path):
-                                stats['total_size_mb'] += os.path.getsize(file_path) / (1024 * 1024)
-                                
+            self._print_collection_info(await self.vector_service.get_storage_stats())
+        except Exception as e:
+            print(f"❌ 获取数据库状态失败: {str(e)}")
+    
+    def _print_collection_info(self, collection_info: Dict[str, Any]):
+        """打印Qdrant集合信息"""
+        print(f"🔍 Qdrant向量数据库:")
+        print(f"   集合名称: {collection_info.get('collection_name', 'N/A')}")
+        print(f"   总Embedding数: {collection_info.get('total_embeddings', 0)}")
+        print(f"   向量数量: {collection_info.get('vectors_count', 0)}")
+        print(f"   状态: {collection_info.get('status', 'N/A')}")
+        print(f"   向量维度: {collection_info.get('vector_dimension', 'N/A')}")
+        
+        model_info = collection_info.get('model_info', {})
+        print(f"   模型名称: {model_info.get('model_name', 'N/A')}")
+        print(f"   支持类型: {model_info.get('supported_types', 'N/A')}")
+    
+    def _scan_all(self) -> MediaScanResult:
+        """
+        一次遍历照片、视频和缩略图目录得到全部统计（结果在SCAN_CACHE_TTL内复用）
+        只遍历这三个目录，不扫描媒体根目录下的Qdrant数据等其他内容
+        """
+        now = time.monotonic()
+        if self._scan_cache is not None and now - self._scan_cache[0] < SCAN_CACHE_TTL:
+            return self._scan_cache[1]
+        
+        result = MediaScanResult()
+        try:
+            # 三个目录树互不相关，并发遍历；总大小只统计媒体文件本身
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                photos = executor.submit(_scan_tree, PHOTOS_DIR, PHOTO_EXTENSIONS)
+                videos = executor.submit(_scan_tree, VIDEOS_DIR, VIDEO_EXTENSIONS)
+                thumbnails = executor.submit(_scan_tree, THUMBNAILS_ROOT, THUMBNAIL_EXTENSIONS)
+                result.photo_count, photo_bytes = photos.result()
+                result.video_count, video_bytes = videos.result()
+                result.thumbnail_count, thumbnail_bytes = thumbnails.result()
+            result.total_bytes = photo_bytes + video_bytes + thumbnail_bytes
+            result.descriptions_exist = (
+                any(os.path.lexists(f) for f in DESCRIPTIONS_JSON_FILES)
+                or _count_descriptions() > 0
+            )
         except Exception as e:
             print(f"⚠️ 统计媒体文件失败: {str(e)}")
         
-        return stats
+        self._scan_cache = (now, result)
+        return result
+    
+    def get_media_files_stats(self) -> Dict[str, Any]:
+        """获取媒体文件统计信息"""
+        result = self._scan_all()
+        return {
+            'media_count': result.photo_count + result.video_count,
+            'thumbnail_count': result.thumbnail_count,
+            'total_bytes': result.total_bytes,
+            'total_size_mb': result.total_bytes / (1024 * 1024),
+            'descriptions_exist': result.descriptions_exist
+        }
+    
+    async def _confirm(self, prompt: str) -> str:
+        """在线程中等待用户输入，等待期间事件循环中的其他任务照常运行"""
+        return await asyncio.to_thread(input, prompt)
     
     async def clear_vector_database(self, confirm: bool = False):
         """清空向量数据库"""
         if not confirm:
             print("⚠️ 此操作将删除所有向量数据，不可恢复！")
-            response = input("确认清空向量数据库？输入 'yes' 确认: ")
+            response = await self._confirm("确认清空向量数据库？输入 'yes' 确认: ")
             if response.lower() != 'yes':
                 print("❌ 操作已取消")
                 return False
@@ -156,72 +354,67 @@ class DatabaseCleanupTool:
             print(f"❌ 清空向量数据库异常: {str(e)}")
             return False
     
-    def delete_media_files(self, confirm: bool = False):
+    async def delete_media_files(self, confirm: bool = False):
         """删除所有媒体文件和缩略图"""
         if not confirm:
-            stats = self.get_media_files_stats()
+            scan = await asyncio.to_thread(self._scan_all)
             print("⚠️ 此操作将删除以下内容，不可恢复！")
-            print(f"   📷 照片文件: {self._count_files_in_dir(PHOTOS_DIR, ['.jpg', '.jpeg', '.png', '.heic', '.webp', '.gif', '.bmp'])}个")
-            print(f"   🎬 视频文件: {self._count_files_in_dir(VIDEOS_DIR, ['.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm'])}个")
-            print(f"   🖼️ 缩略图文件: {stats['thumbnail_count']}个")
-            print(f"   📝 描述文件: {'存在' if os.path.exists(DESCRIPTIONS_FILE) else '不存在'}")
-            print(f"   💾 总大小: {stats['total_size_mb']:.2f} MB")
+            print(f"   📷 照片文件: {scan.photo_count}个")
+            print(f"   🎬 视频文件: {scan.video_count}个")
+            print(f"   🖼️ 缩略图文件: {scan.thumbnail_count}个")
+            print(f"   📝 描述文件: {'存在' if scan.descriptions_exist else '不存在'}")
+            print(f"   💾 总大小: {scan.total_bytes / (1024 * 1024):.2f} MB")
             print(f"\n🔒 保留目录: qdrant数据库、lost+found")
-            response = input("确认删除所有媒体文件？输入 'DELETE' 确认: ")
+            response = await self._confirm("确认删除所有媒体文件？输入 'DELETE' 确认: ")
             if response != 'DELETE':
                 print("❌ 操作已取消")
                 return False
         
+        return await asyncio.to_thread(self._delete_all_media_files)
+    
+    def _delete_all_media_files(self) -> bool:
+        """删除照片、视频、缩略图和描述文件（阻塞操作，在线程中执行）"""
+        # 文件即将变化，之前的扫描结果作废
+        self._scan_cache = None
+        
         try:
             deleted_files = 0
-            deleted_size = 0.0
+            deleted_bytes = 0
             
             print("🗑️ 开始删除媒体文件...")
             
-            # 删除照片文件
-            if os.path.exists(PHOTOS_DIR):
-                deleted_count, deleted_mb = self._delete_media_files_in_dir(
-                    PHOTOS_DIR, 
-                    ['.jpg', '.jpeg', '.png', '.heic', '.webp', '.gif', '.bmp'],
-                    "照片"
-                )
-                deleted_files += deleted_count
-                deleted_size += deleted_mb
-            
-            # 删除视频文件
-            if os.path.exists(VIDEOS_DIR):
-                deleted_count, deleted_mb = self._delete_media_files_in_dir(
-                    VIDEOS_DIR,
-                    ['.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm'],
-                    "视频"
-                )
+            # 删除照片、视频和缩略图（目录不存在时直接返回0）
+            for directory, extensions, file_type in (
+                (PHOTOS_DIR, PHOTO_EXTENSIONS, "照片"),
+                (VIDEOS_DIR, VIDEO_EXTENSIONS, "视频"),
+                (THUMBNAILS_ROOT, THUMBNAIL_EXTENSIONS, "缩略图"),
+            ):
+                deleted_count, dir_bytes = self._delete_media_files_in_dir(directory, extensions, file_type)
                 deleted_files += deleted_count
-                deleted_size += deleted_mb
+                deleted_bytes += dir_bytes
             
-            # 删除缩略图
-            if os.path.exists(THUMBNAILS_ROOT):
-                deleted_count, deleted_mb = self._delete_media_files_in_dir(
-                    THUMBNAILS_ROOT,
-                    ['.jpg', '.jpeg', '.png', '.webp'],
-                    "缩略图"
-                )
-                deleted_files += deleted_count
-                deleted_size += deleted_mb
+            # 清空描述数据库（保留数据库文件，后端的连接继续有效）
+            try:
+                cleared = _clear_descriptions_db()
+                print(f"   ✅ 清空描述数据库: {cleared}条")
+            except Exception as e:
+                print(f"   ⚠️ 清空描述数据库失败: {str(e)}")
             
-            # 删除描述文件
-            if os.path.exists(DESCRIPTIONS_FILE):
+            # 删除旧版JSON描述文件
+            for descriptions_file in DESCRIPTIONS_JSON_FILES:
                 try:
-                    file_size = os.path.getsize(DESCRIPTIONS_FILE)
-                    os.remove(DESCRIPTIONS_FILE)
+                    file_size = _unlink_with_size(descriptions_file)
+                    if file_size is None:
+                        continue
                     deleted_files += 1
-                    deleted_size += file_size / (1024 * 1024)
-                    print(f"   ✅ 删除描述文件: {DESCRIPTIONS_FILE}")
+                    deleted_bytes += file_size
+                    print(f"   ✅ 删除描述文件: {descriptions_file}")
                 except Exception as e:
                     print(f"   ⚠️ 删除描述文件失败: {str(e)}")
             
             print(f"\n✅ 清理完成！")
             print(f"   📁 删除文件数: {deleted_files}")
-            print(f"   💾 释放空间: {deleted_size:.2f} MB")
+            print(f"   💾 释放空间: {deleted_bytes / (1024 * 1024):.2f} MB")
             print(f"   🔒 保留了Qdrant数据库和系统目录")
             return True
             
@@ -229,63 +422,76 @@ class DatabaseCleanupTool:
             print(f"❌ 删除媒体文件异常: {str(e)}")
             return False
     
-    def _count_files_in_dir(self, directory: str, extensions: List[str]) -> int:
-        """统计目录中指定扩展名的文件数量"""
-        count = 0
-        if os.path.exists(directory):
-            for root, dirs, files in os.walk(directory):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in extensions):
-                        count += 1
-        return count
-    
-    def _delete_media_files_in_dir(self, directory: str, extensions: List[str], file_type: str) -> Tuple[int, float]:
-        """删除指定目录中的媒体文件"""
-        deleted_count = 0
-        deleted_size_mb = 0.0
-        
+    def _delete_media_files_in_dir(self, directory: str, extensions: frozenset, file_type: str) -> Tuple[int, int]:
+        """删除指定目录中的媒体文件，返回(删除数量, 删除字节数)"""
         if not os.path.exists(directory):
-            return deleted_count, deleted_size_mb
+            return 0, 0
         
         print(f"   🗑️ 正在删除{file_type}...")
         
-        # 删除文件
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in extensions):
-                    file_path = os.path.join(root, file)
-                    try:
-                        if os.path.exists(file_path):
-                            file_size = os.path.getsize(file_path)
-                            os.remove(file_path)
-                            deleted_count += 1
-                            deleted_size_mb += file_size / (1024 * 1024)
-                    except Exception as e:
-                        print(f"     ⚠️ 删除文件失败 {file_path}: {str(e)}")
+        # 预扫描：统计待删除的文件，同时检查是否混有其他文件
+        foreign_suffixes: Set[str] = set()
+        deleted_count, deleted_bytes = _scan_tree(directory, extensions, foreign_suffixes)
         
-        # 删除空目录（从最深层开始）
-        for root, dirs, files in os.walk(directory, topdown=False):
-            for dir_name in dirs:
-                dir_path = os.path.join(root, dir_name)
-                try:
-                    if os.path.exists(dir_path) and not os.listdir(dir_path):
-                        os.rmdir(dir_path)
-                        print(f"     📁 删除空目录: {dir_path}")
-                except Exception as e:
-                    print(f"     ⚠️ 删除空目录失败 {dir_path}: {str(e)}")
-        
-        # 如果根目录为空，也删除它
-        try:
-            if os.path.exists(directory) and not os.listdir(directory):
-                os.rmdir(directory)
-                print(f"     📁 删除根目录: {directory}")
-        except Exception as e:
-            print(f"     ⚠️ 删除根目录失败 {directory}: {str(e)}")
+        if not foreign_suffixes:
+            # 目录树中只有媒体文件：整棵树一次删除后重建根目录，大小按预扫描结果统计
+            failures: List[str] = []
+            
+            def _on_rmtree_error(func, path, exc_info):
+                failures.append(path)
+                progress.note(f"     ⚠️ 删除失败 {path}: {str(exc_info[1])}")
+            
+            shutil.rmtree(directory, onerror=_on_rmtree_error)
+            os.makedirs(directory, exist_ok=True)
+            progress.note(f"     📁 删除目录树: {directory}")
+            if failures:
+                # 部分文件未能删除：扣除仍然存在的文件，统计结果与实际删除一致
+                remaining_count, remaining_bytes = _scan_tree(directory, extensions)
+                deleted_count -= remaining_count
+                deleted_bytes -= remaining_bytes
+                progress.note(f"     ⚠️ {len(failures)}项删除失败，剩余{file_type}: {remaining_count}个")
+        else:
+            progress.note(f"     ℹ️ 存在其他文件({', '.join(sorted(s or '无扩展名' for s in foreign_suffixes))})，逐个删除{file_type}")
+            deleted_count, deleted_bytes = self._unlink_media_files(directory, extensions)
+        progress.flush()
         
         if deleted_count > 0:
-            print(f"   ✅ 删除{file_type}: {deleted_count}个文件, {deleted_size_mb:.2f} MB")
+            print(f"   ✅ 删除{file_type}: {deleted_count}个文件, {deleted_bytes / (1024 * 1024):.2f} MB")
+        
+        return deleted_count, deleted_bytes
+    
+    def _unlink_media_files(self, directory: str, extensions: frozenset) -> Tuple[int, int]:
+        """逐个删除目录树中的媒体文件并移除空目录，保留其他文件，返回(删除数量, 删除字节数)"""
+        deleted_count = 0
+        deleted_bytes = 0
+        
+        # 删除文件（文件已不存在时直接跳过）
+        visited_dirs: List[str] = []
+        for entry in _iter_entries(directory, extensions, visited_dirs):
+            try:
+                file_size = _unlink_with_size(entry.path)
+                if file_size is None:
+                    continue
+                deleted_count += 1
+                deleted_bytes += file_size
+            except Exception as e:
+                progress.note(f"     ⚠️ 删除文件失败 {entry.path}: {str(e)}")
         
-        return deleted_count, deleted_size_mb
+        # 删除空目录：按遍历顺序逆序处理，子目录先于父目录，根目录最后（为空时也删除）
+        for dir_path in reversed(visited_dirs):
+            try:
+                os.rmdir(dir_path)
+            except OSError as e:
+                # 目录中还有其他文件，或已被删除
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                    progress.note(f"     ⚠️ 删除空目录失败 {dir_path}: {str(e)}")
+                continue
+            if dir_path == directory:
+                progress.note(f"     📁 删除根目录: {directory}")
+            else:
+                progress.note(f"     📁 删除空目录: {dir_path}")
+        
+        return deleted_count, deleted_bytes
     
     async def full_cleanup(self, confirm: bool = False):
         """完全清理：数据库+媒体文件"""
@@ -295,7 +501,7 @@ class DatabaseCleanupTool:
             print("   2. 删除所有媒体文件")
             print("   3. 删除所有缩略图")
             print("   ❗ 不可恢复！")
-            response = input("确认完全清理？输入 'FULL_CLEANUP' 确认: ")
+            response = await self._confirm("确认完全清理？输入 'FULL_CLEANUP' 确认: ")
             if response != 'FULL_CLEANUP':
                 print("❌ 操作已取消")
                 return False
@@ -306,7 +512,7 @@ class DatabaseCleanupTool:
         db_success = await self.clear_vector_database(confirm=True)
         
         # 2. 删除媒体文件
-        files_success = self.delete_media_files(confirm=True)
+        files_success = await self.delete_media_files(confirm=True)
         
         if db_success and files_success:
             print("✅ 完全清理成功！")
@@ -327,6 +533,8 @@ async def main():
         print("  clear-db        - 清空向量数据库")
         print("  delete-files    - 删除所有媒体文件")
         print("  full-cleanup    - 完全清理（数据库+文件）")
+        print("\n选项:")
+        print("  --no-post-status - 执行清理命令后不再打印状态（脚本调用时使用）")
         print("\n示例:")
         print("  python database_cleanup_tool.py status")
         print("  python database_cleanup_tool.py clear-db")
@@ -334,6 +542,7 @@ async def main():
         return
     
     command = sys.argv[1].lower()
+    post_status = "--no-post-status" not in sys.argv[2:]
     
     try:
         if command == "status":
@@ -341,18 +550,22 @@ async def main():
             
         elif command == "clear-db":
             await tool.clear_vector_database()
-            print("\n执行后状态:")
-            await tool.print_database_status()
+            if post_status:
+                # 媒体文件未变化，只查看数据库
+                print("\n执行后状态:")
+                await tool.print_db_only()
             
         elif command == "delete-files":
-            tool.delete_media_files()
-            print("\n执行后状态:")
-            await tool.print_database_status()
+            await tool.delete_media_files()
+            if post_status:
+                print("\n执行后状态:")
+                await tool.print_database_status()
             
         elif command == "full-cleanup":
             await tool.full_cleanup()
-            print("\n执行后状态:")
-            await tool.print_database_status()
+            if post_status:
+                print("\n执行后状态:")
+                await tool.print_database_status()
             
         else:
             print(f"❌ 未知命令: {command}")
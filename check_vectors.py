@@ -6,11 +6,87 @@
 import asyncio
 import sys
 import os
-import hashlib
+import re
+
+import httpx
+import numpy as np
+
+# 优先使用orjson解析Qdrant响应，不可用时回退到标准库
+try:
+    import orjson
+
+    def _json_loads(data: bytes):
+        return orjson.loads(data)
+except ImportError:
+    import json
+
+    def _json_loads(data: bytes):
+        return json.loads(data)
 
 # 添加后端路径
 sys.path.append('/home/lzw/app/family_media_app/backend')
 
+# 唯一文件名中的上传时间戳（name_YYYYmmddHHMMSS.ext）
+_TS_RE = re.compile(r'_(\d{14})\.')
+
+# 需要检查的照片扩展名（小写）
+_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.heic'})
+
+# 未配置QDRANT_URL时使用的Qdrant REST地址（与QdrantManager默认配置一致）
+DEFAULT_QDRANT_URL = "http://localhost:6333"
+
+
+def _qdrant_points_request(collection_name: str, path: str, body: dict):
+    """
+    直接调用Qdrant REST接口并返回原始字典结果，跳过客户端的Pydantic模型构建
+    地址和API密钥取自配置（QDRANT_URL、QDRANT_API_KEY），与后端连接同一个Qdrant服务
+    
+    Args:
+        collection_name: 集合名称
+        path: points下的子路径（''为按ID获取，'/scroll'为滚动查询）
+        body: 请求体
+    """
+    from app.core.config import settings
+    
+    base_url = (settings.QDRANT_URL or DEFAULT_QDRANT_URL).rstrip('/')
+    headers = {'api-key': settings.QDRANT_API_KEY} if settings.QDRANT_API_KEY else None
+    response = httpx.post(
+        f"{base_url}/collections/{collection_name}/points{path}",
+        json=body,
+        headers=headers,
+        timeout=30
+    )
+    response.raise_for_status()
+    return _json_loads(response.content)['result']
+
+def _vector_stats(vector) -> tuple:
+    """
+    返回向量的(维度, 非零值数量)，只转换一次数组
+    """
+    arr = np.asarray(vector, dtype=np.float32)
+    return arr.size, int(np.count_nonzero(arr))
+
+def _nonzero_counts(points: list, vector_name: str) -> dict:
+    """
+    一次统计多条记录中某个命名向量的维度和非零值数量（维度一致时合并为矩阵统一计算）
+    
+    Returns:
+        dict: {str(点ID): (维度, 非零值数量)}，没有该向量的记录不在结果中
+    """
+    ids, rows = [], []
+    for point in points:
+        vectors = point.get('vector')
+        if isinstance(vectors, dict) and vectors.get(vector_name):
+            ids.append(str(point['id']))
+            rows.append(vectors[vector_name])
+    if not rows:
+        return {}
+    
+    if len({len(row) for row in rows}) == 1:
+        mat = np.asarray(rows, dtype=np.float32)
+        return {pid: (mat.shape[1], int(count)) for pid, count in zip(ids, np.count_nonzero(mat, axis=1))}
+    return {pid: _vector_stats(row) for pid, row in zip(ids, rows)}
+
 async def check_vectors():
     """检查向量数据库记录"""
     print("=" * 60)
@@ -18,11 +94,9 @@ async def check_vectors():
     print("=" * 60)
     
     try:
-        from app.database.qdrant_manager import get_qdrant_manager
+        from app.database.qdrant_manager import get_qdrant_manager, media_id_to_point_id
         from app.utils.file_handler import generate_global_media_id
         from app.core.config import PHOTOS_DIR
-        from datetime import datetime
-        import re
         
         # 获取向量数据库管理器
         qdrant_manager = get_qdrant_manager()
@@ -31,44 +105,55 @@ async def check_vectors():
         print("1. 获取所有向量记录...")
         
         try:
-            scroll_result = qdrant_manager.client.scroll(
-                collection_name=qdrant_manager.collection_name,
-                limit=10,
-                with_payload=True,
-                with_vectors=True
+            scroll_result = _qdrant_points_request(
+                qdrant_manager.collection_name,
+                '/scroll',
+                {'limit': 10, 'with_payload': True, 'with_vector': False}
             )
             
-            records = scroll_result[0]
+            records = scroll_result['points']
             print(f"   找到 {len(records)} 条记录")
             
+            # 概览只取payload，向量结构只需检查一条样本记录
+            if records:
+                sample = _qdrant_points_request(
+                    qdrant_manager.collection_name,
+                    '',
+                    {'ids': [records[0]['id']], 'with_payload': True, 'with_vector': True}
+                )
+                if sample:
+                    records[0] = sample[0]
+            
             for i, record in enumerate(records):
                 print(f"\n记录 {i+1}:")
-                print(f"   ID: {record.id}")
+                print(f"   ID: {record['id']}")
                 
                 # 检查payload
-                payload = record.payload
+                payload = record.get('payload') or {}
                 print(f"   全局媒体ID: {payload.get('global_media_id', '无')}")
                 print(f"   文件名: {payload.get('file_name', '无')}")
                 print(f"   描述: '{payload.get('description', '无')}'")
                 print(f"   Embedding状态: {payload.get('embedding_status', '无')}")
                 
-                # 检查向量结构
-                vectors = record.vector
+                # 检查向量结构（仅样本记录带有向量）
+                if 'vector' not in record:
+                    continue
+                vectors = record['vector']
                 print(f"   向量类型: {type(vectors)}")
                 
                 if isinstance(vectors, dict):
                     print(f"   向量结构: 命名向量 (dict)")
                     for vector_name, vector_data in vectors.items():
                         if isinstance(vector_data, list):
-                            non_zero_count = sum(1 for v in vector_data if v != 0.0)
-                            print(f"     - {vector_name}: {len(vector_data)}维, {non_zero_count}个非零值")
+                            dim, non_zero = _vector_stats(vector_data)
+                            print(f"     - {vector_name}: {dim}维, {non_zero}个非零值")
                         else:
                             print(f"     - {vector_name}: {type(vector_data)}")
                 else:
                     print(f"   向量结构: 密集向量 (list)")
                     if isinstance(vectors, list):
-                        non_zero_count = sum(1 for v in vectors if v != 0.0)
-                        print(f"     总维度: {len(vectors)}, 非零值: {non_zero_count}")
+                        dim, non_zero = _vector_stats(vectors)
+                        print(f"     总维度: {dim}, 非零值: {non_zero}")
                 
         except Exception as e:
             print(f"   ❌ 获取记录失败: {e}")
@@ -76,77 +161,98 @@ async def check_vectors():
         # 2. 检查本地文件并尝试查找
         print(f"\n2. 检查本地文件并验证ID匹配...")
         
+        # 基于os.scandir逐层遍历，目录项自带文件类型，无需额外stat
         local_files = []
-        if os.path.exists(PHOTOS_DIR):
-            for root, dirs, files in os.walk(PHOTOS_DIR):
-                for file in files:
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png', '.heic')):
-                        local_files.append(file)
+        pending_dirs = [PHOTOS_DIR]
+        while pending_dirs:
+            try:
+                with os.scandir(pending_dirs.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in _EXTS and entry.is_file():
+                            local_files.append(entry.name)
+            except FileNotFoundError:
+                continue
         
         print(f"   本地文件数: {len(local_files)}")
         
+        # 先为所有文件计算数字ID，再一次批量查询数据库
+        file_infos = []
         for file in local_files:
+            # 从文件名提取信息
+            match = _TS_RE.search(file)
+            
+            if not match:
+                file_infos.append((file, None))
+                continue
+            
+            timestamp_str = match.group(1)
+            # 直接切片拼出ISO时间（与datetime.isoformat()格式一致）
+            ts = timestamp_str
+            upload_time_iso = f"{ts[0:4]}-{ts[4:6]}-{ts[6:8]}T{ts[8:10]}:{ts[10:12]}:{ts[12:14]}"
+            
+            # 提取原始文件名
+            original_name = file.split('_' + timestamp_str)[0] + '.' + file.split('.')[-1]
+            
+            # 生成全局媒体ID
+            global_media_id = generate_global_media_id(original_name, upload_time_iso)
+            
+            # 转换为数字ID查找（与存储时使用同一转换，结果带缓存）
+            point_id = media_id_to_point_id(global_media_id)
+            
+            file_infos.append((file, (original_name, upload_time_iso, global_media_id, point_id)))
+        
+        # 一次retrieve取回全部记录，按ID建立索引
+        point_ids = list({info[3]: None for _, info in file_infos if info})
+        found_points = {}
+        text_counts, image_counts = {}, {}
+        lookup_error = None
+        if point_ids:
+            try:
+                points = _qdrant_points_request(
+                    qdrant_manager.collection_name,
+                    '',
+                    {'ids': point_ids, 'with_payload': True, 'with_vector': True}
+                )
+                found_points = {str(point['id']): point for point in points}
+                text_counts = _nonzero_counts(points, 'text_embedding')
+                image_counts = _nonzero_counts(points, 'image_embedding')
+            except Exception as e:
+                lookup_error = e
+        
+        for file, info in file_infos:
             print(f"\n   检查文件: {file}")
+            if not info:
+                continue
             
-            # 从文件名提取信息
-            timestamp_pattern = r'_(\d{14})\.'
-            match = re.search(timestamp_pattern, file)
+            original_name, upload_time_iso, global_media_id, point_id = info
+            print(f"     原始名: {original_name}")
+            print(f"     时间: {upload_time_iso}")
+            print(f"     全局ID: {global_media_id}")
+            print(f"     数字ID: {point_id}")
             
-            if match:
-                timestamp_str = match.group(1)
-                timestamp = datetime.strptime(timestamp_str, '%Y%m%d%H%M%S')
-                upload_time_iso = timestamp.isoformat()
-                
-                # 提取原始文件名
-                original_name = file.split('_' + timestamp_str)[0] + '.' + file.split('.')[-1]
-                
-                # 生成全局媒体ID
-                global_media_id = generate_global_media_id(original_name, upload_time_iso)
-                
-                print(f"     原始名: {original_name}")
-                print(f"     时间: {upload_time_iso}")
-                print(f"     全局ID: {global_media_id}")
-                
-                # 转换为数字ID查找
-                point_id = global_media_id
-                if isinstance(global_media_id, str) and not global_media_id.isdigit():
-                    point_id = int(hashlib.md5(global_media_id.encode()).hexdigest()[:15], 16)
-                
-                print(f"     数字ID: {point_id}")
+            if lookup_error is not None:
+                print(f"     ❌ 查找失败: {lookup_error}")
+                continue
+            
+            point = found_points.get(str(point_id))
+            if point is not None:
+                print(f"     ✅ 在数据库中找到记录")
+                print(f"     - 记录描述: '{(point.get('payload') or {}).get('description', '无')}'")
                 
-                # 尝试在数据库中查找
-                try:
-                    existing_points = qdrant_manager.client.retrieve(
-                        collection_name=qdrant_manager.collection_name,
-                        ids=[point_id],
-                        with_payload=True,
-                        with_vectors=True
-                    )
+                # 检查向量
+                vectors = point.get('vector')
+                if isinstance(vectors, dict):
+                    text_dim, text_non_zero = text_counts.get(str(point_id), (0, 0))
+                    image_dim, image_non_zero = image_counts.get(str(point_id), (0, 0))
                     
-                    if existing_points:
-                        point = existing_points[0]
-                        print(f"     ✅ 在数据库中找到记录")
-                        print(f"     - 记录描述: '{point.payload.get('description', '无')}'")
-                        
-                        # 检查向量
-                        vectors = point.vector
-                        if isinstance(vectors, dict):
-                            text_vector = vectors.get('text_embedding', [])
-                            image_vector = vectors.get('image_embedding', [])
-                            
-                            text_non_zero = sum(1 for v in text_vector if v != 0.0) if text_vector else 0
-                            image_non_zero = sum(1 for v in image_vector if v != 0.0) if image_vector else 0
-                            
-                            print(f"     - 文本向量: {len(text_vector) if text_vector else 0}维, {text_non_zero}个非零值")
-                            print(f"     - 图像向量: {len(image_vector) if image_vector else 0}维, {image_non_zero}个非零值")
-                        else:
-                            print(f"     - 向量格式: 非命名向量")
-                            
-                    else:
-                        print(f"     ❌ 在数据库中未找到记录")
-                        
-                except Exception as e:
-                    print(f"     ❌ 查找失败: {e}")
+                    print(f"     - 文本向量: {text_dim}维, {text_non_zero}个非零值")
+                    print(f"     - 图像向量: {image_dim}维, {image_non_zero}个非零值")
+                else:
+                    print(f"     - 向量格式: 非命名向量")
+            else:
+                print(f"     ❌ 在数据库中未找到记录")
         
         print(f"\n" + "=" * 60)
         print("检查结论:")
@@ -155,7 +261,7 @@ async def check_vectors():
         if len(records) > 0:
             # 检查向量格式是否正确
             sample_record = records[0]
-            vectors = sample_record.vector
+            vectors = sample_record.get('vector')
             
             if isinstance(vectors, dict):
                 has_text = 'text_embedding' in vectors
@@ -104,6 +104,7 @@ deploy_qdrant_standalone() {
         --name qdrant-standalone \
         --restart unless-stopped \
         -p 6333:6333 \
+        -p 6334:6334 \
         -v /media/qdrant:/qdrant/storage \
         qdrant/qdrant:latest
     
@@ -2,17 +2,78 @@
 """
 增强版HTTP服务器，支持CORS和API代理转发，用于前后端分离开发
 """
+import http.client
 import http.server
-import socketserver
+import io
 import os
-import urllib.request
-import urllib.error
+import shutil
+import queue
+import signal
 from http import HTTPStatus
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 
 PORT = 3000
 DIRECTORY = "dist"
 BACKEND_URL = "http://localhost:5000"  # 后端API地址
+BACKEND_HOST = urlparse(BACKEND_URL).netloc
+PROXY_CHUNK_SIZE = 64 * 1024  # 转发请求体/响应体的分块大小
+PROXY_TIMEOUT = 300  # 后端连接超时（秒），大文件上传需要较长时间
+PROXY_POOL_SIZE = 32  # 连接池中最多保留的空闲后端连接数
+
+# 不转发的逐跳请求/响应头（RFC 7230），Host由代理重新设置
+HOP_BY_HOP_HEADERS = frozenset({
+    'host', 'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'proxy-connection', 'te', 'trailers', 'transfer-encoding', 'upgrade',
+})
+
+# 构建产物中的文件相对路径（启动时扫描一次，构建后不会变化，收到SIGHUP时重新扫描）
+_STATIC_FILES: frozenset = frozenset()
+
+# 所有处理线程共享的后端长连接池（LifoQueue自带锁，优先复用最近归还的连接）
+# ThreadingHTTPServer每个客户端连接一个线程，线程局部连接无法跨请求复用
+_backend_pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=PROXY_POOL_SIZE)
+
+
+def _load_static_files(*_):
+    """扫描静态文件目录，记录所有文件的相对路径"""
+    global _STATIC_FILES
+    files = set()
+    pending = [DIRECTORY]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                else:
+                    files.add(os.path.relpath(entry.path, DIRECTORY).replace(os.sep, '/'))
+    _STATIC_FILES = frozenset(files)
+
+
+def _acquire_connection(fresh: bool = False) -> http.client.HTTPConnection:
+    """
+    从连接池取出一条到后端的连接，池为空时新建
+
+    Args:
+        fresh: 是否跳过连接池直接新建
+    """
+    if not fresh:
+        try:
+            return _backend_pool.get_nowait()
+        except queue.Empty:
+            pass
+    return http.client.HTTPConnection(BACKEND_HOST, timeout=PROXY_TIMEOUT)
+
+
+def _release_connection(conn: http.client.HTTPConnection, response: http.client.HTTPResponse):
+    """响应体读取完毕后归还连接；后端要求关闭或连接池已满时直接关闭"""
+    if response.will_close:
+        conn.close()
+        return
+    try:
+        _backend_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
 
 class ProxyCORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     """支持CORS和API代理的HTTP请求处理器"""
@@ -21,6 +82,26 @@ class ProxyCORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         # 设置目录
         super().__init__(*args, directory=DIRECTORY, **kwargs)
     
+    def copyfile(self, source, outputfile):
+        """静态文件优先用os.sendfile在内核中直接发送，不支持时回退到逐块复制"""
+        if hasattr(os, 'sendfile') and isinstance(source, io.BufferedReader):
+            try:
+                out_fd = outputfile.fileno()
+                in_fd = source.fileno()
+                offset = source.tell()
+                remaining = os.fstat(in_fd).st_size - offset
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                pass
+            else:
+                while remaining > 0:
+                    sent = os.sendfile(out_fd, in_fd, offset, remaining)
+                    if sent == 0:
+                        break
+                    offset += sent
+                    remaining -= sent
+                return
+        super().copyfile(source, outputfile)
+    
     def end_headers(self):
         # 添加CORS头
         self.send_header("Access-Control-Allow-Origin", "*")
@@ -33,65 +114,77 @@ class ProxyCORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_response(HTTPStatus.NO_CONTENT)
         self.end_headers()
     
-    def proxy_request(self):
-        """代理请求到后端服务"""
-        target_url = f"{BACKEND_URL}{self.path}"
-        print(f"代理请求: {self.path} -> {target_url}")
-        
-        # 创建请求
-        req = urllib.request.Request(target_url, method=self.command)
+    def _send_to_backend(self, conn: http.client.HTTPConnection, content_length: int):
+        """发送请求头，并将请求体分块转发到后端（不整体读入内存）"""
+        conn.putrequest(self.command, self.path, skip_host=True, skip_accept_encoding=True)
         
         # 复制请求头
-        for header in self.headers:
-            if header.lower() not in ('host', 'connection'):
-                req.add_header(header, self.headers[header])
+        for header, value in self.headers.items():
+            if header.lower() not in HOP_BY_HOP_HEADERS:
+                conn.putheader(header, value)
         
         # 添加代理相关头信息
-        req.add_header('Host', urlparse(BACKEND_URL).netloc)
-        req.add_header('X-Forwarded-For', self.client_address[0])
+        conn.putheader('Host', BACKEND_HOST)
+        conn.putheader('X-Forwarded-For', self.client_address[0])
+        conn.endheaders()
         
-        # 处理请求体数据
+        remaining = content_length
+        while remaining > 0:
+            chunk = self.rfile.read(min(PROXY_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            conn.send(chunk)
+            remaining -= len(chunk)
+    
+    def proxy_request(self):
+        """代理请求到后端服务"""
+        print(f"代理请求: {self.path} -> {BACKEND_URL}{self.path}")
         content_length = int(self.headers.get('Content-Length', 0))
-        request_body = self.rfile.read(content_length) if content_length > 0 else None
         
+        conn = _acquire_connection()
         try:
-            # 发送请求到后端
-            response = urllib.request.urlopen(req, data=request_body)
-            
-            # 返回响应给客户端
+            try:
+                self._send_to_backend(conn, content_length)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                # 复用的长连接可能已被后端关闭；没有请求体时可以安全地重连重试一次
+                if content_length > 0:
+                    raise
+                conn.close()
+                conn = _acquire_connection(fresh=True)
+                self._send_to_backend(conn, content_length)
+                response = conn.getresponse()
+        except Exception as e:
+            # 处理其他错误
+            conn.close()
+            self.send_error(
+                HTTPStatus.BAD_GATEWAY,
+                f"代理请求错误: {str(e)}"
+            )
+            return
+        
+        try:
+            # 返回响应给客户端（包括后端返回的错误状态）
             self.send_response(response.status)
             
             # 复制响应头
-            for header in response.headers:
-                if header.lower() not in ('transfer-encoding', 'connection'):
-                    self.send_header(header, response.headers[header])
-            
-            self.end_headers()
-            
-            # 返回响应体
-            self.wfile.write(response.read())
-            
-        except urllib.error.HTTPError as e:
-            # 处理HTTP错误
-            self.send_response(e.code)
-            
-            # 复制错误响应头
-            for header in e.headers:
-                if header.lower() not in ('transfer-encoding', 'connection'):
-                    self.send_header(header, e.headers[header])
+            for header, value in response.getheaders():
+                if header.lower() not in HOP_BY_HOP_HEADERS:
+                    self.send_header(header, value)
             
             self.end_headers()
             
-            # 返回错误响应体
-            if e.fp:
-                self.wfile.write(e.fp.read())
+            # 分块返回响应体
+            if self.command != 'HEAD':
+                shutil.copyfileobj(response, self.wfile, PROXY_CHUNK_SIZE)
+            response.close()
+        except Exception:
+            # 客户端中途断开时丢弃后端连接，避免残留的响应数据影响下一个请求
+            conn.close()
+            raise
         
-        except Exception as e:
-            # 处理其他错误
-            self.send_error(
-                HTTPStatus.BAD_GATEWAY,
-                f"代理请求错误: {str(e)}"
-            )
+        # 响应已完整读取，连接可供其他请求复用
+        _release_connection(conn, response)
     
     def is_api_request(self):
         """判断是否为API请求或媒体文件请求"""
@@ -105,8 +198,9 @@ class ProxyCORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.proxy_request()
         else:
             # 处理SPA应用的路由，任何非文件的路径都返回index.html
-            if not os.path.exists(os.path.join(DIRECTORY, self.path.strip("/"))):
-                if "." not in self.path:  # 没有扩展名，可能是前端路由
+            path = unquote(self.path.split('?', 1)[0].split('#', 1)[0])
+            if path.strip("/") not in _STATIC_FILES:
+                if "." not in path:  # 没有扩展名，可能是前端路由
                     self.path = "/index.html"
             super().do_GET()
     
@@ -146,10 +240,16 @@ def main():
         print("运行: npm run build")
         return
     
+    _load_static_files()
+    if hasattr(signal, 'SIGHUP'):
+        # 重新构建前端后发送SIGHUP即可刷新静态文件列表
+        signal.signal(signal.SIGHUP, _load_static_files)
+    
     # 设置处理器和服务器
     handler = ProxyCORSHTTPRequestHandler
     
-    with socketserver.TCPServer(("", PORT), handler) as httpd:
+    # 每个请求在独立线程中处理，慢速的代理请求不会阻塞其他请求
+    with http.server.ThreadingHTTPServer(("", PORT), handler) as httpd:
         print(f"===========================================")
         print(f"  前后端分离开发服务器 (带API代理功能)")
         print(f"===========================================")
@@ -10,32 +10,36 @@ async def test_search():
     
     try:
         vector_service = get_vector_storage_service()
+        search_by_text = vector_service.search_by_text
         
         # 测试几个搜索词
         test_queries = ["女孩", "人物", "照片", "图片", "风景"]
         
-        for query in test_queries:
+        # 所有查询并发执行，再按顺序输出结果
+        search_results = await asyncio.gather(
+            *(search_by_text(query=query, limit=5) for query in test_queries)
+        )
+        
+        for query, search_result in zip(test_queries, search_results):
             print(f"\n🔍 搜索: '{query}'")
             
-            # 执行搜索
-            search_result = await vector_service.search_by_text(
-                query=query,
-                limit=5
-            )
-            
             if search_result.get('success'):
                 results = search_result.get('results', [])
                 print(f"  ✅ 找到 {len(results)} 个结果")
                 
+                # 每个查询的结果详情拼接后一次写出
+                buf = []
                 for i, result in enumerate(results):
                     metadata = result.get('metadata', {})
-                    print(f"    📁 结果 {i+1}:")
-                    print(f"      🆔 media_id: {result.get('media_id')}")
-                    print(f"      📊 score: {result.get('score', 0):.3f}")
-                    print(f"      📝 file_name: {metadata.get('file_name', 'N/A')}")
-                    print(f"      🔗 original_url: {metadata.get('original_url', 'N/A')}")
-                    print(f"      🖼️ thumbnail_url: {metadata.get('thumbnail_url', 'N/A')}")
-                    print(f"      📄 file_id: {metadata.get('file_id', 'N/A')}")
+                    buf.append(f"    📁 结果 {i+1}:\n")
+                    buf.append(f"      🆔 media_id: {result.get('media_id')}\n")
+                    buf.append(f"      📊 score: {result.get('score', 0):.3f}\n")
+                    buf.append(f"      📝 file_name: {metadata.get('file_name', 'N/A')}\n")
+                    buf.append(f"      🔗 original_url: {metadata.get('original_url', 'N/A')}\n")
+                    buf.append(f"      🖼️ thumbnail_url: {metadata.get('thumbnail_url', 'N/A')}\n")
+                    buf.append(f"      📄 file_id: {metadata.get('file_id', 'N/A')}\n")
+                sys.stdout.write("".join(buf))
+                sys.stdout.flush()
                     
             else:
                 error = search_result.get('error', '未知错误')
@@ -6,6 +6,8 @@ import asyncio
 import sys
 import os
 
+import numpy as np
+
 # 添加后端路径到Python路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 
@@ -20,6 +22,8 @@ async def test_search_debug():
     # 获取服务实例
     embedding_service = get_embedding_service()
     vector_storage = get_vector_storage_service()
+    embed_query_text = embedding_service.embed_query_text
+    search_by_text = vector_storage.search_by_text
     
     # 测试不同的查询词
     test_queries = [
@@ -28,32 +32,34 @@ async def test_search_debug():
         "千岛湖"
     ]
     
-    for query in test_queries:
+    # 所有查询的embedding生成和完整搜索并发执行，再逐个输出
+    query_results, search_results = await asyncio.gather(
+        asyncio.gather(*(embed_query_text(query) for query in test_queries)),
+        asyncio.gather(*(search_by_text(query=query, limit=5) for query in test_queries))
+    )
+    
+    for query, query_result, search_result in zip(test_queries, query_results, search_results):
         print(f"\n--- 测试查询: '{query}' ---")
         
         # 1. 测试embedding生成
         print("1. 生成查询embedding...")
-        query_result = await embedding_service.embed_query_text(query)
         
         if not query_result.get('success'):
             print(f"❌ Embedding生成失败: {query_result.get('error')}")
             continue
             
-        print(f"✅ Embedding生成成功: {len(query_result['embedding'])}维")
+        embedding = np.asarray(query_result['embedding'], dtype=np.float32)
+        print(f"✅ Embedding生成成功: {embedding.size}维")
         # 显示前5个向量值
-        embedding_preview = query_result['embedding'][:5]
+        embedding_preview = embedding[:5].tolist()
         print(f"   向量预览: {embedding_preview}")
         
         # 检查是否为零向量
-        is_zero = all(x == 0.0 for x in query_result['embedding'])
+        is_zero = not embedding.any()
         print(f"   是否为零向量: {is_zero}")
         
         # 2. 测试完整搜索流程
         print("2. 执行完整搜索...")
-        search_result = await vector_storage.search_by_text(
-            query=query,
-            limit=5
-        )
         
         if not search_result.get('success'):
             print(f"❌ 搜索失败: {search_result.get('error')}")
@@ -65,7 +71,8 @@ async def test_search_debug():
         print(f"   文本模态结果: {search_result.get('text_modal_count', 0)}")
         print(f"   图像模态结果: {search_result.get('image_modal_count', 0)}")
         
-        # 显示结果详情
+        # 显示结果详情（拼接后一次写出）
+        buf = []
         for i, result in enumerate(results[:3]):  # 只显示前3个
             metadata = result.get('metadata', {})
             file_name = metadata.get('file_name', 'unknown')
@@ -73,8 +80,10 @@ async def test_search_debug():
             score = result.get('final_score', result.get('score', 0))
             source = result.get('search_source', 'unknown')
             
-            print(f"   结果 {i+1}: {file_name} (分数: {score:.3f}, 来源: {source})")
-            print(f"            描述: {description[:50]}...")
+            buf.append(f"   结果 {i+1}: {file_name} (分数: {score:.3f}, 来源: {source})\n")
+            buf.append(f"            描述: {description[:50]}...\n")
+        sys.stdout.write("".join(buf))
+        sys.stdout.flush()
 
 if __name__ == "__main__":
     asyncio.run(test_search_debug()) 
\ No newline at end of file